@@ -0,0 +1,50 @@
+#    PyOS, an "operating system" running on Python.
+#    Copyright (C) 2025 Muser
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# conftest.py - Lets pytest collect os/test_pyos.py from the repository root.
+#   python3 -m pytest        (from the repository root or from os/)
+# os/ holds PyOS itself, whose __init__.py is a script rather than a package: imported
+# as the package 'os', it would replace the standard library module. So os/ is
+# collected as a plain directory, and its test files are loaded by path, the way
+# test_pyos.py itself loads __init__.py, client.py and benchmark.py.
+import sys
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+pyos_dir = Path(__file__).resolve().parent / "os"
+
+class ScriptTestModule(pytest.Module):
+    """
+    A test file in os/, imported by path under its own name.
+    """
+    def _getobj(self):
+        spec = importlib.util.spec_from_file_location(self.path.stem, self.path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[spec.name] = module
+        spec.loader.exec_module(module)
+        return module
+
+def pytest_collect_directory(path, parent):
+    if path == pyos_dir:
+        return pytest.Dir.from_parent(parent, path=path)
+    return None
+
+def pytest_pycollect_makemodule(module_path, parent):
+    if module_path.parent == pyos_dir:
+        return ScriptTestModule.from_parent(parent, path=module_path)
+    return None
@@ -17,22 +17,89 @@
 import sys, shlex
 from pathlib import Path
 import os
-import getpass
-import socket
+import codecs
 import re # NEW: Import the regex module for variable expansion
 import importlib # NEW: Import importlib for dynamic package loading
-import subprocess # NEW: Import subprocess for launching GUI apps
+import importlib.util
+import json
+import itertools
+import collections
+import queue
+import fnmatch
+import glob
+import shutil
+import errno
+import time
+import threading
+import contextlib
+import contextvars
+import concurrent.futures
+import math
+import bisect
+import heapq
+import functools
+import operator
+import io
+import mmap
+import struct
 
-# --- Check and import passlib ---
-try:
-    from passlib.hash import sha512_crypt
-except ImportError:
+# --- Deferred imports ---
+# Modules only some commands need are imported the first time they are used, so they
+# don't slow down startup for sessions that never log in, install packages or
+# profile anything. 'python3 __init__.py --startup-profile' shows what startup costs.
+_lazy_modules = [] # Every LazyModule, for --startup-profile
+
+class LazyModule:
+    """
+    Stands in for a module until one of its attributes is used, then imports it.
+    With attribute, stands in for module.attribute instead (e.g. a class).
+    """
+    def __init__(self, module_name, attribute=None):
+        self._module_name = module_name
+        self._attribute = attribute
+        self._target = None
+        _lazy_modules.append(self)
+
+    def load(self):
+        if self._target is None:
+            target = importlib.import_module(self._module_name)
+            if self._attribute is not None:
+                target = getattr(target, self._attribute)
+            self._target = target
+        return self._target
+
+    def is_loaded(self):
+        return self._target is not None
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
+
+getpass = LazyModule("getpass")
+socket = LazyModule("socket")
+sqlite3 = LazyModule("sqlite3")
+asyncio = LazyModule("asyncio")
+multiprocessing = LazyModule("multiprocessing")
+subprocess = LazyModule("subprocess") # For launching GUI apps
+cProfile = LazyModule("cProfile")
+pstats = LazyModule("pstats")
+zipfile = LazyModule("zipfile") # Archive mounts
+tarfile = LazyModule("tarfile")
+gzip = LazyModule("gzip")
+lzma = LazyModule("lzma")
+bz2 = LazyModule("bz2")
+zlib = LazyModule("zlib") # Search index postings
+resource = LazyModule("resource") # Sandbox limits (Unix only)
+signal = LazyModule("signal")
+
+# --- Check for passlib (imported on the first login) ---
+if importlib.util.find_spec("passlib") is None:
     print("Error: The 'passlib' Python library is not installed.", file=sys.stderr)
     print("Please install it using pip:", file=sys.stderr)
     print("  pip install passlib", file=sys.stderr)
     print("If you are on Ubuntu/Debian, you might also try:", file=sys.stderr)
     print("  sudo apt install python3-passlib", file=sys.stderr)
     sys.exit(1)
+sha512_crypt = LazyModule("passlib.hash", "sha512_crypt")
 # --- End passlib check ---
 
 # Add the _packages directory to sys.path so gum and other packages can be imported
@@ -53,33 +120,274 @@ def checkforpackagemanager():
         print("E: package manager 'gum' not found. Ensure it's built correctly in _packages/gum.", file=sys.stderr)
         return 1 # Failure
 
-# Import gum after sys.path is updated and checkforpackagemanager is defined
-import gum 
+# gum (and the requests library it uses) is imported by the first 'gum' command
+gum = LazyModule("gum")
 # --- End Package Manager Check and Import ---
 
 # --- Global dictionary to store dynamically loaded package commands ---
+# This is the single dispatch table of the shell: builtins are registered here too
+# (see register_builtin_command), so resolving a command is one dictionary lookup.
 _package_commands = {} # Maps command_name -> function_to_handle_command
 
+class ShellCommand:
+    """
+    A command handler with argument-count metadata.
+    Calling it checks the number of arguments and prints the usage line on a mismatch,
+    so handlers only ever see argument lists they can deal with.
+    A command can also have a stream function, stream(args, stdin) -> iterable of lines,
+    used when it is part of a pipeline (see run_pipeline). stdin is an iterator over the
+    previous stage's lines, or None when there is no previous stage. A command with
+    only a stream function prints its lines when run on its own.
+    cpu_bound commands run in their own process when started as background jobs.
+    """
+    __slots__ = ("name", "handler", "min_args", "max_args", "usage", "builtin", "stream", "cpu_bound")
+
+    def __init__(self, name, handler, min_args=0, max_args=None, usage=None, builtin=False, stream=None, cpu_bound=False):
+        self.name = name
+        self.handler = handler
+        self.min_args = min_args
+        self.max_args = max_args # None means no upper limit
+        self.usage = usage or f"Usage: {name}"
+        self.builtin = builtin
+        self.stream = stream
+        self.cpu_bound = cpu_bound # Background jobs of this command run in a separate process
+
+    def check_args(self, args):
+        if len(args) < self.min_args or (self.max_args is not None and len(args) > self.max_args):
+            print(self.usage)
+            return False
+        return True
+
+    def __call__(self, args):
+        if not self.check_args(args):
+            return
+        if self.handler is None:
+            write_lines(self.stream(args, None), sys.stdout)
+            return
+        return self.handler(args)
+
+    def open_stream(self, args, stdin):
+        """
+        Returns an iterator over the lines this command outputs in a pipeline.
+        """
+        if not self.check_args(args):
+            return iter(())
+        return iter(self.stream(args, stdin))
+
 # --- Function to register package commands ---
-def register_package_command(command_name, handler_func):
+def register_package_command(command_name, handler_func, min_args=None, max_args=None, usage=None, stream=None, cpu_bound=False):
     """
     Registers a command from an installed package.
     command_name: The string command (e.g., "calc").
-    handler_func: The Python function that handles this command.
+    handler_func: The Python function that handles this command, or the name of an
+                  already registered command to make command_name an alias of it
+                  (e.g., register("ls", "lc")).
+    min_args, max_args, usage: Optional argument-count checking, see ShellCommand.
+    stream: Optional function stream(args, stdin) -> iterable of lines, which lets the
+            command consume and produce streams in pipelines (see ShellCommand).
+            handler_func may then be None; the stream's lines are printed instead.
+    cpu_bound: Run background jobs ('cmd &') of this command in a separate process
+               instead of a thread, so they don't compete with the shell for the GIL.
+    Packages may override builtins by registering a command with the same name.
     """
-    if command_name in _package_commands:
+    if isinstance(handler_func, str):
+        target = _package_commands.get(handler_func)
+        if target is None:
+            print(f"Warning: Cannot alias '{command_name}' to unknown command '{handler_func}'.", file=sys.stderr)
+            return
+        handler_func = target
+    elif min_args is not None or max_args is not None or usage is not None or stream is not None or cpu_bound:
+        handler_func = ShellCommand(command_name, handler_func, min_args or 0, max_args, usage, stream=stream, cpu_bound=cpu_bound)
+
+    existing = _package_commands.get(command_name)
+    # Overriding a builtin is intentional, and a lazy stub being replaced by its real
+    # handler is not a conflict either
+    if existing is not None and not isinstance(existing, LazyPackageCommand) and not getattr(existing, "builtin", False):
         print(f"Warning: Command '{command_name}' from package is already registered. Overwriting.", file=sys.stderr)
     _package_commands[command_name] = handler_func
+    _command_names.add(command_name)
     # print(f"Registered package command: {command_name}") # Optional debug
 
+def register_builtin_command(command_name, handler_func, min_args=0, max_args=None, usage=None, stream=None):
+    """
+    Registers a builtin command in the dispatch table.
+    handler_func receives the list of arguments, already checked against min_args/max_args.
+    stream is an optional pipeline version of the command, see ShellCommand.
+    """
+    _package_commands[command_name] = ShellCommand(command_name, handler_func, min_args, max_args, usage, builtin=True, stream=stream)
+    _command_names.add(command_name)
+
+def builtin_command(command_name, min_args=0, max_args=None, usage=None, stream=None):
+    """
+    Decorator form of register_builtin_command.
+    """
+    def decorator(handler_func):
+        register_builtin_command(command_name, handler_func, min_args, max_args, usage, stream)
+        return handler_func
+    return decorator
+
+def builtin_stream_command(command_name, min_args=0, max_args=None, usage=None):
+    """
+    Decorator registering a builtin that only has a stream function.
+    """
+    def decorator(stream_func):
+        register_builtin_command(command_name, None, min_args, max_args, usage, stream_func)
+        return stream_func
+    return decorator
+
+# --- Lazy package command index ---
+# Importing every package at startup just to learn which commands it provides gets
+# slow once a few dozen packages are installed. Instead, we keep an index of
+# command name -> package in _system/_packagecommands and register lazy stubs that
+# import the owning package the first time one of its commands is run.
+# The index is only rebuilt for packages whose .py files changed since the last start.
+package_index_file = curr_dir / "_system" / "_packagecommands"
+
+class LazyPackageCommand:
+    """
+    Stand-in handler for a package command whose package has not been imported yet.
+    Calling it imports the package, lets it register its real handlers, then runs the command.
+    """
+    def __init__(self, command_name, module_name, index_file=None):
+        self.command_name = command_name
+        self.module_name = module_name
+        self.index_file = index_file
+
+    def resolve(self):
+        """
+        Imports the package and returns the real handler, or None if that fails.
+        """
+        try:
+            commands = import_package_commands(self.module_name)
+        except Exception as e:
+            print(f"Error loading commands from package '{self.module_name}': {e}", file=sys.stderr)
+            return None
+        handler = _package_commands.get(self.command_name)
+        if handler is None or isinstance(handler, LazyPackageCommand):
+            # The package no longer registers this command; drop the stale stub and
+            # correct the index so the stub isn't registered again on the next start
+            _package_commands.pop(self.command_name, None)
+            _command_names.discard(self.command_name)
+            if self.index_file is not None:
+                reindex_package(self.index_file, self.module_name, commands)
+            print(f"Error: Package '{self.module_name}' no longer provides command '{self.command_name}'.", file=sys.stderr)
+            return None
+        return handler
+
+    def __call__(self, args):
+        handler = self.resolve()
+        if handler is not None:
+            return handler(args)
+
+def import_package_commands(module_name):
+    """
+    Imports a package and calls its 'register_shell_commands' function.
+    Returns the list of command names the package registered.
+    """
+    registered = []
+
+    def register(command_name, handler_func, **metadata):
+        registered.append(command_name)
+        register_package_command(command_name, handler_func, **metadata)
+
+    # Dynamically import the package's __init__.py as a module
+    package_module = importlib.import_module(module_name)
+    # We expect a function named 'register_shell_commands' in its __init__.py
+    if hasattr(package_module, 'register_shell_commands') and callable(package_module.register_shell_commands):
+        package_module.register_shell_commands(register)
+    return registered
+
+def package_signature(package_dir):
+    """
+    Returns the signature of a package: the relative path, mtime and size of every
+    .py file in it, so that editing any of its modules (not just __init__.py) is noticed.
+    """
+    signature = []
+    for dirpath, dirnames, filenames in os.walk(package_dir):
+        dirnames[:] = sorted(name for name in dirnames if name != "__pycache__")
+        for filename in sorted(filenames):
+            if not filename.endswith(".py"):
+                continue
+            path = os.path.join(dirpath, filename)
+            try:
+                file_stat = os.stat(path)
+            except OSError:
+                continue # Removed while we were walking
+            signature.append([os.path.relpath(path, package_dir), file_stat.st_mtime_ns, file_stat.st_size])
+    return signature
+
+def scan_packages(packages_root_dir):
+    """
+    Finds every package (a directory with an __init__.py) in packages_root_dir.
+    Returns a dictionary of {package_name: signature} (see package_signature).
+    """
+    packages = {}
+    with os.scandir(packages_root_dir) as entries:
+        for entry in entries:
+            if entry.is_dir() and os.path.isfile(os.path.join(entry.path, "__init__.py")):
+                packages[entry.name] = package_signature(entry.path)
+    return packages
+
+def read_package_index(index_file):
+    """
+    Reads the package command index.
+    Returns {package_name: {"signature": [...], "commands": [...]}}, or an empty
+    dictionary if the index is missing or unreadable.
+    """
+    try:
+        with open(index_file, 'r') as f:
+            index = json.load(f)
+        return index.get("packages", {})
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"Warning: Package command index '{index_file}' is unreadable, rebuilding it: {e}", file=sys.stderr)
+        return {}
+
+def write_package_index(index_file, packages):
+    """
+    Writes the package command index atomically (write to a temporary file, then rename).
+    """
+    index_file = Path(index_file)
+    if not index_file.parent.is_dir():
+        return # No _system directory (not built); just skip persisting
+    commands = {}
+    for package_name, record in packages.items():
+        for command_name in record["commands"]:
+            commands[command_name] = package_name
+    temp_file = index_file.with_name(index_file.name + ".tmp")
+    try:
+        with open(temp_file, 'w') as f:
+            json.dump({"packages": packages, "commands": commands}, f, indent=4, sort_keys=True)
+        os.replace(temp_file, index_file)
+    except Exception as e:
+        print(f"Warning: Could not write package command index '{index_file}': {e}", file=sys.stderr)
+
+def reindex_package(index_file, module_name, commands):
+    """
+    Records in the index the commands an imported package actually registered.
+    """
+    module = sys.modules.get(module_name)
+    if getattr(module, "__file__", None) is None:
+        return
+    packages = read_package_index(index_file)
+    packages[module_name] = {"signature": package_signature(os.path.dirname(module.__file__)), "commands": commands}
+    write_package_index(index_file, packages)
+
 # --- Function to load commands from installed packages ---
-def load_package_commands():
+def load_package_commands(packages_root_dir=None, lazy=True, index_file=None):
     """
-    Scans the _packages directory, imports Python packages, and calls their
-    'register_shell_commands' function to register new commands with PyOS.
+    Scans the _packages directory and registers the commands of every package with PyOS.
+    With lazy=True (the default), packages are only imported when they are new or have
+    changed since the index was written; all other commands are registered as lazy stubs.
+    With lazy=False, every package is imported and its 'register_shell_commands' called.
     """
-    packages_root_dir = curr_dir / "_packages" # Use the global curr_dir
-    
+    if packages_root_dir is None:
+        packages_root_dir = curr_dir / "_packages" # Use the global curr_dir
+    if index_file is None:
+        index_file = package_index_file
+    packages_root_dir = Path(packages_root_dir)
+
     if not packages_root_dir.is_dir():
         print(f"Warning: Package root directory '{packages_root_dir}' not found. No external commands will be loaded.", file=sys.stderr)
         return
@@ -88,28 +396,45 @@ def load_package_commands():
     if str(packages_root_dir) not in sys.path:
         sys.path.insert(0, str(packages_root_dir)) # Insert at the beginning to prioritize packages
 
-    for item in packages_root_dir.iterdir():
-        # Check if it's a directory and contains an __init__.py (i.e., a Python package)
-        if item.is_dir() and (item / "__init__.py").is_file(): 
-            module_name = item.name # Get the directory name (e.g., 'calculator')
+    if not lazy:
+        for module_name in scan_packages(packages_root_dir):
             try:
-                # Dynamically import the package's __init__.py as a module
-                package_module = importlib.import_module(module_name)
-                
-                # Check if the package has a specific function to register its commands
-                # We'll expect a function named 'register_shell_commands' in its __init__.py
-                if hasattr(package_module, 'register_shell_commands') and callable(package_module.register_shell_commands):
-                    # Call this function, passing our shell's registration mechanism
-                    package_module.register_shell_commands(register_package_command)
-                    # print(f"Loaded commands from package: {module_name}") # Optional debug
-                # else:
-                    # print(f"Info: Package '{module_name}' has no 'register_shell_commands' function. Skipping command registration.", file=sys.stderr)
-
+                import_package_commands(module_name)
             except Exception as e:
                 print(f"Error loading commands from package '{module_name}': {e}", file=sys.stderr)
+        return
+
+    indexed = read_package_index(index_file)
+    current = scan_packages(packages_root_dir)
+    packages = {}
+    changed = set(indexed) != set(current) # Packages were added or removed
+
+    for module_name, signature in current.items():
+        record = indexed.get(module_name)
+        if record is not None and record.get("signature") == signature:
+            packages[module_name] = record
+            continue
+        # New or modified package: import it now to learn its commands
+        changed = True
+        try:
+            commands = import_package_commands(module_name)
+        except Exception as e:
+            # Not recorded in the index, so it is retried on the next start
+            print(f"Error loading commands from package '{module_name}': {e}", file=sys.stderr)
+            continue
+        packages[module_name] = {"signature": signature, "commands": commands}
+
+    for module_name, record in packages.items():
+        for command_name in record["commands"]:
+            existing = _package_commands.get(command_name)
+            # Packages override builtins, but never a handler that is already loaded
+            if existing is None or getattr(existing, "builtin", False):
+                _package_commands[command_name] = LazyPackageCommand(command_name, module_name, index_file)
+                _command_names.add(command_name)
+
+    if changed:
+        write_package_index(index_file, packages)
 
-# Call load_package_commands after sys.path is set up and gum is imported
-load_package_commands()
 # --- End NEW: Package Command System ---
 
 
@@ -147,7 +472,21 @@ def checkforbuild():
         print(f"Error reading _isbuilded file: {e}", file=sys.stderr)
         return False
 
-def get_stored_passwords(passwords_file_path):
+# --- Password store ---
+# Passwords normally live in the text file _system/_passwords. Its parsed contents are
+# cached in memory and only re-read when the file's mtime or size changes.
+# For large user bases the store can be converted (see 'passdb convert') to an SQLite
+# database, _system/_passwords.sqlite, which gives indexed lookups and atomic writes
+# without ever parsing the whole store. Once that database exists, it is used instead
+# of the text file.
+passwords_file_path = curr_dir / "_system" / "_passwords"
+passwords_db_path = curr_dir / "_system" / "_passwords.sqlite"
+
+_password_cache = {} # Maps file path -> (mtime_ns, size, {username: hashed_password})
+_password_db = None # Open sqlite3 connection, shared by all threads
+_password_db_lock = threading.Lock()
+
+def read_passwords_file(passwords_file_path):
     """
     Reads the _passwords file and parses its custom format.
     Returns a dictionary of {username: hashed_password}.
@@ -155,105 +494,590 @@ def get_stored_passwords(passwords_file_path):
     will overwrite previous ones, effectively getting the "latest" password.
     """
     stored_data = {}
-    if not Path(passwords_file_path).is_file():
-        return stored_data # Return empty if file doesn't exist
-
-    try:
-        with open(passwords_file_path, 'r') as f:
-            lines = f.readlines()
-            for line in lines: # Iterate through lines normally
-                line = line.strip()
-                # Look for lines that contain ':' and are not just '{' or '}'
-                if ':' in line and not line.startswith('{') and not line.endswith('}'):
-                    content = line.strip(';') # Remove trailing semicolon if present
-                    key, value = content.split(':', 1)
-                    stored_data[key.strip()] = value.strip()
+    with open(passwords_file_path, 'r') as f:
+        for line in f: # Iterate through lines without loading the whole file
+            line = line.strip()
+            # Look for lines that contain ':' and are not just '{' or '}'
+            if ':' in line and not line.startswith('{') and not line.endswith('}'):
+                content = line.strip(';') # Remove trailing semicolon if present
+                key, value = content.split(':', 1)
+                stored_data[key.strip()] = value.strip()
+    return stored_data
+
+def get_stored_passwords(passwords_file_path):
+    """
+    Returns a dictionary of {username: hashed_password} from the _passwords file.
+    The parsed file is cached, and re-read only when its mtime or size changes.
+    The returned dictionary is shared with the cache and must not be modified.
+    """
+    try:
+        file_stat = os.stat(passwords_file_path)
+    except OSError:
+        return {} # Return empty if file doesn't exist
+
+    key = str(passwords_file_path)
+    cached = _password_cache.get(key)
+    if cached is not None and cached[0] == file_stat.st_mtime_ns and cached[1] == file_stat.st_size:
+        return cached[2]
+
+    try:
+        stored_data = read_passwords_file(passwords_file_path)
     except Exception as e:
         print(f"Error reading or parsing _passwords file: {e}", file=sys.stderr)
         return {}
+    _password_cache[key] = (file_stat.st_mtime_ns, file_stat.st_size, stored_data)
     return stored_data
 
-def verify_password(username_input, password_input):
+def open_password_db(create=False):
     """
-    Verifies a user's plain-text password against the stored hashed password.
-    This now uses Python's 'passlib' library for proper salt handling and verification.
+    Returns the connection to the password database, opening it on first use.
+    Returns None if the database does not exist and create is False.
     """
-    curr_dir = Path(__file__).resolve().parent
-    passwords_file_path = curr_dir / "_system" / "_passwords"
+    global _password_db
+    if _password_db is None:
+        if not create and not Path(passwords_db_path).is_file():
+            return None
+        _password_db = sqlite3.connect(str(passwords_db_path), check_same_thread=False, isolation_level=None)
+        _password_db.execute("CREATE TABLE IF NOT EXISTS passwords (username TEXT PRIMARY KEY, hash TEXT NOT NULL)")
+    return _password_db
+
+def get_password_hash(username):
+    """
+    Returns the stored hash for username, or None if the user does not exist.
+    """
+    with _password_db_lock:
+        db = open_password_db()
+        if db is not None:
+            row = db.execute("SELECT hash FROM passwords WHERE username = ?", (username,)).fetchone()
+            return row[0] if row else None
+    return get_stored_passwords(passwords_file_path).get(username)
 
+def store_password_hash(username, hashed_password):
+    """
+    Adds or replaces a user's hashed password.
+    With the database this is a single atomic upsert; with the text file a new entry
+    is appended in one write (later entries override earlier ones).
+    """
+    with _password_db_lock:
+        db = open_password_db()
+        if db is not None:
+            with db_transaction(db):
+                db.execute("INSERT OR REPLACE INTO passwords (username, hash) VALUES (?, ?)", (username, hashed_password))
+            return
+    with open(passwords_file_path, 'a') as f:
+        f.write(f"{{\n{username}:{hashed_password};\n}}\n")
+
+@contextlib.contextmanager
+def db_transaction(db):
+    """
+    Runs the body in an immediate transaction, rolled back if it raises.
+    """
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+    db.execute("COMMIT")
+
+def convert_passwords_to_db():
+    """
+    Copies every entry of the _passwords text file into the password database,
+    creating it if needed. Returns the number of users copied.
+    """
     stored_passwords = get_stored_passwords(passwords_file_path)
+    with _password_db_lock:
+        db = open_password_db(create=True)
+        with db_transaction(db):
+            db.executemany("INSERT OR REPLACE INTO passwords (username, hash) VALUES (?, ?)", stored_passwords.items())
+    return len(stored_passwords)
 
-    if username_input not in stored_passwords:
-        print(f"User '{username_input}' not found.")
-        return False
+# --- Off-thread password verification ---
+# sha512_crypt costs tens of milliseconds of CPU per check at the default rounds, so
+# checks run on a bounded worker pool instead of the calling thread. A process pool
+# (the default) lets checks run truly in parallel; set PYOS_PASSWORD_POOL=thread to
+# use threads instead. PYOS_PASSWORD_WORKERS sets the pool size. The process pool
+# starts its workers from a forkserver (or spawns them), because the pool grows from
+# whichever thread logs in: forking the shell there could give a worker a lock other
+# threads held (the import lock while passlib is imported, _stats_lock...).
+# PYOS_PASSWORD_ROUNDS sets the rounds policy: a stored hash using different rounds is
+# transparently re-hashed with the configured rounds after a successful login.
+PASSWORD_POOL_KIND = os.environ.get("PYOS_PASSWORD_POOL", "process")
+PASSWORD_WORKERS = int(os.environ.get("PYOS_PASSWORD_WORKERS", 0)) or min(4, os.cpu_count() or 1)
+PASSWORD_ROUNDS = int(os.environ.get("PYOS_PASSWORD_ROUNDS", 0)) or None
+
+_password_pool = None
+_password_pool_lock = threading.Lock()
+
+def get_password_pool():
+    """
+    Returns the password verification pool, creating it on first use.
+    """
+    global _password_pool
+    with _password_pool_lock:
+        if _password_pool is None:
+            if PASSWORD_POOL_KIND == "thread":
+                _password_pool = concurrent.futures.ThreadPoolExecutor(PASSWORD_WORKERS, thread_name_prefix="pyos-password")
+            else:
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                _password_pool = concurrent.futures.ProcessPoolExecutor(PASSWORD_WORKERS, mp_context=multiprocessing.get_context(method))
+        return _password_pool
+
+def check_password(password_input, stored_hash, rounds=None):
+    """
+    Runs in the worker pool. Checks password_input against stored_hash.
+    Returns (matches, new_hash), where new_hash is a re-hash of the password with the
+    given rounds if the stored hash does not follow that policy, and None otherwise.
+    """
+    # Use passlib's sha512_crypt.verify method
+    # This handles the salt extraction and comparison internally.
+    if not sha512_crypt.verify(password_input, stored_hash):
+        return False, None
+    if rounds is not None:
+        hasher = sha512_crypt.using(rounds=rounds)
+        if hasher.needs_update(stored_hash):
+            return True, hasher.hash(password_input)
+    return True, None
 
-    stored_hash = stored_passwords[username_input]
+def submit_password_check(username_input, password_input):
+    """
+    Starts verifying a user's plain-text password on the worker pool.
+    Returns a concurrent.futures.Future that resolves to True or False.
+    """
+    result = concurrent.futures.Future()
+    stored_hash = get_password_hash(username_input)
+
+    if stored_hash is None:
+        print(f"User '{username_input}' not found.")
+        result.set_result(False)
+        return result
 
     try:
-        # Use passlib's sha512_crypt.verify method
-        # This handles the salt extraction and comparison internally.
-        if sha512_crypt.verify(password_input, stored_hash):
-            return True
-        else:
-            return False
-    except Exception as e:
-        print(f"An unexpected error occurred during password verification with passlib: {e}", file=sys.stderr)
-        return False
+        work = get_password_pool().submit(check_password, password_input, stored_hash, PASSWORD_ROUNDS)
+    except Exception:
+        # The pool is broken or shut down; check on this thread instead
+        work = concurrent.futures.Future()
+        try:
+            work.set_result(check_password(password_input, stored_hash, PASSWORD_ROUNDS))
+        except Exception as e:
+            work.set_exception(e)
+
+    def finish(work):
+        try:
+            matches, new_hash = work.result()
+        except Exception as e:
+            print(f"An unexpected error occurred during password verification with passlib: {e}", file=sys.stderr)
+            result.set_result(False)
+            return
+        if new_hash is not None:
+            try:
+                store_password_hash(username_input, new_hash)
+            except Exception as e:
+                print(f"Warning: Could not re-hash the password of '{username_input}': {e}", file=sys.stderr)
+        result.set_result(matches)
+
+    work.add_done_callback(finish)
+    return result
+
+def verify_password(username_input, password_input):
+    """
+    Verifies a user's plain-text password against the stored hashed password.
+    This now uses Python's 'passlib' library for proper salt handling and verification.
+    Blocks until the check on the worker pool is done.
+    """
+    return submit_password_check(username_input, password_input).result()
+
+async def verify_password_async(username_input, password_input):
+    """
+    Awaitable version of verify_password, for use from an asyncio event loop.
+    """
+    return await asyncio.wrap_future(submit_password_check(username_input, password_input))
 
 # ANSI color codes
 COLOR_BLUE = "\033[94m"    # Directories
 COLOR_GREEN = "\033[92m"   # Executables
 COLOR_RESET = "\033[0m"    # Reset to default
 
-def list_content_colored(path="."):
+# --- Archive mounts ---
+# 'mount <archive> <directory>' shows the content of a zip or tar archive (plain, .gz,
+# .xz or .bz2) under a directory, read-only and without extracting it: lc, cd,
+# readfile, find and du look inside. The archive's member list is read once, into
+# an index of ArchiveEntry by path; reading a file then only reads that member.
+# Zip members are compressed one by one, so they are read directly. A compressed tar
+# is one compressed stream: reading a member decompresses the archive up to it (in
+# memory, nothing is written to disk), so members near the end of a big .tar.xz
+# take longer. Mounts are shared by all sessions.
+ArchiveEntry = collections.namedtuple("ArchiveEntry", ["kind", "size", "mtime", "member"])
+
+_mounts = {} # Maps absolute mount point -> ArchiveFS
+_mounts_lock = threading.Lock()
+
+class ArchiveMemberFile(io.RawIOBase):
+    """
+    Read-only, seekable file object for the bytes of a tar member: the range
+    [start, start + size) of the archive's decompressed stream.
+    sequential is True if stream is compressed, where seeking backwards decompresses
+    again from the start of the archive.
+    """
+    def __init__(self, stream, start, size, sequential=False):
+        self.stream = stream
+        self.start = start
+        self.size = size
+        self.sequential = sequential
+        self.position = 0
+        self.stream_position = None # Where the last read left stream
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = min(len(buffer), self.size - self.position)
+        if count <= 0:
+            return 0
+        if self.stream_position != self.start + self.position:
+            self.stream.seek(self.start + self.position)
+        data = self.stream.read(count)
+        buffer[:len(data)] = data
+        self.position += len(data)
+        self.stream_position = self.start + self.position
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: self.size}[whence]
+        self.position = max(0, base + offset)
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def close(self):
+        self.stream.close()
+        super().close()
+
+class ArchiveFS:
+    """
+    A read-only view of a zip or tar archive, indexed by member path
+    ("" is the archive's root directory, "a/b.txt" a member).
+    """
+    def __init__(self, archive_path):
+        self.archive_path = os.path.abspath(archive_path)
+        self.entries = {"": ArchiveEntry(ENTRY_DIRECTORY, 0, os.stat(self.archive_path).st_mtime, None)}
+        self.children = {"": {}} # Maps directory path -> {name: kind}
+        self.zip = None
+        if zipfile.is_zipfile(self.archive_path):
+            self.zip = zipfile.ZipFile(self.archive_path)
+            for info in self.zip.infolist():
+                mode = info.external_attr >> 16
+                kind = ENTRY_DIRECTORY if info.is_dir() else ENTRY_EXECUTABLE if mode & 0o111 else ENTRY_FILE
+                self.add(info.filename, ArchiveEntry(kind, info.file_size, time.mktime(info.date_time + (0, 0, -1)), info))
+        elif tarfile.is_tarfile(self.archive_path):
+            with tarfile.open(self.archive_path, "r:*") as tar:
+                for member in tar: # One pass over the archive
+                    if member.isdir():
+                        kind = ENTRY_DIRECTORY
+                    elif member.isreg():
+                        kind = ENTRY_EXECUTABLE if member.mode & 0o111 else ENTRY_FILE
+                    else:
+                        continue # Links and devices can't be read
+                    self.add(member.name, ArchiveEntry(kind, member.size, member.mtime, member.offset_data))
+        else:
+            raise ValueError("not a zip or tar archive")
+
+    def add(self, name, entry):
+        path = "/".join(part for part in name.split("/") if part not in ("", "."))
+        if not path or ".." in path.split("/"):
+            return
+        parent, _, base = path.rpartition("/")
+        self.add_directory(parent)
+        if entry.kind == ENTRY_DIRECTORY:
+            self.add_directory(path, entry)
+        else:
+            self.entries[path] = entry
+        self.children[parent][base] = entry.kind
+
+    def add_directory(self, path, entry=None):
+        """
+        Adds directory path (and its parents), which archives often leave implicit.
+        """
+        if path in self.children:
+            if entry is not None:
+                self.entries[path] = entry
+            return
+        parent, _, base = path.rpartition("/")
+        self.add_directory(parent)
+        self.entries[path] = entry or ArchiveEntry(ENTRY_DIRECTORY, 0, self.entries[""].mtime, None)
+        self.children[path] = {}
+        self.children[parent][base] = ENTRY_DIRECTORY
+
+    def get(self, path):
+        return self.entries.get(path)
+
+    def listdir(self, path):
+        """
+        Returns [(name, kind)] for directory path, in archive order.
+        Raises FileNotFoundError or NotADirectoryError.
+        """
+        if path not in self.children:
+            raise NotADirectoryError(path) if path in self.entries else FileNotFoundError(path)
+        return list(self.children[path].items())
+
+    def open(self, path):
+        """
+        Returns a seekable binary file object for the file at path.
+        """
+        entry = self.entries.get(path)
+        if entry is None:
+            raise FileNotFoundError(path)
+        if entry.kind == ENTRY_DIRECTORY:
+            raise IsADirectoryError(path)
+        if self.zip is not None:
+            f = self.zip.open(entry.member) # Seekable since Python 3.7
+            f.sequential = entry.member.compress_type != zipfile.ZIP_STORED
+            return f
+        # Each reader gets a stream of its own, so reads don't need a lock
+        with open(self.archive_path, 'rb') as f:
+            magic = f.read(6)
+        if magic.startswith(b"\x1f\x8b"):
+            stream = gzip.open(self.archive_path, 'rb')
+        elif magic.startswith(b"\xfd7zXZ"):
+            stream = lzma.open(self.archive_path, 'rb')
+        elif magic.startswith(b"BZh"):
+            stream = bz2.open(self.archive_path, 'rb')
+        else:
+            return ArchiveMemberFile(open(self.archive_path, 'rb'), entry.member, entry.size)
+        return ArchiveMemberFile(stream, entry.member, entry.size, sequential=True)
+
+    def walk(self, path, root, depth=0):
+        """
+        Yields a WalkEntry for everything below directory path, with paths starting with root.
+        """
+        for name, kind in self.children.get(path, {}).items():
+            child = f"{path}/{name}" if path else name
+            child_root = os.path.join(root, name)
+            entry = self.entries[child]
+            yield WalkEntry(child_root, name, kind == ENTRY_DIRECTORY, entry.size, entry.mtime, depth + 1)
+            if kind == ENTRY_DIRECTORY:
+                yield from self.walk(child, child_root, depth + 1)
+
+    def close(self):
+        if self.zip is not None:
+            self.zip.close()
+
+def find_mount(path):
+    """
+    Returns (ArchiveFS, path inside the archive) if path is in a mounted archive, else None.
+    """
+    if not _mounts:
+        return None
+    path = os.path.realpath(path) # Mount points are stored resolved, too
+    for mount_point, fs in list(_mounts.items()):
+        if path == mount_point:
+            return fs, ""
+        if path.startswith(mount_point + os.sep):
+            return fs, path[len(mount_point) + 1:].replace(os.sep, "/")
+    return None
+
+def mount_archive(archive_path, mount_point):
+    """
+    Mounts archive_path on the existing directory mount_point. Returns the ArchiveFS.
+    Raises OSError or ValueError.
+    """
+    mount_point = os.path.realpath(mount_point)
+    if not os.path.isdir(mount_point):
+        raise NotADirectoryError(f"'{mount_point}' is not a directory")
+    fs = ArchiveFS(archive_path)
+    with _mounts_lock:
+        if mount_point in _mounts:
+            fs.close()
+            raise ValueError(f"something is already mounted on '{mount_point}'")
+        _mounts[mount_point] = fs
+    return fs
+
+def unmount(mount_point):
+    """
+    Unmounts the archive mounted on mount_point. Returns False if nothing was.
+    """
+    with _mounts_lock:
+        fs = _mounts.pop(os.path.realpath(mount_point), None)
+    if fs is None:
+        return False
+    fs.close()
+    return True
+
+def path_kind(path):
+    """
+    Returns ENTRY_DIRECTORY, ENTRY_FILE or ENTRY_EXECUTABLE for path, looking inside
+    mounted archives, or None if it doesn't exist.
+    """
+    mounted = find_mount(path)
+    if mounted is not None:
+        entry = mounted[0].get(mounted[1])
+        return entry.kind if entry is not None else None
+    if os.path.isdir(path):
+        return ENTRY_DIRECTORY
+    if os.path.exists(path):
+        return ENTRY_FILE
+    return None
+
+def is_directory(path):
+    return path_kind(path) == ENTRY_DIRECTORY
+
+def check_writable(path):
+    """
+    Prints an error and returns False if path is inside a (read-only) mounted archive.
+    """
+    if find_mount(path) is not None:
+        print(f"Error: '{path}' is in a mounted archive, which is read-only.")
+        return False
+    return True
+
+# --- Directory listings ---
+# lc reads directories with os.scandir, which gives each entry's type without extra
+# syscalls, and writes its output in batches of LISTING_BATCH_SIZE lines.
+# Sorted listings of recently listed directories are cached, and reused as long as
+# the directory's mtime (which changes whenever an entry is added, removed or
+# renamed) is unchanged. The directory's mtime doesn't change with the mode of an
+# entry, and may not change between two writes in the same clock tick, so the file
+# commands (mkfile, cp, mv, ...) also drop the listing of every directory they
+# write to. Modes changed outside PyOS show once the directory changes, or with the
+# cache disabled: set PYOS_LISTING_CACHE=0 to disable it.
+LISTING_BATCH_SIZE = 512
+LISTING_CACHE_ENABLED = os.environ.get("PYOS_LISTING_CACHE", "1") != "0"
+LISTING_CACHE_SIZE = 64 # Number of directories kept in the cache
+
+ENTRY_DIRECTORY = "d"
+ENTRY_EXECUTABLE = "x"
+ENTRY_FILE = "f"
+
+_listing_cache = {} # Maps absolute directory path -> (mtime_ns, [(name, kind), ...])
+
+def iter_directory_entries(path):
+    """
+    Yields (name, kind) for every directory and file in path, in the order the
+    filesystem returns them. kind is ENTRY_DIRECTORY, ENTRY_EXECUTABLE or ENTRY_FILE.
+    Other entries (e.g. broken symlinks) are skipped.
+    """
+    mounted = find_mount(path)
+    if mounted is not None:
+        yield from mounted[0].listdir(mounted[1])
+        return
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    yield entry.name, ENTRY_DIRECTORY
+                elif entry.is_file():
+                    # Any execute bit counts as executable; one stat, no os.access call
+                    if entry.stat().st_mode & 0o111:
+                        yield entry.name, ENTRY_EXECUTABLE
+                    else:
+                        yield entry.name, ENTRY_FILE
+            except OSError:
+                continue # Entry vanished while listing
+
+def sort_directory_entries(entries):
+    """
+    Sorts entries alphabetically, directories first.
+    """
+    return sorted(entries, key=lambda item: (item[1] != ENTRY_DIRECTORY, item[0]))
+
+def get_directory_listing(path):
+    """
+    Returns the sorted list of (name, kind) for path, using the listing cache when enabled.
+    """
+    if not LISTING_CACHE_ENABLED or find_mount(path) is not None:
+        return sort_directory_entries(iter_directory_entries(path))
+
+    key = os.path.realpath(path)
+    mtime_ns = os.stat(key).st_mtime_ns
+    cached = _listing_cache.get(key)
+    if cached is not None and cached[0] == mtime_ns:
+        return cached[1]
+
+    listing = sort_directory_entries(iter_directory_entries(key))
+    _listing_cache.pop(key, None)
+    if len(_listing_cache) >= LISTING_CACHE_SIZE:
+        del _listing_cache[next(iter(_listing_cache))] # Drop the oldest directory
+    _listing_cache[key] = (mtime_ns, listing)
+    return listing
+
+def forget_listing(path):
+    """
+    Drops the cached listing of the directory containing path, which is being changed.
+    """
+    _listing_cache.pop(os.path.realpath(os.path.dirname(os.path.abspath(path))), None)
+
+def format_directory_entry(name, kind):
+    if kind == ENTRY_DIRECTORY:
+        return f"{COLOR_BLUE}{name}{COLOR_RESET}/" # Add / for directories
+    if kind == ENTRY_EXECUTABLE:
+        return f"{COLOR_GREEN}{name}{COLOR_RESET}"
+    return name
+
+def list_content_colored(path=".", sort=True, limit=None, page=1):
     """
     Lists directories first, then files, with colors.
     - Directories are blue.
     - Executable files are green.
     - Other files are default color.
+    With sort=False, entries are streamed in filesystem order as they are read,
+    without building the whole listing first. limit and page (1-based) select one
+    page of limit entries.
     """
-    target_path = Path(path)
-
-    if not target_path.exists():
+    kind = path_kind(path)
+    if kind is None:
         print(f"Error: '{path}' does not exist.")
         return
-    if not target_path.is_dir():
+    if kind != ENTRY_DIRECTORY:
         print(f"Error: '{path}' is not a directory.")
         return
 
-    directories = []
-    files = []
-
-    for item in target_path.iterdir():
-        if item.is_dir():
-            directories.append(item)
-        else:
-            files.append(item)
-
-    # Sort alphabetically
-    directories.sort()
-    files.sort()
-
-    # Print directories in blue
-    for d in directories:
-        print(f"{COLOR_BLUE}{d.name}{COLOR_RESET}/") # Add / for directories
+    try:
+        lines = (format_directory_entry(name, kind) for name, kind in iter_listing(path, sort, limit, page))
+        write_lines(lines, sys.stdout, LISTING_BATCH_SIZE)
+    except PermissionError:
+        print(f"Error: Permission denied to list '{path}'.")
 
-    # Print files with appropriate color
-    for f in files:
-        if f.is_file():
-            if os.access(f, os.X_OK): # Check if executable
-                print(f"{COLOR_GREEN}{f.name}{COLOR_RESET}")
-            else:
-                print(f"{f.name}")
-        # Handle other types if necessary (e.g., symlinks, though not explicitly requested)
+def iter_listing(path, sort=True, limit=None, page=1):
+    """
+    Yields (name, kind) for the entries of path, as listed by list_content_colored.
+    """
+    entries = get_directory_listing(path) if sort else iter_directory_entries(path)
+    if limit is not None:
+        start = (page - 1) * limit
+        entries = itertools.islice(entries, start, start + limit)
+    return iter(entries)
 
 def change_directory(path):
     """
-    Changes the current working directory of the PyOS.
+    Changes the current working directory of the PyOS session.
     """
+    session = current_session()
     try:
-        os.chdir(path)
-        print(f"Changed directory to: {os.getcwd()}")
+        if session.cwd is None and find_mount(path) is None:
+            os.chdir(path)
+        else:
+            # A virtual working directory: check it the way chdir would
+            new_cwd = os.path.realpath(os.path.join(get_cwd(), path))
+            kind = path_kind(new_cwd)
+            if kind is None:
+                raise FileNotFoundError(path)
+            if kind != ENTRY_DIRECTORY:
+                raise NotADirectoryError(path)
+            if find_mount(new_cwd) is not None:
+                session.cwd = new_cwd # The console gets a virtual one while in an archive
+            elif session is _console_session:
+                os.chdir(new_cwd) # Leaving an archive
+                session.cwd = None
+            elif not os.access(new_cwd, os.X_OK):
+                raise PermissionError(f"Permission denied: '{path}'")
+            else:
+                session.cwd = new_cwd
+        refresh_prompt()
+        print(f"Changed directory to: {get_cwd()}")
     except FileNotFoundError:
         print(f"Error: Directory '{path}' not found.")
     except NotADirectoryError:
@@ -263,120 +1087,1341 @@ def change_directory(path):
 
 # --- New File and Directory Operations ---
 
-def read_file(filepath):
+# readfile never loads a whole file: it streams the selected byte range in chunks
+# of READ_CHUNK_SIZE, so memory use is constant regardless of file size.
+READ_CHUNK_SIZE = 64 * 1024
+
+def parse_options(args, value_options=(), flag_options=()):
+    """
+    Splits command arguments into options and positional arguments.
+    value_options are options followed by a value (e.g. "--head 10"), flag_options
+    are options on their own (e.g. "--hex"). Returns ({option: value_or_True}, positional).
+    Raises ValueError for unknown options or missing values.
+    """
+    options = {}
+    positional = []
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg in value_options:
+            if i + 1 >= len(args):
+                raise ValueError(f"option '{arg}' needs a value")
+            options[arg] = args[i + 1]
+            i += 2
+            continue
+        if arg in flag_options:
+            options[arg] = True
+        elif arg.startswith("--"):
+            raise ValueError(f"unknown option '{arg}'")
+        else:
+            positional.append(arg)
+        i += 1
+    return options, positional
+
+def find_head_end(f, line_count):
     """
-    Reads and prints the content of a file.
+    Returns the byte offset just past the line_count-th line of the open binary file f.
+    """
+    f.seek(0)
+    position = 0
+    remaining = line_count
+    while remaining > 0:
+        chunk = f.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        index = -1
+        while remaining > 0:
+            index = chunk.find(b"\n", index + 1)
+            if index == -1:
+                break
+            remaining -= 1
+        if remaining == 0:
+            return position + index + 1
+        position += len(chunk)
+    return position
+
+def find_tail_start(f, line_count, file_size):
+    """
+    Returns the byte offset where the last line_count lines of the open binary file f
+    start, by reading blocks backwards from the end of the file.
+    """
+    if line_count <= 0:
+        return file_size
+    if getattr(f, "sequential", False):
+        return scan_tail_start(f, line_count, file_size)
+    position = file_size
+    # A newline at the very end of the file terminates the last line, it doesn't start a new one
+    if file_size > 0:
+        f.seek(file_size - 1)
+        if f.read(1) == b"\n":
+            position -= 1
+    remaining = line_count
+    while position > 0:
+        block_start = max(0, position - READ_CHUNK_SIZE)
+        f.seek(block_start)
+        block = f.read(position - block_start)
+        index = len(block)
+        while True:
+            index = block.rfind(b"\n", 0, index)
+            if index == -1:
+                break
+            remaining -= 1
+            if remaining == 0:
+                return block_start + index + 1
+        position = block_start
+    return 0 # The file has fewer lines than requested
+
+def scan_tail_start(f, line_count, file_size):
+    """
+    find_tail_start for compressed archive members, where each backwards seek
+    decompresses again from the start: reads f once from the beginning, keeping
+    the offsets of the last line_count line starts.
+    """
+    line_starts = collections.deque([0], maxlen=line_count + 1)
+    f.seek(0)
+    position = 0
+    while True:
+        chunk = f.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        index = chunk.find(b"\n")
+        while index != -1:
+            line_starts.append(position + index + 1)
+            index = chunk.find(b"\n", index + 1)
+        position += len(chunk)
+    # A newline at the very end of the file terminates the last line, it doesn't start a new one
+    if file_size > 0 and line_starts[-1] == file_size:
+        line_starts.pop()
+    return line_starts[-line_count] if len(line_starts) >= line_count else 0
+
+def iter_file_range(f, start, end):
+    """
+    Yields the bytes of the open binary file f from offset start up to end, in chunks.
+    """
+    f.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        chunk = f.read(min(READ_CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
+
+def iter_hexdump(chunks, start_offset=0):
+    """
+    Formats a stream of byte chunks as hexdump lines: offset, 16 hex bytes, and the
+    printable ASCII characters.
+    """
+    offset = start_offset
+    pending = b""
+    for chunk in chunks:
+        pending += chunk
+        full = len(pending) - len(pending) % 16
+        for i in range(0, full, 16):
+            yield format_hexdump_line(offset, pending[i:i + 16])
+            offset += 16
+        pending = pending[full:]
+    if pending:
+        yield format_hexdump_line(offset, pending)
+
+def format_hexdump_line(offset, row):
+    hex_part = " ".join(f"{byte:02x}" for byte in row)
+    text_part = "".join(chr(byte) if 32 <= byte < 127 else "." for byte in row)
+    return f"{offset:08x}  {hex_part:<47}  |{text_part}|"
+
+def iter_read_file(filepath, head=None, tail=None, offset=None, length=None, hexdump=False):
+    """
+    Yields the content of a file, or part of it, as pieces of text, reading it in chunks.
+    head/tail select the first/last lines, offset/length select a byte range.
+    hexdump yields the bytes as hexdump lines instead of as text; otherwise, bytes that
+    are not valid UTF-8 are shown as replacement characters.
+    Errors are printed, and end the output.
     """
-    target_path = Path(filepath)
     try:
-        if not target_path.exists():
+        kind = path_kind(filepath)
+        if kind is None:
             print(f"Error: File '{filepath}' not found.")
             return
-        if target_path.is_dir():
+        if kind == ENTRY_DIRECTORY:
             print(f"Error: '{filepath}' is a directory, not a file.")
             return
-        
-        content = target_path.read_text()
-        print(content)
+
+        mounted = find_mount(filepath)
+        with (mounted[0].open(mounted[1]) if mounted else open(filepath, 'rb')) as f:
+            file_size = f.seek(0, io.SEEK_END)
+            start, end = 0, file_size
+            if head is not None:
+                end = find_head_end(f, head)
+            elif tail is not None:
+                start = find_tail_start(f, tail, file_size)
+            if offset is not None:
+                start = min(max(start, offset), file_size)
+            if length is not None:
+                end = min(end, start + length)
+
+            chunks = iter_file_range(f, start, end)
+            if hexdump:
+                for line in iter_hexdump(chunks, start):
+                    yield line + "\n"
+                return
+
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            for chunk in chunks:
+                text = decoder.decode(chunk)
+                if text:
+                    yield text
+            text = decoder.decode(b"", final=True)
+            if text:
+                yield text
     except PermissionError:
         print(f"Error: Permission denied to read '{filepath}'.")
     except Exception as e:
         print(f"An unexpected error occurred while reading '{filepath}': {e}", file=sys.stderr)
 
+def read_file(filepath, head=None, tail=None, offset=None, length=None, hexdump=False):
+    """
+    Prints the content of a file, or part of it (see iter_read_file), streaming it in chunks.
+    """
+    last_char = "\n"
+    for text in iter_read_file(filepath, head, tail, offset, length, hexdump):
+        sys.stdout.write(text)
+        last_char = text[-1]
+    if last_char != "\n":
+        sys.stdout.write("\n")
+    sys.stdout.flush()
+
 def make_file(filepath, content=""):
     """
     Creates a new file with optional content.
     """
-    target_path = Path(filepath)
-    try:
-        if target_path.exists():
-            print(f"Error: File '{filepath}' already exists. Use a different name or 'rmfile' first.")
-            return
-        
-        # Ensure parent directories exist
-        target_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        target_path.write_text(content)
-        print(f"File '{filepath}' created.")
-    except PermissionError:
-        print(f"Error: Permission denied to create '{filepath}'.")
-    except Exception as e:
-        print(f"An unexpected error occurred while creating '{filepath}': {e}", file=sys.stderr)
+    run_file_batch(create_file, [(filepath, content)], "create", "")
 
 def remove_file(filepath):
     """
     Deletes a specified file.
     """
-    target_path = Path(filepath)
-    try:
-        if not target_path.exists():
-            print(f"Error: File '{filepath}' not found.")
-            return
-        if target_path.is_dir():
-            print(f"Error: '{filepath}' is a directory. Use 'rmdir' instead.")
-            return
-        
-        target_path.unlink() # Deletes the file
-        print(f"File '{filepath}' deleted.")
-    except PermissionError:
-        print(f"Error: Permission denied to delete '{filepath}'.")
-    except Exception as e:
-        print(f"An unexpected error occurred while deleting '{filepath}': {e}", file=sys.stderr)
+    run_file_batch(delete_file, [(filepath,)], "delete", "")
 
 def make_directory(dirpath):
     """
     Creates a new directory.
     """
-    target_path = Path(dirpath)
-    try:
-        target_path.mkdir(parents=True, exist_ok=True) # Creates dir and any necessary parents
-        print(f"Directory '{dirpath}' created.")
-    except PermissionError:
-        print(f"Error: Permission denied to create directory '{dirpath}'.")
-    except FileExistsError: # Should be caught by exist_ok=True, but good for explicit check
-        print(f"Error: Directory '{dirpath}' already exists.")
-    except Exception as e:
-        print(f"An unexpected error occurred while creating directory '{dirpath}': {e}", file=sys.stderr)
+    run_file_batch(create_directory, [(dirpath,)], "create directory", "")
 
 def remove_directory(dirpath):
     """
     Deletes an empty directory.
     """
-    target_path = Path(dirpath)
+    run_file_batch(delete_directory, [(dirpath,)], "delete directory", "")
+
+# --- Bulk file operations ---
+# The file builtins take any number of paths and glob patterns. Their work is done
+# in batches of FILE_BATCH_SIZE paths on a pool of FILE_WORKERS threads (file system
+# calls release the GIL), and reported in one summary line, plus the first
+# FILE_ERRORS_SHOWN errors. cp copies in the kernel (copy_file_range, or sendfile),
+# without the data passing through Python; mv renames when it can and only copies
+# across file systems.
+FILE_WORKERS = int(os.environ.get("PYOS_FILE_WORKERS", 0)) or 8
+FILE_BATCH_SIZE = 256
+FILE_ERRORS_SHOWN = 10
+COPY_CHUNK_SIZE = 1 << 30 # Bytes per copy_file_range/sendfile call
+
+_file_pool = None
+_file_pool_lock = threading.Lock()
+
+class FileOperationError(Exception):
+    """
+    A file operation failed for a reason worth showing as is (e.g. "already exists").
+    """
+
+def get_file_pool():
+    global _file_pool
+    with _file_pool_lock:
+        if _file_pool is None:
+            _file_pool = concurrent.futures.ThreadPoolExecutor(FILE_WORKERS, thread_name_prefix="pyos-file")
+        return _file_pool
+
+def expand_path_args(args):
+    """
+    Resolves paths against the session's working directory and expands glob patterns,
+    in order. Prints an error for each pattern that matches nothing.
+    """
+    paths = []
+    for arg in args:
+        path = resolve_path(arg)
+        if glob.has_magic(arg):
+            matches = sorted(glob.glob(path))
+            if not matches:
+                print(f"Error: No match for '{arg}'.")
+            paths.extend(matches)
+        else:
+            paths.append(path)
+    return paths
+
+def describe_os_error(action, path, error):
+    if isinstance(error, FileOperationError):
+        return str(error)
+    return f"Cannot {action} '{path}': {error.strerror or error}"
+
+def run_file_batch(operation, items, action, done_message):
+    """
+    Runs operation(*item) for every item on the file pool. operation returns a success
+    message, or raises OSError or FileOperationError. A single item is reported with
+    its own message; several with done_message.format(done=, total=) and the time taken.
+    Returns the number of successful items.
+    """
+    if not items:
+        return 0
+    if len(items) == 1:
+        try:
+            print(operation(*items[0]))
+            return 1
+        except (OSError, FileOperationError) as e:
+            print(f"Error: {describe_os_error(action, items[0][0], e)}")
+            return 0
+
+    def run_batch(batch):
+        errors = []
+        for item in batch:
+            try:
+                operation(*item)
+            except (OSError, FileOperationError) as e:
+                errors.append(describe_os_error(action, item[0], e))
+        return errors
+
+    start = time.perf_counter()
+    batches = [items[i:i + FILE_BATCH_SIZE] for i in range(0, len(items), FILE_BATCH_SIZE)]
+    errors = list(itertools.chain.from_iterable(get_file_pool().map(run_batch, batches)))
+    for error in errors[:FILE_ERRORS_SHOWN]:
+        print(f"Error: {error}")
+    if len(errors) > FILE_ERRORS_SHOWN:
+        print(f"... and {len(errors) - FILE_ERRORS_SHOWN} more errors.")
+    done = len(items) - len(errors)
+    summary = done_message.format(done=done, total=len(items))
+    elapsed = time.perf_counter() - start
+    if errors:
+        print(f"{summary} ({len(errors)} failed, {elapsed:.3f}s).")
+    else:
+        print(f"{summary} ({elapsed:.3f}s).")
+    return done
+
+def create_file(path, content=""):
+    target_path = Path(path)
+    if target_path.exists():
+        raise FileOperationError(f"File '{path}' already exists. Use a different name or 'rmfile' first.")
+    target_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(target_path, 'x') as f: # 'x': never clobber a file created in the meantime
+        f.write(content)
+    forget_listing(path)
+    return f"File '{path}' created."
+
+def delete_file(path):
+    if not os.path.lexists(path):
+        raise FileOperationError(f"File '{path}' not found.")
+    if os.path.isdir(path) and not os.path.islink(path):
+        raise FileOperationError(f"'{path}' is a directory. Use 'rmdir' instead.")
+    os.unlink(path)
+    forget_listing(path)
+    return f"File '{path}' deleted."
+
+def create_directory(path):
+    os.makedirs(path, exist_ok=True)
+    forget_listing(path)
+    return f"Directory '{path}' created."
+
+def delete_directory(path):
+    if not os.path.exists(path):
+        raise FileOperationError(f"Directory '{path}' not found.")
+    if not os.path.isdir(path):
+        raise FileOperationError(f"'{path}' is a file. Use 'rmfile' instead.")
     try:
-        if not target_path.exists():
-            print(f"Error: Directory '{dirpath}' not found.")
+        os.rmdir(path)
+    except OSError as e:
+        if e.errno == errno.ENOTEMPTY:
+            raise FileOperationError(f"Directory '{path}' is not empty. Cannot delete with 'rmdir'.") from e
+        raise
+    forget_listing(path)
+    return f"Directory '{path}' deleted."
+
+def copy_file_data(source_fd, target_fd, size):
+    """
+    Copies size bytes between two open files inside the kernel: with copy_file_range
+    (which can also share blocks on file systems that support it), else sendfile, else
+    through a buffer.
+    """
+    copied = 0
+    for kernel_copy in (getattr(os, "copy_file_range", None), getattr(os, "sendfile", None)):
+        if kernel_copy is None:
+            continue
+        try:
+            while copied < size:
+                if kernel_copy is os.sendfile:
+                    sent = os.sendfile(target_fd, source_fd, copied, min(COPY_CHUNK_SIZE, size - copied))
+                else:
+                    sent = os.copy_file_range(source_fd, target_fd, min(COPY_CHUNK_SIZE, size - copied), copied, copied)
+                if sent == 0:
+                    break # The file shrank while copying
+                copied += sent
             return
-        if not target_path.is_dir():
-            print(f"Error: '{dirpath}' is a file. Use 'rmfile' instead.")
+        except OSError as e:
+            if copied or e.errno not in (errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTSUP):
+                raise
+    os.lseek(source_fd, 0, os.SEEK_SET)
+    os.lseek(target_fd, 0, os.SEEK_SET)
+    with open(source_fd, 'rb', closefd=False) as source, open(target_fd, 'wb', closefd=False) as target:
+        shutil.copyfileobj(source, target, READ_CHUNK_SIZE)
+
+def copy_file(source, target):
+    """
+    Copies the file source to target (overwritten if it exists), with its permission
+    bits. source may be in a mounted archive.
+    """
+    mounted = find_mount(source)
+    if mounted is not None:
+        with mounted[0].open(mounted[1]) as f, open(target, 'wb') as out:
+            shutil.copyfileobj(f, out, READ_CHUNK_SIZE)
+            if mounted[0].get(mounted[1]).kind == ENTRY_EXECUTABLE:
+                os.fchmod(out.fileno(), 0o755)
+        forget_listing(target)
+        return target
+    with open(source, 'rb') as f:
+        source_stat = os.fstat(f.fileno())
+        if os.path.exists(target) and os.path.samefile(source, target):
+            # Opening the target would truncate the source before anything is copied
+            raise FileOperationError(f"'{source}' and '{target}' are the same file.")
+        with open(target, 'wb') as out:
+            copy_file_data(f.fileno(), out.fileno(), source_stat.st_size)
+            os.fchmod(out.fileno(), source_stat.st_mode & 0o7777)
+    forget_listing(target) # Overwriting a file can change its mode, but not the directory's mtime
+    return target
+
+def copy_path(source, target, recursive=False):
+    kind = path_kind(source)
+    if kind is None:
+        raise FileOperationError(f"'{source}' not found.")
+    if find_mount(source) is None and os.path.exists(target) and os.path.samefile(source, target):
+        raise FileOperationError(f"'{source}' and '{target}' are the same file.")
+    if kind != ENTRY_DIRECTORY:
+        copy_file(source, target)
+        return f"Copied '{source}' to '{target}'."
+    if not recursive:
+        raise FileOperationError(f"'{source}' is a directory. Use 'cp -r' to copy it.")
+    if os.path.realpath(target).startswith(os.path.realpath(source) + os.sep):
+        raise FileOperationError(f"Cannot copy '{source}' into itself.")
+    if find_mount(source) is not None:
+        os.makedirs(target, exist_ok=True)
+        for entry in walk_tree(source):
+            entry_target = os.path.join(target, os.path.relpath(entry.path, source))
+            if entry.is_dir:
+                os.makedirs(entry_target, exist_ok=True)
+            else:
+                copy_file(entry.path, entry_target)
+    else:
+        shutil.copytree(source, target, symlinks=True, copy_function=copy_file, dirs_exist_ok=True)
+    return f"Copied '{source}' to '{target}'."
+
+def move_path(source, target):
+    if not os.path.lexists(source):
+        raise FileOperationError(f"'{source}' not found.")
+    if os.path.isdir(target) and not os.path.isdir(source):
+        raise FileOperationError(f"Cannot overwrite directory '{target}' with a file.")
+    try:
+        os.replace(source, target) # A rename: no data is copied
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(source, target, copy_function=copy_file) # Another file system
+    forget_listing(source)
+    forget_listing(target)
+    return f"Moved '{source}' to '{target}'."
+
+def copy_or_move_items(sources, destination):
+    """
+    Returns the (source, target) pairs for copying or moving sources to destination:
+    into it if it is a directory (which it must be for several sources), else onto it.
+    Raises FileOperationError.
+    """
+    if is_directory(destination):
+        return [(source, os.path.join(destination, os.path.basename(source.rstrip(os.sep)))) for source in sources]
+    if len(sources) > 1:
+        raise FileOperationError(f"Target '{destination}' is not a directory.")
+    return [(sources[0], destination)]
+
+# --- Recursive tree walking ---
+# walk_tree scans a directory tree with a pool of threads, one directory per task.
+# os.scandir releases the GIL while it waits on the filesystem, so several directories
+# are read at once. Results go through a bounded queue, so a slow consumer holds the
+# scanners back instead of letting results pile up in memory.
+# walk_tree yields directories in whatever order their scans finish, so find, whose
+# output the user reads, walks with walk_tree_sorted instead: sequential, in name order.
+WALK_WORKERS = int(os.environ.get("PYOS_WALK_WORKERS", 0)) or 8
+WALK_QUEUE_SIZE = 64 # Batches (one per directory) waiting to be consumed
+
+WalkEntry = collections.namedtuple("WalkEntry", ["path", "name", "is_dir", "size", "mtime", "depth"])
+
+def print_walk_error(path, error):
+    print(f"Warning: Cannot read '{path}': {error}", file=sys.stderr)
+
+def walk_tree(root, workers=None, on_error=print_walk_error):
+    """
+    Yields a WalkEntry for every file and directory below root (not root itself),
+    in no particular order. Symlinks are reported but never followed.
+    on_error(path, error) is called, on the consuming thread, for unreadable directories.
+    Walks inside a mounted archive if root is in one (but doesn't enter mounts on the way).
+    """
+    mounted = find_mount(root)
+    if mounted is not None:
+        yield from mounted[0].walk(mounted[1], os.fspath(root))
+        return
+    results = queue.Queue(WALK_QUEUE_SIZE)
+    lock = threading.Lock()
+    stopped = threading.Event()
+    pending = [1] # Directories submitted but not finished yet
+    pool = concurrent.futures.ThreadPoolExecutor(workers or WALK_WORKERS, thread_name_prefix="pyos-walk")
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def scan(path, depth):
+        try:
+            batch = []
+            subdirs = []
+            try:
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        try:
+                            is_dir = entry.is_dir(follow_symlinks=False)
+                            entry_stat = entry.stat(follow_symlinks=False)
+                        except OSError:
+                            continue # Entry vanished while scanning
+                        batch.append(WalkEntry(entry.path, entry.name, is_dir, entry_stat.st_size, entry_stat.st_mtime, depth + 1))
+                        if is_dir:
+                            subdirs.append(entry.path)
+            except OSError as e:
+                put((batch, path, e))
+                return
+            put((batch, None, None))
+            for subdir in subdirs:
+                with lock:
+                    pending[0] += 1
+                try:
+                    pool.submit(scan, subdir, depth + 1)
+                except RuntimeError:
+                    return # The walk was abandoned and the pool shut down
+        finally:
+            with lock:
+                pending[0] -= 1
+                finished = pending[0] == 0
+            if finished:
+                put(None)
+
+    pool.submit(scan, os.fspath(root), 0)
+    try:
+        while True:
+            item = results.get()
+            if item is None:
+                break
+            batch, error_path, error = item
+            yield from batch
+            if error is not None and on_error is not None:
+                on_error(error_path, error)
+    finally:
+        # Also reached when the consumer stops early: release blocked scanners
+        stopped.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def walk_tree_sorted(root, on_error=print_walk_error):
+    """
+    Like walk_tree, but walks on the calling thread and yields the entries of each
+    directory sorted by name, each subdirectory followed by its contents, so the
+    order is the same on every run.
+    """
+    mounted = find_mount(root)
+    if mounted is not None:
+        yield from mounted[0].walk(mounted[1], os.fspath(root))
+        return
+
+    def scan(path, depth):
+        try:
+            with os.scandir(path) as entries:
+                entries = sorted(entries, key=lambda entry: entry.name)
+        except OSError as e:
+            if on_error is not None:
+                on_error(path, e)
             return
-        
-        target_path.rmdir() # Deletes only if empty
-        print(f"Directory '{dirpath}' deleted.")
-    except OSError as e: # Catches errors like Directory not empty
-        if "Directory not empty" in str(e):
-            print(f"Error: Directory '{dirpath}' is not empty. Cannot delete with 'rmdir'.")
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+                entry_stat = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue # Entry vanished while scanning
+            yield WalkEntry(entry.path, entry.name, is_dir, entry_stat.st_size, entry_stat.st_mtime, depth + 1)
+            if is_dir:
+                yield from scan(entry.path, depth + 1)
+
+    yield from scan(os.fspath(root), 0)
+
+SIZE_UNITS = {"": 1, "k": 1024, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+def parse_size(text):
+    """
+    Parses a size like "100", "4k" or "2M" into a number of bytes.
+    """
+    if text and text[-1] in SIZE_UNITS:
+        return int(text[:-1]) * SIZE_UNITS[text[-1]]
+    return int(text)
+
+def format_size(size):
+    """
+    Formats a number of bytes for humans, e.g. 1536 -> "1.5K".
+    """
+    for unit in ("", "K", "M", "G"):
+        if size < 1024 or unit == "G":
+            return f"{size}" if unit == "" else f"{size:.1f}{unit}"
+        size /= 1024
+
+def parse_comparison(text, parse=int):
+    """
+    Parses "+N", "-N" or "N" into (sign, value): sign is 1 for "more than",
+    -1 for "less than" and 0 for "exactly".
+    """
+    if text.startswith("+"):
+        return 1, parse(text[1:])
+    if text.startswith("-"):
+        return -1, parse(text[1:])
+    return 0, parse(text)
+
+def matches_comparison(value, comparison):
+    sign, limit = comparison
+    if sign > 0:
+        return value > limit
+    if sign < 0:
+        return value < limit
+    return value == limit
+
+def find_files(root, name=None, entry_type=None, size=None, mtime_days=None):
+    """
+    Yields the WalkEntry of everything below root that matches all given filters:
+    name is a glob pattern, entry_type is "f" or "d", size is a comparison in bytes
+    and mtime_days a comparison in whole days since the last modification
+    (comparisons as returned by parse_comparison), in the order of walk_tree_sorted.
+    """
+    now = time.time()
+    for entry in walk_tree_sorted(root):
+        if entry_type == "f" and entry.is_dir or entry_type == "d" and not entry.is_dir:
+            continue
+        if name is not None and not fnmatch.fnmatch(entry.name, name):
+            continue
+        if size is not None and not matches_comparison(entry.size, size):
+            continue
+        if mtime_days is not None and not matches_comparison(int((now - entry.mtime) // 86400), mtime_days):
+            continue
+        yield entry
+
+def disk_usage(root, depth=1):
+    """
+    Adds up the size of the files below root, per directory down to depth levels.
+    Returns ({directory_path: total_bytes}, grand_total_bytes).
+    """
+    root = os.fspath(root)
+    totals = collections.defaultdict(int)
+    grand_total = 0
+    for entry in walk_tree(root):
+        if entry.is_dir:
+            if entry.depth <= depth:
+                totals[entry.path] += 0 # Show empty directories too
+            continue
+        grand_total += entry.size
+        # Credit the file to each of its ancestors down to the requested depth
+        parts = os.path.relpath(entry.path, root).split(os.sep)[:-1]
+        for level in range(1, min(depth, len(parts)) + 1):
+            totals[os.path.join(root, *parts[:level])] += entry.size
+    return totals, grand_total
+
+# --- Content search ---
+# grep with file arguments scans the files on a pool of GREP_WORKERS threads. Each
+# file is memory-mapped and the pattern run over the whole mapping, so only the
+# matching lines are ever turned into Python strings. Files with a NUL byte in their
+# first GREP_BINARY_CHECK bytes are treated as binary: only "Binary file ... matches"
+# is reported for them.
+# 'index <directory>' keeps a trigram index of the text files below a directory in
+# SEARCH_INDEX_PATH (SQLite): for every 3-byte sequence of lowercased content, the
+# files containing it, as a compressed bitmap of file ids; and for every file, its
+# trigrams. Updating it only re-reads files whose size or mtime changed, and only
+# rewrites the bitmaps of the trigrams those files had or now have. Ids of removed
+# files are given to new ones, so the bitmaps stay as short as the file count allows.
+# 'search <term>' looks up the files containing all the term's trigrams and only
+# scans those, so it doesn't have to read everything.
+GREP_WORKERS = int(os.environ.get("PYOS_GREP_WORKERS", 0)) or 8
+GREP_BINARY_CHECK = 8192
+SEARCH_INDEX_PATH = curr_dir / "_system" / "_searchindex.sqlite"
+SEARCH_MAX_FILE_SIZE = 32 * 1024 * 1024 # Bigger files are not indexed
+SEARCH_TRIGRAMS = re.compile(rb"(?=(...))", re.DOTALL)
+SEARCH_INDEX_VERSION = 2 # PRAGMA user_version; older indexes are rebuilt
+
+_grep_pool = None
+_grep_pool_lock = threading.Lock()
+_search_index_lock = threading.Lock()
+
+def get_grep_pool():
+    global _grep_pool
+    with _grep_pool_lock:
+        if _grep_pool is None:
+            _grep_pool = concurrent.futures.ThreadPoolExecutor(GREP_WORKERS, thread_name_prefix="pyos-grep")
+        return _grep_pool
+
+def count_newlines(data, start, end):
+    # mmap has no count(); slicing a chunk at a time keeps the copies small
+    count = 0
+    for chunk_start in range(start, end, READ_CHUNK_SIZE):
+        count += data[chunk_start:min(end, chunk_start + READ_CHUNK_SIZE)].count(b"\n")
+    return count
+
+def iter_matching_lines(data, regex, invert=False):
+    """
+    Yields (line_number, line_bytes) for the lines of data (bytes or mmap) that match
+    regex (a bytes pattern), or that don't with invert.
+    """
+    if invert:
+        start = 0
+        for line_number in itertools.count(1):
+            if start >= len(data):
+                return
+            end = data.find(b"\n", start)
+            if end == -1:
+                end = len(data)
+            line = data[start:end]
+            if regex.search(line) is None:
+                yield line_number, line
+            start = end + 1
+    line_number, counted_to, last_line_end = 1, 0, -1
+    for match in regex.finditer(data):
+        if match.start() <= last_line_end:
+            continue # Another match on a line already reported
+        line_start = data.rfind(b"\n", 0, match.start()) + 1
+        line_end = data.find(b"\n", match.end())
+        if line_end == -1:
+            line_end = len(data)
+        line_number += count_newlines(data, counted_to, line_start)
+        counted_to = line_start
+        last_line_end = line_end
+        yield line_number, data[line_start:line_end]
+
+def scan_file(path, regex, invert=False, files_only=False):
+    """
+    Returns the matches of regex in the file at path: a list of (line_number, line_text),
+    a list with a single (None, message) for binary files, errors and files_only.
+    """
+    try:
+        mounted = find_mount(path)
+        if mounted is not None:
+            with mounted[0].open(mounted[1]) as f:
+                data = f.read() # Archive members can't be mapped
         else:
-            print(f"An OS error occurred while deleting directory '{dirpath}': {e}", file=sys.stderr)
-    except PermissionError:
-        print(f"Error: Permission denied to delete directory '{dirpath}'.")
-    except Exception as e:
-        print(f"An unexpected error occurred while deleting directory '{dirpath}': {e}", file=sys.stderr)
+            with open(path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return []
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        binary = b"\0" in data[:GREP_BINARY_CHECK]
+        matches = iter_matching_lines(data, regex, invert)
+        try:
+            if binary or files_only:
+                if next(matches, None) is None:
+                    return []
+                return [(None, f"Binary file {path} matches" if binary and not files_only else path)]
+            return [(line_number, line.decode("utf-8", "replace")) for line_number, line in matches]
+        finally:
+            matches.close() # Releases the regex's hold on the mapping, so it can be closed
+            if isinstance(data, mmap.mmap):
+                data.close()
+    except (OSError, ValueError) as e: # ValueError: mmap of a file that shrank to nothing
+        return [(None, f"Warning: Cannot read '{path}': {getattr(e, 'strerror', None) or e}")]
+
+def iter_grep_files(paths, regex, invert=False, files_only=False, show_names=True):
+    """
+    Scans paths in parallel and yields the output lines of grep, file by file in order.
+    """
+    for path, matches in zip(paths, get_grep_pool().map(lambda path: scan_file(path, regex, invert, files_only), paths)):
+        for line_number, text in matches:
+            if line_number is None:
+                yield text
+            elif show_names:
+                yield f"{path}:{line_number}:{text}"
+            else:
+                yield f"{line_number}:{text}"
+
+def iter_grep_targets(paths, recursive):
+    """
+    Yields the files to scan for paths: files as they are, and with recursive, the
+    files below directories (which are otherwise reported and skipped).
+    """
+    for path in paths:
+        kind = path_kind(path)
+        if kind is None:
+            print(f"Error: '{path}' not found.")
+        elif kind != ENTRY_DIRECTORY:
+            yield path
+        elif recursive:
+            yield from (entry.path for entry in walk_tree(path) if not entry.is_dir)
+        else:
+            print(f"grep: '{path}' is a directory (use -r).")
+
+def open_search_index():
+    db = sqlite3.connect(str(SEARCH_INDEX_PATH), check_same_thread=False)
+    if db.execute("PRAGMA user_version").fetchone()[0] != SEARCH_INDEX_VERSION:
+        # Written by an older PyOS: start over, the next update rebuilds it
+        db.executescript("DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS trigrams;")
+        db.execute(f"PRAGMA user_version = {SEARCH_INDEX_VERSION}")
+    db.executescript("""
+        CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL,
+                                          size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL,
+                                          trigrams BLOB NOT NULL);
+        CREATE TABLE IF NOT EXISTS trigrams (trigram INTEGER PRIMARY KEY, files BLOB NOT NULL);
+    """)
+    return db
+
+def trigram_key(trigram):
+    return int.from_bytes(trigram, "big") # 3 bytes -> one integer, compact in SQLite
+
+def pack_file_ids(bitmap):
+    return zlib.compress(bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little"))
+
+def unpack_file_ids(blob):
+    return int.from_bytes(zlib.decompress(blob), "little")
+
+def file_ids_bitmap(file_ids):
+    bits = bytearray(max(file_ids) // 8 + 1)
+    for file_id in file_ids:
+        bits[file_id >> 3] |= 1 << (file_id & 7)
+    return int.from_bytes(bits, "little")
+
+def pack_trigrams(trigrams):
+    # Sorted 3-byte keys share prefixes, which zlib squeezes well
+    return zlib.compress(b"".join(key.to_bytes(3, "big") for key in sorted(trigrams)))
+
+def unpack_trigrams(blob):
+    data = zlib.decompress(blob)
+    return [int.from_bytes(data[i:i + 3], "big") for i in range(0, len(data), 3)]
+
+def free_file_ids(db):
+    """
+    Returns a heap of the file ids below the highest one that are not in use, so new
+    files fill the gaps left by removed ones and the bitmaps stay short.
+    """
+    used = [file_id for (file_id,) in db.execute("SELECT id FROM files ORDER BY id")]
+    free = sorted(set(range(1, used[-1])) - set(used)) if used else []
+    return free # A sorted list is already a heap
+
+def file_trigrams(path):
+    """
+    Returns the set of trigram keys of a file's lowercased content, or None if the
+    file is binary or can't be read.
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    if b"\0" in data[:GREP_BINARY_CHECK]:
+        return None
+    return set(map(trigram_key, set(SEARCH_TRIGRAMS.findall(data.lower()))))
+
+def update_search_index(root):
+    """
+    Brings the index up to date for the files below root. Returns a dict counting
+    the files added, updated, removed and unchanged.
+    """
+    root = os.path.realpath(root)
+    counts = dict.fromkeys(("added", "updated", "removed", "unchanged"), 0)
+    with _search_index_lock, contextlib.closing(open_search_index()) as db:
+        known = {path: (file_id, size, mtime_ns) for file_id, path, size, mtime_ns in
+                 db.execute("SELECT id, path, size, mtime_ns FROM files WHERE substr(path, 1, ?) = ?",
+                            (len(root) + 1, root + os.sep))}
+        changed = []
+        for entry in walk_tree(root, on_error=None):
+            if entry.is_dir or entry.size > SEARCH_MAX_FILE_SIZE:
+                continue
+            previous = known.pop(entry.path, None)
+            mtime_ns = int(entry.mtime * 1e9)
+            if previous is not None and previous[1:] == (entry.size, mtime_ns):
+                counts["unchanged"] += 1
+                continue
+            changed.append((entry.path, entry.size, mtime_ns, previous))
+        if not changed and not known:
+            return counts
+        # Reading and splitting the files happens on the pool; SQLite stays on this thread
+        trigram_sets = get_grep_pool().map(lambda item: file_trigrams(item[0]), changed)
+        stale = 0 # Bitmap of the files whose old trigrams must go
+        affected = set() # Trigrams whose posting lists change
+        added = collections.defaultdict(list) # Maps trigram -> ids of the files that now have it
+        free_ids = free_file_ids(db)
+        with db:
+            stale_ids = [previous[0] for path, size, mtime_ns, previous in changed if previous is not None]
+            stale_ids += [file_id for file_id, size, mtime_ns in known.values()] # Deleted since the last update
+            for file_id in stale_ids:
+                stale |= 1 << file_id
+                (blob,) = db.execute("SELECT trigrams FROM files WHERE id = ?", (file_id,)).fetchone()
+                affected.update(unpack_trigrams(blob))
+            for file_id, size, mtime_ns in known.values():
+                db.execute("DELETE FROM files WHERE id = ?", (file_id,))
+                heapq.heappush(free_ids, file_id)
+                counts["removed"] += 1
+            for (path, size, mtime_ns, previous), trigrams in zip(changed, trigram_sets):
+                trigrams = trigrams or ()
+                if previous is not None:
+                    file_id = previous[0]
+                    db.execute("UPDATE files SET size = ?, mtime_ns = ?, trigrams = ? WHERE id = ?",
+                               (size, mtime_ns, pack_trigrams(trigrams), file_id))
+                    counts["updated"] += 1
+                else:
+                    file_id = db.execute("INSERT INTO files (id, path, size, mtime_ns, trigrams) VALUES (?, ?, ?, ?, ?)",
+                                         (heapq.heappop(free_ids) if free_ids else None, path, size, mtime_ns,
+                                          pack_trigrams(trigrams))).lastrowid
+                    counts["added"] += 1
+                for trigram in trigrams:
+                    added[trigram].append(file_id)
+            affected.update(added)
+            # Only the affected posting lists are read and rewritten
+            keys = list(affected)
+            postings = {}
+            for start in range(0, len(keys), 500): # Stays below SQLite's limit on parameters
+                batch = keys[start:start + 500]
+                for trigram, blob in db.execute(f"SELECT trigram, files FROM trigrams WHERE trigram IN ({','.join('?' * len(batch))})", batch):
+                    postings[trigram] = unpack_file_ids(blob) & ~stale
+            for trigram, file_ids in added.items():
+                postings[trigram] = postings.get(trigram, 0) | file_ids_bitmap(file_ids)
+            db.executemany("DELETE FROM trigrams WHERE trigram = ?", ((trigram,) for trigram, bitmap in postings.items() if not bitmap))
+            db.executemany("INSERT OR REPLACE INTO trigrams VALUES (?, ?)",
+                           ((trigram, pack_file_ids(bitmap)) for trigram, bitmap in postings.items() if bitmap))
+    return counts
+
+def search_candidates(term, root):
+    """
+    Returns the indexed files below root that may contain term (case-insensitively):
+    those having all of its trigrams. Terms shorter than 3 bytes match every file.
+    """
+    root = os.path.realpath(root)
+    trigrams = {trigram_key(trigram) for trigram in SEARCH_TRIGRAMS.findall(term.encode().lower())}
+    with _search_index_lock, contextlib.closing(open_search_index()) as db:
+        if not trigrams:
+            rows = db.execute("SELECT path FROM files").fetchall()
+        else:
+            placeholders = ",".join("?" * len(trigrams))
+            postings = db.execute(f"SELECT files FROM trigrams WHERE trigram IN ({placeholders})", list(trigrams)).fetchall()
+            if len(postings) < len(trigrams): # Some trigram is in no file at all
+                return []
+            matching = functools.reduce(operator.and_, (unpack_file_ids(blob) for (blob,) in postings))
+            bits = bin(matching)[:1:-1] # Bit i (file id i) at index i
+            file_ids = [i for i, bit in enumerate(bits) if bit == "1"]
+            rows = []
+            for start in range(0, len(file_ids), 500):
+                batch = file_ids[start:start + 500]
+                rows += db.execute(f"SELECT path FROM files WHERE id IN ({','.join('?' * len(batch))})", batch)
+        return sorted(path for (path,) in rows if path.startswith(root + os.sep))
 
 # --- End New File and Directory Operations ---
 
-# --- Global dictionary to store shell variables ---
-_shell_variables = {}
+# --- Command history and completion ---
+# Every line typed at the console is appended to HISTORY_PATH, one per line, so the
+# history survives restarts and several PyOS instances can append to it at once.
+# Startup only reads the last HISTORY_LOAD_SIZE lines (for readline's up-arrow); the
+# whole file is read and indexed the first time 'history' or a '!' recall needs it:
+# a sorted list of the distinct lines for prefix lookups, and a map of trigram ->
+# ids of the lines containing it for substring lookups.
+# Lines running HISTORY_IGNORED_COMMANDS (login) are kept out of the file and out of
+# readline's history, since they contain passwords.
+# Tab completion (where readline is available) completes command names, @(variable)
+# names and paths. Command and variable names are kept in PrefixTries, updated as
+# commands are registered and variables set. Paths are found by binary search in the
+# sorted directory listings that lc caches (see get_directory_listing), so completing
+# in a directory with tens of thousands of entries takes a few comparisons once it
+# has been listed.
+HISTORY_PATH = Path(os.environ.get("PYOS_HISTORY") or curr_dir / "_system" / "_history")
+HISTORY_LOAD_SIZE = 1000 # Lines handed to readline at startup
+HISTORY_SHOWN = 20 # Default number of lines 'history' shows
+COMPLETION_LIMIT = 500 # Most completions offered for one word
+COMPLETION_DELIMITERS = " \t\n|>&"
+HISTORY_IGNORED_COMMANDS = ("login",) # Lines running these are never recorded: they contain passwords
+
+class PrefixTrie:
+    """
+    A set of strings that lists its members starting with a given prefix.
+    Each node is a dict of child nodes by character; the key None marks the end of a member.
+    """
+    __slots__ = ("root", "size")
+
+    def __init__(self, words=()):
+        self.root = {}
+        self.size = 0
+        for word in words:
+            self.add(word)
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, word):
+        node = self.find_node(word)
+        return node is not None and None in node
+
+    def find_node(self, prefix):
+        node = self.root
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return None
+        return node
+
+    def add(self, word):
+        node = self.root
+        for char in word:
+            node = node.setdefault(char, {})
+        if None not in node:
+            node[None] = True
+            self.size += 1
+
+    def discard(self, word):
+        path = []
+        node = self.root
+        for char in word:
+            child = node.get(char)
+            if child is None:
+                return
+            path.append((node, char))
+            node = child
+        if None not in node:
+            return
+        del node[None]
+        self.size -= 1
+        while path and not node: # Prune the branch it leaves empty
+            parent, char = path.pop()
+            del parent[char]
+            node = parent
+
+    def iter_prefix(self, prefix):
+        """
+        Yields the members starting with prefix, in sorted order.
+        """
+        node = self.find_node(prefix)
+        if node is None:
+            return
+        stack = [(prefix, node)]
+        while stack:
+            word, node = stack.pop()
+            if None in node:
+                yield word
+            children = sorted((char, child) for char, child in node.items() if char is not None)
+            stack.extend((word + char, child) for char, child in reversed(children))
+
+_command_names = PrefixTrie() # Names in _package_commands, kept in step by the register functions
+
+def line_trigrams(line):
+    return {line[i:i + 3] for i in range(len(line) - 2)}
+
+class CommandHistory:
+    """
+    The console's command history, kept in an append-only file. Entries are numbered
+    from 1, oldest first, as 'history' shows them.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = None # Opened for appending on the first new line
+        self.entries = None # Every line, oldest first; None until load()
+        self.lines = [] # Distinct lines, by id
+        self.line_ids = {} # Maps line -> id
+        self.last_entry = [] # Maps line id -> index in entries of its latest use
+        self.sorted_lines = [] # Distinct lines, sorted, for prefix lookups
+        self.trigrams = collections.defaultdict(list) # Maps trigram -> ids of the lines containing it
+
+    def read_tail(self, count):
+        """
+        Returns the last count lines of the file, reading it backwards from the end.
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                position = f.seek(0, io.SEEK_END)
+                data = b""
+                while position > 0 and data.count(b"\n") <= count:
+                    step = min(READ_CHUNK_SIZE, position)
+                    position -= step
+                    f.seek(position)
+                    data = f.read(step) + data
+        except FileNotFoundError:
+            return []
+        return data.decode("utf-8", "replace").splitlines()[-count:]
+
+    def load(self):
+        if self.entries is not None:
+            return
+        self.entries = []
+        try:
+            with open(self.path, 'r', encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    self.add_entry(line.rstrip("\n"))
+        except FileNotFoundError:
+            pass
+        self.sorted_lines.sort()
+
+    def add_entry(self, line, keep_sorted=False):
+        line_id = self.line_ids.get(line)
+        if line_id is None:
+            line_id = self.line_ids[line] = len(self.lines)
+            self.lines.append(line)
+            self.last_entry.append(0)
+            if keep_sorted:
+                bisect.insort(self.sorted_lines, line)
+            else:
+                self.sorted_lines.append(line) # load() sorts once at the end
+            for trigram in line_trigrams(line):
+                self.trigrams[trigram].append(line_id)
+        self.last_entry[line_id] = len(self.entries)
+        self.entries.append(line)
+
+    def append(self, line):
+        """
+        Adds a line to the history and to the file.
+        """
+        if self.entries is not None:
+            self.add_entry(line, keep_sorted=True)
+        try:
+            if self.file is None:
+                self.file = open(self.path, 'a', encoding="utf-8")
+            self.file.write(line + "\n")
+            self.file.flush()
+        except OSError as e:
+            print(f"Warning: Cannot write history to '{self.path}': {e.strerror}", file=sys.stderr)
+
+    def entry(self, number):
+        self.load()
+        return self.entries[number - 1] if 0 < number <= len(self.entries) else None
+
+    def recent(self, count):
+        """
+        Returns the last count entries as (number, line).
+        """
+        self.load()
+        start = max(0, len(self.entries) - count)
+        return [(i + 1, self.entries[i]) for i in range(start, len(self.entries))]
+
+    def find(self, text, prefix=False, count=1):
+        """
+        Returns the count most recently used distinct lines starting with (prefix) or
+        containing text, as (number of their latest entry, line), oldest first.
+        """
+        self.load()
+        if prefix:
+            start = bisect.bisect_left(self.sorted_lines, text)
+            end = bisect.bisect_left(self.sorted_lines, text + "\U0010ffff", start)
+            line_ids = [self.line_ids[line] for line in self.sorted_lines[start:end]]
+        else:
+            postings = [self.trigrams.get(trigram, ()) for trigram in line_trigrams(text)]
+            candidates = min(postings, key=len) if postings else range(len(self.lines))
+            line_ids = [line_id for line_id in candidates if text in self.lines[line_id]]
+        latest = heapq.nlargest(count, (self.last_entry[line_id] for line_id in line_ids))
+        return [(index + 1, self.entries[index]) for index in reversed(latest)]
+
+_history = CommandHistory(HISTORY_PATH)
+
+def recall_history(line):
+    """
+    Expands a '!' recall at the start of a console line: '!!' (the previous line),
+    '!N' (entry N), '!?text' (the latest line containing text) or '!prefix' (the
+    latest line starting with prefix). The rest of the line is kept after it.
+    Prints and returns the expanded line, or returns None if nothing matches.
+    """
+    word, separator, rest = line.partition(" ")
+    recall = word[1:]
+    if recall == "!":
+        found = _history.recent(1)
+    elif recall.isdigit():
+        entry = _history.entry(int(recall))
+        found = [(int(recall), entry)] if entry is not None else []
+    elif recall.startswith("?") and len(recall) > 1:
+        found = _history.find(recall[1:])
+    elif recall:
+        found = _history.find(recall, prefix=True)
+    else:
+        return line # A lone '!' is left alone
+    if not found:
+        print(f"Error: {word}: event not found")
+        return None
+    expanded = found[-1][1] + separator + rest
+    print(expanded)
+    return expanded
+
+def iter_path_completions(text):
+    """
+    Yields the paths completing text, directories with a trailing '/'. At most
+    COMPLETION_LIMIT are yielded per kind; the last one is always among them, so the
+    common prefix readline inserts is still right.
+    """
+    head, separator, prefix = text.rpartition("/")
+    directory = (head or "/") if separator else "."
+    try:
+        listing = get_directory_listing(resolve_path(directory))
+    except OSError:
+        return
+    text_head = head + separator
+    # Listings are sorted by name, directories first, so each kind is one sorted run
+    split = bisect.bisect_left(listing, True, key=lambda entry: entry[1] != ENTRY_DIRECTORY)
+    for low, high in ((0, split), (split, len(listing))):
+        start = bisect.bisect_left(listing, prefix, low, high, key=operator.itemgetter(0))
+        end = bisect.bisect_left(listing, prefix + "\U0010ffff", start, high, key=operator.itemgetter(0))
+        for i in itertools.chain(range(start, min(end, start + COMPLETION_LIMIT - 1)), range(max(start + COMPLETION_LIMIT - 1, end - 1), end)):
+            name, kind = listing[i]
+            yield text_head + name + ("/" if kind == ENTRY_DIRECTORY else "")
+
+def complete_line(line, begin, text):
+    """
+    Returns the completions of text, the word of line starting at index begin:
+    variable names after '@(', command names for the first word of a command,
+    and paths otherwise.
+    """
+    if "@(" in text:
+        head, marker, name = text.rpartition("@(")
+        names = itertools.islice(current_session().variable_names.iter_prefix(name), COMPLETION_LIMIT)
+        return [f"{head}@({name})" for name in names]
+    before = line[:begin].split()
+    if (not before or before[-1] in ("|", "&") or before[-1] in PREFIX_BUILTINS) and "/" not in text:
+        return list(itertools.islice(_command_names.iter_prefix(text), COMPLETION_LIMIT))
+    return list(iter_path_completions(text))
+
+readline = None # The readline module, once setup_line_editing has loaded it
+_completions = [] # The completions of the word being completed
+
+def readline_completer(text, state):
+    if state == 0:
+        _completions[:] = complete_line(readline.get_line_buffer(), readline.get_begidx(), text)
+        if len(_completions) == 1 and not _completions[0].endswith(("/", ")")):
+            _completions[0] += " " # A complete word; readline doesn't add the space itself
+    return _completions[state] if state < len(_completions) else None
+
+def setup_line_editing():
+    """
+    Turns on readline for the console: line editing, tab completion and the last
+    HISTORY_LOAD_SIZE lines of history. Does nothing where readline isn't available.
+    """
+    global readline
+    try:
+        import readline
+    except ImportError:
+        return
+    for line in _history.read_tail(HISTORY_LOAD_SIZE):
+        readline.add_history(line)
+    readline.set_completer(readline_completer)
+    readline.set_completer_delims(COMPLETION_DELIMITERS)
+    if "libedit" in (readline.__doc__ or ""): # macOS
+        readline.parse_and_bind("bind ^I rl_complete")
+    else:
+        readline.parse_and_bind("tab: complete")
+
+def read_console_line(line):
+    """
+    Expands '!' recalls in a line typed at the console and adds it to the history.
+    Returns the line to run, or None if there is nothing to run.
+    """
+    if line.startswith("!"):
+        expanded = recall_history(line)
+        # readline recorded the line as typed; keep what actually runs instead
+        replace_last_readline_item(expanded)
+        line = expanded
+    if line and is_ignored_in_history(line):
+        replace_last_readline_item(None)
+    elif line:
+        _history.append(line)
+    return line
+
+def is_ignored_in_history(line):
+    # Any word counts, so 'time login ...' and 'bg login ...' are caught too
+    return any(word in HISTORY_IGNORED_COMMANDS for word in line.split())
+
+def replace_last_readline_item(line):
+    """
+    Replaces the line readline added to its history last, or removes it if line is None.
+    """
+    if readline is None or readline.get_current_history_length() == 0:
+        return
+    position = readline.get_current_history_length() - 1
+    if line is None:
+        readline.remove_history_item(position)
+    else:
+        readline.replace_history_item(position, line)
+
+# --- Sessions ---
+# Everything that belongs to one user's shell lives in a Session: the working
+# directory, shell variables, logged-in user, background jobs and prompt. The
+# console is one session; server mode (see serve) runs one per connection in the
+# same process, all sharing the loaded commands and the password cache.
+# The session a command runs in is a context variable, so it follows the command
+# into the threads it starts (see start_job).
+class Session:
+    """
+    The state of one shell. cwd is None for the console, which uses (and changes)
+    the process's working directory; other sessions have a virtual one, which
+    builtins resolve their paths against (see resolve_path). Package commands
+    only see the process's working directory.
+    """
+    def __init__(self, cwd=None):
+        self.id = next(_session_ids)
+        self.cwd = cwd
+        self.variables = {} # Maps variable name -> value
+        self.variable_names = PrefixTrie() # For completing @(...)
+        # Changes on every change to variables, so cached expansions can be invalidated.
+        # Versions come from one counter shared by all sessions, so a version also
+        # identifies the session's variables (all sessions without any share 0).
+        self.variables_version = 0
+        self.user = None # Set by a successful 'login'
+        self.jobs = {} # Maps job id -> Job
+        self.prompt = None # Cached by get_prompt
+        self.started = time.time()
+
+_session_ids = itertools.count(1)
+_variables_versions = itertools.count(1)
+_console_session = Session()
+_current_session = contextvars.ContextVar("pyos_session", default=_console_session)
+_sessions = {_console_session.id: _console_session} # Maps session id -> Session, for 'who'
+
+def current_session():
+    return _current_session.get()
+
+def get_cwd():
+    """
+    Returns the working directory of the current session.
+    """
+    return current_session().cwd or os.getcwd()
+
+def resolve_path(path):
+    """
+    Returns path as seen from the current session's working directory. For the
+    console, that is path itself.
+    """
+    cwd = current_session().cwd
+    return path if cwd is None else os.path.join(cwd, path)
+
+def set_shell_variable(var_name, var_value):
+    """
+    Sets a shell variable of the current session. Always use this instead of writing
+    to the session's variables directly, so that the tokenization cache notices the change.
+    """
+    session = current_session()
+    session.variables[var_name] = var_value
+    session.variable_names.add(var_name)
+    session.variables_version = next(_variables_versions)
 
 def expand_variables(input_string):
     """
-    Replaces @(varname) with actual variable values from _shell_variables.
+    Replaces @(varname) with actual variable values from the current session.
     If a variable is not found, it's replaced with an empty string and a warning is printed.
     """
+    variables = current_session().variables
     def replace_var(match):
         var_name = match.group(1) # The content inside the parentheses
-        if var_name in _shell_variables:
-            return _shell_variables[var_name]
+        if var_name in variables:
+            return variables[var_name]
         else:
             print(f"Warning: Variable '{var_name}' not found. Replacing with empty string.", file=sys.stderr)
             return "" # Replace with empty string if variable is not defined
@@ -385,159 +2430,2035 @@ def expand_variables(input_string):
     # \w+ matches one or more word characters (alphanumeric + underscore)
     return re.sub(r'@\((\w+)\)', replace_var, input_string)
 
+# --- Tokenization cache ---
+# Scripts often repeat the same lines many times; caching the result of
+# expand_variables + shlex.split per line skips re-parsing them. Lines that use
+# @(...) are only reused while the session's variables are unchanged.
+# Note: a "variable not found" warning is printed once per variable store version,
+# not on every repetition of the line.
+_tokenize_cache = {} # Maps promptline -> (variables version or None, tokens)
+TOKENIZE_CACHE_SIZE = 4096
 
-def emulate(promptline):
-    # --- Pre-process the input for variable expansion ---
-    processed_promptline = expand_variables(promptline)
-    
-    tokens = shlex.split(processed_promptline)
-    if not tokens:
-        return
-    command = tokens[0]
-    args = tokens[1:]
-
-    # Example usage of verify_password within your emulate function or a login loop
-    if command == "login":
-        if len(args) == 2:
-            user_to_login = args[0]
-            pass_to_check = args[1]
-            if verify_password(user_to_login, pass_to_check):
-                print(f"Login successful for user: {user_to_login}")
-                # Here you would set the current logged-in user session
-            else:
-                print("Login failed: Incorrect username or password.")
-        else:
-            print("Usage: login <username> <password>")
-    # --- 'let' command for variable assignment ---
-    elif command == "let":
-        if len(args) == 1 and "=" in args[0]:
-            var_assignment = args[0].split('=', 1) # Split only on the first '='
-            var_name = var_assignment[0].strip()
-            var_value = var_assignment[1].strip()
-            _shell_variables[var_name] = var_value
-            print(f"Variable '{var_name}' set to '{var_value}'")
-        else:
-            print("Usage: let <varname>=<value>")
-    # --- 'vars' command to show current variables ---
-    elif command == "vars":
-        if _shell_variables:
-            print("Current shell variables:")
-            for var, val in _shell_variables.items():
-                print(f"  {var}='{val}'")
-        else:
-            print("No shell variables currently set.")
-    # --- Existing Commands ---
-    elif command == "lc": # New 'lc' command
-        if len(args) == 0:
-            list_content_colored(os.getcwd()) # List current directory
-        elif len(args) == 1:
-            list_content_colored(args[0]) # List specified directory
-        else:
-            print("Usage: lc [directory]")
-    elif command == "cd": # New 'cd' command
-        if len(args) == 1:
-            change_directory(args[0])
-        else:
-            print("Usage: cd <directory>")
-    elif command == "about": # New 'about' command with updated message
-        print("PyOS V1.1")
-        print("Copyright (C) 2025 Muser") # Using your provided copyright info
-        print("This program comes with ABSOLUTELY NO WARRANTY; for details type `show w'.")
-        print("This is free software, and you are welcome to redistribute it")
-        print("under certain conditions; type `show c' for details.")
-    elif command == "show": # New 'show' command to handle 'c' and 'w'
-        if len(args) == 1:
-            subcommand = args[0]
-            if subcommand == "c":
-                print("PyOS is free software: you can redistribute it and/or modify")
-                print("it under the terms of the GNU General Public License as published by")
-                print("the Free Software Foundation, either version 3 of the License, or")
-                print("(at your option) any later version.")
-                print("")
-                print("You should have received a copy of the GNU General Public License")
-                print("along with this program. If not, see <https://www.gnu.org/licenses/>.")
-            elif subcommand == "w":
-                # Full warranty disclaimer as provided
-                print("IN NO EVENT UNLESS REQUIRED BY APPLICABLE LAW OR AGREED TO IN WRITING WILL ANY COPYRIGHT HOLDER, OR ANY OTHER PARTY WHO MODIFIES AND/OR CONVEYS THE PROGRAM AS PERMITTED ABOVE, BE LIABLE TO YOU FOR DAMAGES, INCLUDING ANY GENERAL, SPECIAL, INCIDENTAL OR CONSEQUENTIAL DAMAGES ARISING OUT OF THE USE OR INABILITY TO USE THE PROGRAM (INCLUDING BUT NOT LIMITED TO LOSS OF DATA OR DATA BEING RENDERED INACCURATE OR LOSSES SUSTAINED BY YOU OR THIRD PARTIES OR A FAILURE OF THE PROGRAM TO OPERATE WITH ANY OTHER PROGRAMS), EVEN IF SUCH HOLDER OR OTHER PARTY HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH DAMAGES.")
-            else:
-                print("Usage: show <c|w>")
-        else:
-            print("Usage: show <c|w>")
-    # --- File and Directory Commands ---
-    elif command == "readfile":
-        if len(args) == 1:
-            read_file(args[0])
-        else:
-            print("Usage: readfile <filepath>")
-    elif command == "mkfile":
-        if len(args) == 1:
-            make_file(args[0]) # Create empty file
-        elif len(args) == 2:
-            make_file(args[0], args[1]) # Create file with content
-        else:
-            print("Usage: mkfile <filepath> [content]")
-    elif command == "rmfile":
-        if len(args) == 1:
-            remove_file(args[0])
-        else:
-            print("Usage: rmfile <filepath>")
-    elif command == "mkdir":
-        if len(args) == 1:
-            make_directory(args[0])
-        else:
-            print("Usage: mkdir <directory_path>")
-    elif command == "echo":
-        if args and args[0] == "-e": # Added 'args and' for robustness against empty 'args'
-            myargs = args[1:]
-            newargs = []
-            for arg in myargs:
-                arg = arg.replace("\\e", "\033")
-                arg = arg.replace("\\n", "\n")
-                arg = arg.replace("\\t", "\t") 
-                arg = arg.replace("\\r", "\r") 
-                arg = arg.replace("\\\\", "\\")
-                newargs.append(arg)
-            print(" ".join(newargs))
-        else:
-            print(" ".join(args))
-    elif command == "rmdir":
-        if len(args) == 1:
-            remove_directory(args[0])
-        else:
-            print("Usage: rmdir <directory_path>")
-    # --- End File and Directory Commands ---
-    elif command == "gum": # Command for gum package manager
-        if len(args) == 1:
-            if checkforpackagemanager() == 1:
-                print("Gum not properly installed.")
-            else:
-                gum.installpkg(args[0])
+def tokenize(promptline):
+    """
+    Expands variables in promptline and splits it into tokens, using the cache when possible.
+    Returns a list of tokens, which the caller may modify.
+    """
+    version = current_session().variables_version if "@(" in promptline else None
+    cached = _tokenize_cache.get(promptline)
+    if cached is not None and cached[0] == version:
+        return list(cached[1])
+
+    start = time.perf_counter_ns()
+    expanded = expand_variables(promptline)
+    record_phase("expand", time.perf_counter_ns() - start)
+    if "|" in expanded or ">" in expanded or expanded.rstrip().endswith("&"):
+        tokens = split_pipeline_tokens(expanded)
+    else:
+        tokens = shlex.split(expanded)
+    if len(_tokenize_cache) >= TOKENIZE_CACHE_SIZE:
+        _tokenize_cache.clear() # Crude but cheap bound on memory
+    _tokenize_cache[promptline] = (version, tuple(tokens))
+    return tokens
+
+# --- Pipelines and redirection ---
+# "cmd1 args | cmd2 args > file" connects commands with generators: each stage pulls
+# lines from the previous one only as it needs them, so nothing is buffered beyond a
+# line per stage. Commands with a stream function (see ShellCommand) take part in
+# pipelines directly. Commands that just print run in a thread whose prints go into a
+# bounded pipe (PIPE_BUFFER_LINES), which the next stage reads from; they ignore
+# their input. ">" and ">>" write or append the last stage's output to a file.
+PIPE_BUFFER_LINES = 1024
+PIPE_BATCH_SIZE = 512 # Lines per write when writing pipeline output
+PIPELINE_OPERATORS = ("|", ">", ">>")
+
+def split_pipeline_tokens(line):
+    """
+    Like shlex.split, but also splits '|', '>' and '>>' into tokens of their own, even
+    without surrounding spaces, and a final unquoted '&' (run in the background). An '&'
+    anywhere else stays part of its word, as in "http://host/?a=1&b=2".
+    (A quoted "|" or ">" on its own is read as an operator too.)
+    """
+    background = line.rstrip().endswith("&") and lex_punctuation(line, "&")[-1:] == ["&"]
+    if background:
+        line = line.rstrip()[:-1]
+    tokens = lex_punctuation(line, "|>")
+    if background:
+        tokens.append("&")
+    return tokens
+
+def lex_punctuation(line, punctuation_chars):
+    lexer = shlex.shlex(line, posix=True, punctuation_chars=punctuation_chars)
+    lexer.whitespace_split = True
+    lexer.commenters = ""
+    return list(lexer)
+
+def parse_pipeline(tokens):
+    """
+    Splits tokens into pipeline stages. Returns ([(command, args), ...], redirect),
+    where redirect is None or (mode, path) with mode 'w' for '>' and 'a' for '>>'.
+    Raises ValueError on a syntax error.
+    """
+    stages = []
+    redirect = None
+    current = []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token == "|":
+            if not current or redirect is not None:
+                raise ValueError("syntax error near '|'")
+            stages.append((current[0], current[1:]))
+            current = []
+        elif token in (">", ">>"):
+            if not current or i + 1 >= len(tokens) or tokens[i + 1] in PIPELINE_OPERATORS or i + 2 != len(tokens):
+                raise ValueError(f"syntax error near '{token}'")
+            redirect = ('w' if token == ">" else 'a', tokens[i + 1])
+            break
+        elif set(token) <= set("|>&"):
+            raise ValueError(f"syntax error near '{token}'")
         else:
-            print("Usage: gum <package_url>")
-    elif command == "pwd":
-        print(os.getcwd())
-    # --- Check for package commands before 'Unknown command' ---
-    elif command in _package_commands:
-        _package_commands[command](args) # Call the registered package handler
-    # --- End NEW package command check ---
-    else: # This 'else' block will now only be reached if it's NOT an internal or package command
-        print(f"Unknown command: {command}")
+            current.append(token)
+        i += 1
+    if not current:
+        raise ValueError("syntax error: missing command")
+    stages.append((current[0], current[1:]))
+    return stages, redirect
 
-# Example of how you might use it in a main loop
-if __name__ == "__main__":
-    if not checkforbuild():
-        print("PyOS is not built. Please run build.sh first.")
-        sys.exit(1)
+def write_lines(lines, f, batch_size=PIPE_BATCH_SIZE):
+    """
+    Writes an iterable of lines (without newlines) to the text file f, in batches.
+    """
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= batch_size:
+            f.write("\n".join(batch) + "\n")
+            batch.clear()
+    if batch:
+        f.write("\n".join(batch) + "\n")
+    f.flush()
+
+def iter_text_lines(pieces):
+    """
+    Regroups pieces of text into lines (without newlines).
+    """
+    partial = ""
+    for piece in pieces:
+        lines = (partial + piece).split("\n")
+        partial = lines.pop()
+        yield from lines
+    if partial:
+        yield partial
+
+# Where stdout and stderr go in threads that haven't redirected them themselves.
+# Server sessions set them to their client, and the threads their commands start
+# (pipeline stages, jobs, gum's downloads) inherit them along with the rest of the
+# session's context.
+_context_stdout = contextvars.ContextVar("pyos_stdout", default=None)
+_context_stderr = contextvars.ContextVar("pyos_stderr", default=None)
+
+class ThreadLocalStdout:
+    """
+    Stand-in for sys.stdout that writes to a per-thread target when one is set
+    (see redirect_thread_stdout), and to the real stdout otherwise. This lets a
+    command's prints be captured on its own thread without affecting other threads.
+    context_target is an optional context variable holding a target to use when the
+    thread has none.
+    """
+    def __init__(self, default, context_target=None):
+        self.default = default
+        self.local = threading.local()
+        self.context_target = context_target
+
+    def target(self):
+        target = getattr(self.local, "target", None)
+        if target is None and self.context_target is not None:
+            target = self.context_target.get()
+        return target or self.default
+
+    def write(self, text):
+        return self.target().write(text)
+
+    def flush(self):
+        self.target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self.target(), name)
+
+def install_thread_local_stdout():
+    if not isinstance(sys.stdout, ThreadLocalStdout):
+        sys.stdout = ThreadLocalStdout(sys.stdout, _context_stdout)
+    return sys.stdout
+
+def install_thread_local_stderr():
+    if not isinstance(sys.stderr, ThreadLocalStdout):
+        sys.stderr = ThreadLocalStdout(sys.stderr, _context_stderr)
+    return sys.stderr
+
+@contextlib.contextmanager
+def redirect_thread_stdout(target, stderr=False):
+    """
+    Sends the current thread's prints to target while the body runs.
+    With stderr=True, prints to sys.stderr go there too.
+    """
+    proxies = [install_thread_local_stdout()]
+    if stderr:
+        proxies.append(install_thread_local_stderr())
+    previous = [getattr(proxy.local, "target", None) for proxy in proxies]
+    for proxy in proxies:
+        proxy.local.target = target
+    try:
+        yield target
+    finally:
+        for proxy, target in zip(proxies, previous):
+            proxy.local.target = target
+
+class Pipe:
+    """
+    Bounded line buffer between a printing command (writing through it as a file)
+    and the next pipeline stage (iterating over it).
+    """
+    _END = object()
+
+    def __init__(self, size=PIPE_BUFFER_LINES):
+        self.lines = queue.Queue(size)
+        self.partial = ""
+        self.reader_closed = threading.Event()
+
+    # Writer side
+    def write(self, text):
+        lines = (self.partial + text).split("\n")
+        self.partial = lines.pop()
+        for line in lines:
+            self.put(line)
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def put(self, item):
+        while not self.reader_closed.is_set():
+            try:
+                self.lines.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+        raise BrokenPipeError("the next pipeline stage stopped reading")
+
+    def close_writer(self):
+        try:
+            if self.partial:
+                self.put(self.partial)
+            self.put(self._END)
+        except BrokenPipeError:
+            pass
+
+    # Reader side
+    def __iter__(self):
+        try:
+            while True:
+                line = self.lines.get()
+                if line is self._END:
+                    return
+                yield line
+        finally:
+            self.reader_closed.set()
+
+def iter_captured_output(handler, args):
+    """
+    Runs a printing command on its own thread and yields the lines it prints.
+    """
+    pipe = Pipe()
+
+    def run():
+        with redirect_thread_stdout(pipe):
+            try:
+                handler(args)
+            except BrokenPipeError:
+                pass # The next stage has finished; stop quietly
+            except Exception as e:
+                print(f"An unexpected error occurred: {e}", file=sys.stderr)
+            finally:
+                pipe.close_writer()
+
+    install_thread_local_stdout()
+    threading.Thread(target=contextvars.copy_context().run, args=(run,), name="pyos-pipe", daemon=True).start() # In the same session
+    yield from pipe
+
+def open_stage(handler, args, stdin):
+    """
+    Starts one pipeline stage. Returns an iterator over its output lines.
+    """
+    if isinstance(handler, ShellCommand) and handler.stream is not None:
+        return handler.open_stream(args, stdin)
+    if stdin is not None and hasattr(stdin, "close"):
+        stdin.close() # This command does not read its input; stop the previous stage
+    return iter_captured_output(handler, args)
+
+def run_pipeline(tokens):
+    """
+    Runs a command line containing '|', '>' or '>>'.
+    """
+    try:
+        stages, redirect = parse_pipeline(tokens)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+
+    handlers = []
+    for command, args in stages:
+        handler = _package_commands.get(command)
+        if isinstance(handler, LazyPackageCommand):
+            handler = handler.resolve() # Needed to know whether it can stream
+        if handler is None:
+            print(f"Unknown command: {command}")
+            return
+        if not (isinstance(handler, ShellCommand) and handler.stream is not None):
+            handler = sandboxed(command, handler)
+        handlers.append(handler)
+
+    if redirect is not None:
+        mode, path = redirect
+        if not check_writable(resolve_path(path)):
+            return
+        try:
+            output = open(resolve_path(path), mode)
+        except OSError as e:
+            print(f"Error: Cannot open '{path}' for writing: {e}")
+            return
+    else:
+        output = contextlib.nullcontext(sys.stdout)
+
+    with output as f:
+        stream = None
+        for handler, (command, args) in zip(handlers, stages):
+            stream = open_stage(handler, args, stream)
+        try:
+            write_lines(stream, f)
+        finally:
+            if hasattr(stream, "close"):
+                stream.close() # Unblocks any stage still producing output
+
+
+# --- Forker ---
+# Job processes and sandbox workers are forked by the forker, a process forked from
+# the shell while it has no other threads, instead of from whichever shell thread
+# needs one: a fork only copies the thread calling it, so the child would keep any
+# lock another thread held at that moment (the import lock, _stats_lock, the password
+# database's...) locked forever. The server starts the forker before its threads, the
+# console with PYOS_SANDBOX=1 at startup, and otherwise the first command needing it
+# (from the console's main thread). The forker's children start from the shell as it
+# was then: they are told the working directory, user and command they need.
+_forker = None
+_forker_lock = threading.Lock()
+
+def wait_for_child(pid, timeout, exited):
+    """
+    Waits up to timeout seconds (None: for as long as it takes) for the child pid to
+    exit. Returns its exit code (-N if signal N killed it), or None if it is still
+    running. exited maps the pids of children already waited for to their exit codes.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while pid not in exited:
+        done, status = os.waitpid(pid, 0 if deadline is None else os.WNOHANG)
+        if done:
+            exited[pid] = os.waitstatus_to_exitcode(status)
+        elif time.monotonic() >= deadline:
+            return None
+        else:
+            time.sleep(0.01)
+    return exited[pid]
+
+def forker_main(connection, shell_end):
+    # Runs in the forker: forks children, and stops and waits for them
+    shell_end.close() # Else the forker would keep its own connection open
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # Ctrl+C is the shell's to handle
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit()) # Sent when the shell exits
+    exited = {}
+    children = set()
+    try:
+        serve_forker_requests(connection, exited, children)
+    finally:
+        for pid in children - exited.keys(): # Job processes don't notice the shell going
+            with contextlib.suppress(OSError):
+                os.kill(pid, signal.SIGTERM)
+
+def serve_forker_requests(connection, exited, children):
+    while True:
+        try:
+            request, pid, target, args = connection.recv()
+        except EOFError:
+            return # The shell has gone
+        if request == "fork":
+            shell_connection, child_connection = multiprocessing.Pipe()
+            pid = os.fork()
+            if pid == 0:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                connection.close()
+                shell_connection.close()
+                exitcode = 1
+                try:
+                    target(child_connection, *args)
+                    exitcode = 0
+                except SystemExit as e:
+                    exitcode = e.code if isinstance(e.code, int) else int(e.code is not None)
+                finally:
+                    os._exit(exitcode)
+            child_connection.close()
+            children.add(pid)
+            connection.send(pid)
+            multiprocessing.reduction.send_handle(connection, shell_connection.fileno(), pid)
+            shell_connection.close()
+        elif request == "wait":
+            connection.send(wait_for_child(pid, 1, exited))
+        elif request == "stop":
+            exitcode = wait_for_child(pid, 0, exited)
+            if exitcode is None:
+                os.kill(pid, signal.SIGTERM)
+                exitcode = wait_for_child(pid, 1, exited)
+            if exitcode is None:
+                os.kill(pid, signal.SIGKILL) # Only if it was stuck somewhere that blocks SIGTERM
+                exitcode = wait_for_child(pid, None, exited)
+            del exited[pid]
+            children.discard(pid)
+            connection.send(exitcode)
+
+class Forker:
+    """
+    The forker process, and the shell's end of the pipe to it.
+    """
+    def __init__(self):
+        context = multiprocessing.get_context("fork")
+        self.connection, forker_connection = context.Pipe()
+        self.process = context.Process(target=forker_main, args=(forker_connection, self.connection), name="pyos-forker", daemon=True)
+        self.process.start()
+        forker_connection.close()
+        self.lock = threading.Lock() # One request at a time
+
+    def request(self, request, pid=None, target=None, args=()):
+        self.connection.send((request, pid, target, args))
+        return self.connection.recv()
+
+    def fork(self, target, *args):
+        """
+        Forks a child running target(connection, *args), where connection is the
+        other end of the connection returned. Returns (pid, connection).
+        """
+        with self.lock:
+            pid = self.request("fork", target=target, args=args)
+            handle = multiprocessing.reduction.recv_handle(self.connection)
+        return pid, multiprocessing.connection.Connection(handle)
+
+    def wait(self, pid):
+        """
+        Returns the exit code of the child pid, or None if it hasn't exited within a second.
+        """
+        with self.lock:
+            return self.request("wait", pid)
+
+    def stop(self, pid):
+        """
+        Terminates the child pid (unless it has exited) and returns its exit code.
+        """
+        with self.lock:
+            return self.request("stop", pid)
+
+def fork_available():
+    return "fork" in multiprocessing.get_all_start_methods()
+
+def start_forker():
+    """
+    Returns the forker, starting it if it isn't running.
+    """
+    global _forker
+    with _forker_lock:
+        if _forker is None:
+            _forker = Forker()
+        return _forker
+
+# --- Background jobs ---
+# "cmd args &" (or "bg cmd args") runs a command line as a job on a worker pool of
+# JOB_WORKERS threads, with its output captured instead of printed. Commands
+# registered as cpu_bound run in a forked process of their own instead, so a heavy
+# package command doesn't hold the GIL while the shell waits for input.
+# Jobs can have a timeout (PYOS_JOB_TIMEOUT sets the default, in seconds).
+# Each session has its own jobs (Session.jobs); they run in the session that started them.
+# Threads can't be stopped from outside: a killed or timed out thread job is marked
+# as such right away, and is stopped the next time it prints. Process jobs are
+# terminated by their monitor thread, which checks every 0.1s.
+JOB_WORKERS = int(os.environ.get("PYOS_JOB_WORKERS", 0)) or 4
+JOB_TIMEOUT = float(os.environ.get("PYOS_JOB_TIMEOUT", 0)) or None
+JOB_OUTPUT_LINES = 10000 # Only the last lines of a job's output are kept
+
+_job_ids = itertools.count(1)
+_job_pool = None
+_jobs_lock = threading.Lock()
+
+class JobStopped(Exception):
+    """
+    Raised inside a thread job when it prints after being killed or timing out.
+    """
+
+class Job:
+    """
+    A background job. Also serves as the file its output is written to.
+    """
+    def __init__(self, job_id, tokens, timeout=None):
+        self.id = job_id
+        self.command_line = " ".join(token if token in PIPELINE_OPERATORS else shlex.quote(token) for token in tokens)
+        self.tokens = tokens
+        self.timeout = timeout
+        self.status = "running"
+        self.started = time.monotonic()
+        self.finished = None
+        self.output = collections.deque(maxlen=JOB_OUTPUT_LINES)
+        self.partial = ""
+        self.done = threading.Event()
+        self.reported = False
+        self.future = None
+        self.pid = None # Of a process job
+
+    def write(self, text):
+        if self.status != "running":
+            raise JobStopped()
+        lines = (self.partial + text).split("\n")
+        self.partial = lines.pop()
+        self.output.extend(lines)
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def finish(self, status):
+        """
+        Sets the final status, unless the job was already stopped (killed, timed out).
+        """
+        with _jobs_lock:
+            if self.status == "running":
+                self.status = status
+            if self.finished is None:
+                self.finished = time.monotonic()
+            if self.partial:
+                self.output.append(self.partial)
+                self.partial = ""
+        self.done.set()
+
+    def elapsed(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    def describe(self):
+        return f"[{self.id}] {self.status:<10} {self.elapsed():8.2f}s  {self.command_line}"
+
+def get_job_pool():
+    global _job_pool
+    with _jobs_lock:
+        if _job_pool is None:
+            _job_pool = concurrent.futures.ThreadPoolExecutor(JOB_WORKERS, thread_name_prefix="pyos-job")
+        return _job_pool
+
+def wants_process(tokens):
+    """
+    True if tokens is a single command registered as cpu_bound.
+    """
+    if "|" in tokens or ">" in tokens or ">>" in tokens:
+        return False
+    handler = _package_commands.get(tokens[0])
+    if isinstance(handler, LazyPackageCommand):
+        handler = handler.resolve()
+    return getattr(handler, "cpu_bound", False) and fork_available()
+
+def start_job(tokens, timeout=None, use_process=None):
+    """
+    Starts tokens as a background job and returns it. timeout defaults to JOB_TIMEOUT;
+    use_process defaults to whether the command is cpu_bound.
+    """
+    job = Job(next(_job_ids), list(tokens), timeout or JOB_TIMEOUT)
+    with _jobs_lock:
+        current_session().jobs[job.id] = job
+    if use_process is None:
+        use_process = wants_process(job.tokens)
+    if use_process:
+        # The monitor thread doesn't occupy a worker: it only waits on the process
+        forker = start_forker() # From this thread, before the monitor thread exists
+        threading.Thread(target=contextvars.copy_context().run, args=(run_job_in_process, job, forker),
+                         name=f"pyos-job-{job.id}", daemon=True).start()
+    else:
+        install_thread_local_stdout()
+        job.future = get_job_pool().submit(contextvars.copy_context().run, run_job_in_thread, job)
+        if job.timeout:
+            timer = threading.Timer(job.timeout, stop_job, (job, "timed out"))
+            timer.daemon = True
+            timer.start()
+    print(f"[{job.id}] started: {job.command_line}")
+    return job
+
+def run_job_in_thread(job):
+    if job.status != "running":
+        return # Killed before it got a worker
+    with redirect_thread_stdout(job):
+        try:
+            run_tokens(job.tokens)
+        except JobStopped:
+            pass
+        except Exception as e:
+            try:
+                print(f"An unexpected error occurred: {e}")
+            except JobStopped:
+                pass
+            job.finish("failed")
+            return
+    job.finish("done")
+
+class ConnectionWriter:
+    """
+    File object sending everything written to it over a multiprocessing connection.
+    With a tag, it sends (tag, text) instead of just the text.
+    """
+    def __init__(self, connection, tag=None):
+        self.connection = connection
+        self.tag = tag
+
+    def write(self, text):
+        self.connection.send(text if self.tag is None else (self.tag, text))
+        return len(text)
+
+    def flush(self):
+        pass
+
+def job_process_main(connection, tokens, cwd, user):
+    # Runs in the job process, forked by the forker
+    global _sandbox_enabled
+    _sandbox_enabled = False # The sandbox pool belongs to the shell process
+    session = current_session()
+    session.user = user
+    with contextlib.suppress(OSError):
+        os.chdir(cwd)
+    sys.stdout = ConnectionWriter(connection)
+    try:
+        run_tokens(tokens)
+    except Exception as e:
+        print(f"An unexpected error occurred: {e}")
+        sys.exit(1)
+    finally:
+        connection.close()
+
+def run_job_in_process(job, forker):
+    job.pid, reader = forker.fork(job_process_main, job.tokens, get_cwd(), current_session().user)
+    try:
+        while job.status == "running":
+            if job.timeout and job.elapsed() > job.timeout:
+                stop_job(job, "timed out")
+                break
+            if reader.poll(0.1):
+                try:
+                    job.write(reader.recv())
+                except EOFError:
+                    break
+    except JobStopped:
+        pass
+    finally:
+        reader.close()
+        try:
+            if job.status == "running":
+                while forker.wait(job.pid) is None: # It has closed its end of the pipe, so it is exiting
+                    pass
+            exitcode = forker.stop(job.pid)
+        except (EOFError, OSError):
+            exitcode = None # The shell is exiting, and the forker (which stops the job) with it
+    job.finish("done" if exitcode == 0 else "failed")
+
+def stop_job(job, status="killed"):
+    """
+    Stops a running job, marking it with status. Returns False if it had already ended.
+    """
+    with _jobs_lock:
+        if job.status != "running":
+            return False
+        job.status = status
+        job.finished = time.monotonic()
+    if job.future is not None:
+        job.future.cancel() # Only works if it hasn't started yet
+    job.done.set() # Don't make 'wait' hang on a thread that may never print again
+    return True
+
+def find_jobs(args):
+    """
+    Returns the jobs named by args (job ids), or all jobs if args is empty.
+    Prints an error and returns None for an unknown id.
+    """
+    jobs = current_session().jobs
+    if not args:
+        return list(jobs.values())
+    selected = []
+    for arg in args:
+        job = jobs.get(int(arg)) if arg.isdigit() else None
+        if job is None:
+            print(f"Error: No such job '{arg}'.")
+            return None
+        selected.append(job)
+    return selected
+
+def report_finished_jobs():
+    """
+    Prints one line for each job that finished since the last report.
+    Called by the main loop before showing the prompt.
+    """
+    for job in list(current_session().jobs.values()):
+        if job.done.is_set() and not job.reported:
+            job.reported = True
+            print(job.describe())
+
+# --- Package command sandbox ---
+# With the sandbox on ('sandbox on', or PYOS_SANDBOX=1), package commands don't run
+# in the shell process but in one of SANDBOX_WORKERS worker processes, forked by the
+# forker (see Forker). Workers import every package as soon as they start, so
+# commands don't wait for imports. A command is sent to an idle worker over a pipe,
+# and its output streamed back.
+# Each command gets SANDBOX_TIMEOUT seconds of wall time, SANDBOX_CPU_LIMIT seconds of
+# CPU (RLIMIT_CPU) and SANDBOX_MEMORY_LIMIT more bytes of address space (RLIMIT_AS).
+# A worker that breaks a limit or dies is replaced by a fresh one, and so is a worker
+# whose resident memory grew by more than SANDBOX_RECYCLE_GROWTH since it started
+# (a leaking package). That way a misbehaving package can't hang, bloat or slow down
+# the shell. Builtins always run in the shell, and so do package commands streaming
+# in a pipeline, since their input comes from the shell's other stages.
+SANDBOX_WORKERS = int(os.environ.get("PYOS_SANDBOX_WORKERS", 0)) or 2
+SANDBOX_TIMEOUT = float(os.environ.get("PYOS_SANDBOX_TIMEOUT", 0)) or 30.0
+SANDBOX_CPU_LIMIT = int(os.environ.get("PYOS_SANDBOX_CPU", 0)) or 10 # Seconds
+SANDBOX_MEMORY_LIMIT = (int(os.environ.get("PYOS_SANDBOX_MEMORY", 0)) or 1024) * 1024 * 1024 # Set in MB
+SANDBOX_RECYCLE_GROWTH = 256 * 1024 * 1024
+
+_sandbox_enabled = os.environ.get("PYOS_SANDBOX", "0") == "1" # Changed by 'sandbox on|off'
+_sandbox_pool = None
+_sandbox_lock = threading.Lock()
+
+def process_memory():
+    """
+    Returns (address space size, resident size) of this process in bytes. The address
+    space size is None, and the resident size the peak, where /proc isn't available.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            size, resident = f.read().split()[:2]
+        return int(size) * mmap.PAGESIZE, int(resident) * mmap.PAGESIZE
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return None, peak if sys.platform == "darwin" else peak * 1024 # Bytes on macOS, KB elsewhere
+
+def set_soft_limit(which, value):
+    hard = resource.getrlimit(which)[1]
+    resource.setrlimit(which, (value if hard == resource.RLIM_INFINITY else min(value, hard), hard))
+
+def sandbox_worker_main(connection):
+    # Runs in a forked sandbox worker
+    global _sandbox_enabled
+    _sandbox_enabled = False # Commands run right here
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # Ctrl+C is the shell's to handle
+    set_soft_limit(resource.RLIMIT_CORE, 0) # Hitting the CPU limit shouldn't leave core files
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+        # Import errors are reported when a command of the package is run
+        for handler in list(_package_commands.values()):
+            if isinstance(handler, LazyPackageCommand):
+                handler.resolve()
+    sys.stdout = ConnectionWriter(connection)
+    sys.stderr = ConnectionWriter(connection, "stderr")
+    connection.send(("ready", process_memory()[1]))
+    while True:
+        try:
+            command, args, cwd = connection.recv()
+        except EOFError:
+            return # The shell has gone
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        set_soft_limit(resource.RLIMIT_CPU, math.ceil(usage.ru_utime + usage.ru_stime) + SANDBOX_CPU_LIMIT)
+        address_space = process_memory()[0]
+        if address_space is not None:
+            set_soft_limit(resource.RLIMIT_AS, address_space + SANDBOX_MEMORY_LIMIT)
+        with contextlib.suppress(OSError):
+            os.chdir(cwd)
+        status = "ok"
+        try:
+            handler = _package_commands.get(command)
+            if isinstance(handler, LazyPackageCommand):
+                handler = handler.resolve()
+            if handler is None:
+                print(f"Unknown command: {command}")
+            else:
+                handler(args)
+        except MemoryError:
+            status = "out of memory"
+        except SystemExit:
+            pass
+        except Exception as e:
+            print(f"An unexpected error occurred: {e}", file=sys.stderr)
+        connection.send(("done", status, process_memory()[1]))
+        if status != "ok":
+            return # Whatever it was doing may have left the worker in a bad state
+
+class SandboxWorker:
+    """
+    A sandbox worker process, and the shell's end of the pipe to it.
+    """
+    def __init__(self, forker):
+        self.forker = forker
+        self.pid, self.connection = forker.fork(sandbox_worker_main)
+        self.baseline = None # Resident memory once the packages are imported (from its "ready" message)
+        self.resident = None # Resident memory after the last command
+        self.commands = 0
+
+    def stop(self):
+        self.connection.close()
+        self.forker.stop(self.pid)
+
+    def describe_exit(self):
+        exitcode = self.forker.wait(self.pid)
+        if exitcode == -signal.SIGXCPU:
+            return f"went over its CPU time limit ({SANDBOX_CPU_LIMIT}s)"
+        if exitcode == -signal.SIGKILL:
+            return "was killed (out of memory?)"
+        return f"crashed (exit code {exitcode})"
+
+class SandboxPool:
+    """
+    The sandbox workers. Idle ones wait in a queue; a command takes one and gives it
+    back afterwards, or has it replaced. Once the pool is closed, the queue holds None,
+    which wakes commands waiting for a worker.
+    """
+    def __init__(self, size, forker):
+        self.forker = forker
+        self.idle = queue.Queue()
+        self.workers = set()
+        self.recycled = 0
+        self.closed = False
+        self.lock = threading.Lock() # Also makes checking closed and queueing a worker one step
+        for _ in range(size):
+            self.add_worker()
+
+    def add_worker(self):
+        worker = SandboxWorker(self.forker)
+        with self.lock:
+            if not self.closed:
+                self.workers.add(worker)
+                self.idle.put(worker)
+                return
+        worker.stop()
+
+    def take(self):
+        """
+        Returns an idle worker, waiting for one if they are all busy, or None if the
+        pool is closed.
+        """
+        worker = self.idle.get()
+        if worker is None:
+            self.idle.put(None) # For the next waiter
+        return worker
+
+    def release(self, worker, recycle=False):
+        with self.lock:
+            if not recycle and not self.closed:
+                self.idle.put(worker)
+                return
+            self.workers.discard(worker)
+            self.recycled += recycle
+        worker.stop()
+        if not self.closed:
+            self.add_worker()
+
+    def close(self):
+        """
+        Stops the idle workers; busy ones stop when their command ends.
+        """
+        with self.lock:
+            self.closed = True
+        while True:
+            try:
+                worker = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            with self.lock:
+                self.workers.discard(worker)
+            worker.stop()
+        self.idle.put(None)
+
+def sandbox_available():
+    return fork_available() and importlib.util.find_spec("resource") is not None
+
+def start_sandbox():
+    """
+    Turns the sandbox on, starting its workers. Returns False (with an error) where
+    it isn't available.
+    """
+    global _sandbox_enabled, _sandbox_pool
+    if not sandbox_available():
+        print("Error: The sandbox needs fork() and the 'resource' module; package commands run in the shell.", file=sys.stderr)
+        _sandbox_enabled = False
+        return False
+    forker = start_forker()
+    with _sandbox_lock:
+        if _sandbox_pool is None:
+            _sandbox_pool = SandboxPool(SANDBOX_WORKERS, forker)
+        _sandbox_enabled = True
+    return True
+
+def stop_sandbox():
+    global _sandbox_enabled, _sandbox_pool
+    with _sandbox_lock:
+        _sandbox_enabled = False
+        pool, _sandbox_pool = _sandbox_pool, None
+    if pool is not None:
+        pool.close()
+
+def run_in_sandbox(command, args):
+    """
+    Runs a package command in a sandbox worker, copying what it prints to this
+    thread's stdout and stderr. Reports and replaces the worker if it breaks a limit.
+    """
+    pool = _sandbox_pool
+    if pool is None:
+        print(f"Error: The sandbox was turned off before '{command}' could run.", file=sys.stderr)
+        return
+    worker = pool.take()
+    if worker is None:
+        print(f"Error: The sandbox was turned off before '{command}' could run.", file=sys.stderr)
+        return
+    problem = None
+    recycle = True # Unless the command finishes normally
+    try:
+        worker.connection.send((command, args, get_cwd()))
+        deadline = time.monotonic() + SANDBOX_TIMEOUT
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not worker.connection.poll(remaining):
+                problem = f"timed out after {SANDBOX_TIMEOUT:g}s"
+                break
+            try:
+                message = worker.connection.recv()
+            except EOFError:
+                problem = worker.describe_exit()
+                break
+            if isinstance(message, str):
+                sys.stdout.write(message)
+            elif message[0] == "stderr":
+                sys.stderr.write(message[1])
+            elif message[0] == "ready":
+                worker.baseline = message[1]
+                deadline = time.monotonic() + SANDBOX_TIMEOUT # Importing the packages doesn't count
+            else: # ("done", status, resident memory)
+                status, worker.resident = message[1:]
+                worker.commands += 1
+                if status != "ok":
+                    problem = f"ran {status}"
+                else:
+                    recycle = worker.resident - worker.baseline > SANDBOX_RECYCLE_GROWTH
+                break
+    finally:
+        pool.release(worker, recycle)
+    if problem is not None:
+        print(f"Error: Command '{command}' {problem}; its sandbox worker was replaced.", file=sys.stderr)
+
+def sandboxed(command, handler):
+    """
+    Returns what to call to run command: handler itself, or, with the sandbox on and a
+    package command, a function running it in a sandbox worker.
+    """
+    if not _sandbox_enabled or getattr(handler, "builtin", False):
+        return handler
+    if _sandbox_pool is None and not start_sandbox(): # Turned on by PYOS_SANDBOX
+        return handler
+    return functools.partial(run_in_sandbox, command)
+
+# --- Command statistics ---
+# Every command run through run_tokens is timed, and its latency recorded in a
+# histogram per command name, so 'stats' can show where the time goes, including
+# which installed package a slow command comes from. The histograms have
+# logarithmic buckets (HISTOGRAM_BUCKETS_PER_DOUBLING per power of two), so they take
+# constant memory however many times a command runs; percentiles are rounded up to
+# the top of their bucket (at most ~9% off). Phases of emulate() itself (tokenizing,
+# variable expansion) are recorded the same way.
+HISTOGRAM_BUCKETS_PER_DOUBLING = 8
+PROFILE_LIMIT = 25 # Functions shown by 'profile'
+
+class LatencyHistogram:
+    """
+    Counts of latencies (in nanoseconds) in logarithmic buckets.
+    """
+    __slots__ = ("source", "count", "total_ns", "max_ns", "buckets")
+
+    def __init__(self, source=None):
+        self.source = source # "builtin", a package name, "pipeline" or "phase"
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.buckets = {}
+
+    def record(self, ns):
+        self.count += 1
+        self.total_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+        bucket = int(math.log2(ns + 1) * HISTOGRAM_BUCKETS_PER_DOUBLING)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def percentile(self, percent):
+        """
+        Returns the latency (ns) below which percent of the recorded latencies fall.
+        """
+        if not self.count:
+            return 0
+        target = math.ceil(self.count * percent / 100)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= target:
+                return min(2 ** ((bucket + 1) / HISTOGRAM_BUCKETS_PER_DOUBLING), self.max_ns)
+        return self.max_ns
+
+    def summary(self):
+        """
+        Returns the histogram's numbers as a dict of milliseconds, for display and JSON.
+        """
+        return {
+            "source": self.source,
+            "count": self.count,
+            "total_ms": self.total_ns / 1e6,
+            "mean_ms": self.total_ns / self.count / 1e6 if self.count else 0.0,
+            "p50_ms": self.percentile(50) / 1e6,
+            "p95_ms": self.percentile(95) / 1e6,
+            "p99_ms": self.percentile(99) / 1e6,
+            "max_ms": self.max_ns / 1e6,
+        }
+
+_command_stats = {} # Maps command name -> LatencyHistogram
+_phase_stats = {} # Maps phase name -> LatencyHistogram
+_stats_lock = threading.Lock() # Background jobs record too
+_stats_started = time.time()
+
+def command_source(handler):
+    """
+    Returns where a command handler comes from: "builtin" or the package's module name.
+    """
+    if isinstance(handler, LazyPackageCommand):
+        return handler.module_name
+    if isinstance(handler, ShellCommand):
+        if handler.builtin:
+            return "builtin"
+        handler = handler.handler or handler.stream
+    return getattr(handler, "__module__", None) or "unknown"
+
+def record_command(command, handler, ns, source=None):
+    with _stats_lock:
+        histogram = _command_stats.get(command)
+        if histogram is None:
+            histogram = _command_stats[command] = LatencyHistogram(source or command_source(handler))
+        histogram.record(ns)
+
+def record_phase(phase, ns):
+    with _stats_lock:
+        histogram = _phase_stats.get(phase)
+        if histogram is None:
+            histogram = _phase_stats[phase] = LatencyHistogram("phase")
+        histogram.record(ns)
+
+def get_stats():
+    """
+    Returns all recorded statistics as a JSON-serializable dict.
+    """
+    with _stats_lock:
+        return {
+            "since": _stats_started,
+            "commands": {name: h.summary() for name, h in _command_stats.items()},
+            "phases": {name: h.summary() for name, h in _phase_stats.items()},
+        }
+
+def reset_stats():
+    global _stats_started
+    with _stats_lock:
+        _command_stats.clear()
+        _phase_stats.clear()
+        _stats_started = time.time()
+
+def format_stats_table(rows, title="command", name_width=24):
+    """
+    Yields the lines of a table of (name, summary) rows, slowest in total first.
+    """
+    yield f"{title:<{name_width}} {'source':<16} {'count':>7} {'total ms':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"
+    for name, summary in sorted(rows, key=lambda row: row[1]["total_ms"], reverse=True):
+        yield (f"{name[:name_width]:<{name_width}} {summary['source'][:16]:<16} {summary['count']:>7} "
+               f"{summary['total_ms']:>10.2f} {summary['p50_ms']:>9.3f} {summary['p95_ms']:>9.3f} "
+               f"{summary['p99_ms']:>9.3f} {summary['max_ms']:>9.3f}")
+
+# --- Prompt ---
+# The prompt is built once per session and cached: only 'cd' and 'login' change what
+# it shows, and they call refresh_prompt(). Until someone logs in, it shows the system user.
+def get_prompt():
+    session = current_session()
+    if session.prompt is None:
+        user = session.user or getpass.getuser()
+        session.prompt = f"PyOS: {user}@{socket.gethostname()} {get_cwd()} $ "
+    return session.prompt
+
+def refresh_prompt():
+    current_session().prompt = None
+
+# --- Builtin commands ---
+# Each builtin is a function taking the argument list, registered in the dispatch
+# table with its argument-count limits and usage line.
+
+# Example usage of verify_password within a login command
+@builtin_command("login", 2, 2, "Usage: login <username> <password>")
+def builtin_login(args):
+    user_to_login = args[0]
+    pass_to_check = args[1]
+    if verify_password(user_to_login, pass_to_check):
+        current_session().user = user_to_login
+        refresh_prompt()
+        print(f"Login successful for user: {user_to_login}")
+    else:
+        print("Login failed: Incorrect username or password.")
+
+@builtin_command("passdb", 1, 1, "Usage: passdb <convert|status>")
+def builtin_passdb(args):
+    subcommand = args[0]
+    if subcommand == "convert":
+        try:
+            count = convert_passwords_to_db()
+        except Exception as e:
+            print(f"Error converting passwords to '{passwords_db_path}': {e}", file=sys.stderr)
+            return
+        print(f"Copied {count} users to '{passwords_db_path}'. It is now used instead of '{passwords_file_path}'.")
+    elif subcommand == "status":
+        if Path(passwords_db_path).is_file():
+            print(f"Passwords are stored in the database '{passwords_db_path}'.")
+        else:
+            print(f"Passwords are stored in the text file '{passwords_file_path}'.")
+    else:
+        print("Usage: passdb <convert|status>")
+
+# --- 'let' command for variable assignment ---
+@builtin_command("let", 1, 1, "Usage: let <varname>=<value>")
+def builtin_let(args):
+    if "=" not in args[0]:
+        print("Usage: let <varname>=<value>")
+        return
+    var_assignment = args[0].split('=', 1) # Split only on the first '='
+    var_name = var_assignment[0].strip()
+    var_value = var_assignment[1].strip()
+    set_shell_variable(var_name, var_value)
+    print(f"Variable '{var_name}' set to '{var_value}'")
+
+# --- 'vars' command to show current variables ---
+@builtin_command("vars")
+def builtin_vars(args):
+    variables = current_session().variables
+    if variables:
+        print("Current shell variables:")
+        for var, val in variables.items():
+            print(f"  {var}='{val}'")
+    else:
+        print("No shell variables currently set.")
+
+HISTORY_USAGE = "Usage: history [--count N] [--prefix] [text]"
+
+@builtin_stream_command("history", 0, None, HISTORY_USAGE)
+def stream_history(args, stdin):
+    # The last lines typed at the console, or the latest distinct ones containing (or starting with) text
+    try:
+        options, positional = parse_options(args, ("--count",), ("--prefix",))
+        count = int(options.get("--count", HISTORY_SHOWN))
+        if len(positional) > 1 or count < 1 or (options.get("--prefix") and not positional):
+            raise ValueError
+    except ValueError:
+        print(HISTORY_USAGE)
+        return
+    if positional:
+        entries = _history.find(positional[0], prefix=bool(options.get("--prefix")), count=count)
+    else:
+        entries = _history.recent(count)
+    for number, line in entries:
+        yield f"{number:>6}  {line}"
+
+# --- Existing Commands ---
+LC_USAGE = "Usage: lc [--unsorted] [--limit N [--page P]] [directory]"
+
+def parse_lc_args(args):
+    """
+    Returns the keyword arguments of list_content_colored for lc's arguments,
+    or None (after printing the usage) if they are invalid.
+    """
+    try:
+        options, positional = parse_options(args, ("--limit", "--page"), ("--unsorted",))
+        limit = int(options["--limit"]) if "--limit" in options else None
+        page = int(options.get("--page", 1))
+        if len(positional) > 1 or (limit is not None and limit < 1) or page < 1:
+            raise ValueError
+    except ValueError:
+        print(LC_USAGE)
+        return None
+    # List the specified directory, or the current one
+    path = resolve_path(positional[0]) if positional else get_cwd()
+    return {"path": path, "sort": not options.get("--unsorted", False), "limit": limit, "page": page}
+
+def stream_lc(args, stdin):
+    # In a pipeline, names are plain text: directories get a trailing '/' but no color
+    lc_args = parse_lc_args(args)
+    if lc_args is None:
+        return
+    path = lc_args.pop("path")
+    if not is_directory(path):
+        print(f"Error: '{path}' is not a directory.")
+        return
+    for name, kind in iter_listing(path, **lc_args):
+        yield name + "/" if kind == ENTRY_DIRECTORY else name
+
+@builtin_command("lc", 0, None, LC_USAGE, stream=stream_lc)
+def builtin_lc(args):
+    lc_args = parse_lc_args(args)
+    if lc_args is not None:
+        list_content_colored(**lc_args)
+
+@builtin_command("cd", 1, 1, "Usage: cd <directory>")
+def builtin_cd(args):
+    change_directory(args[0])
+
+@builtin_command("about")
+def builtin_about(args):
+    print("PyOS V1.1")
+    print("Copyright (C) 2025 Muser") # Using your provided copyright info
+    print("This program comes with ABSOLUTELY NO WARRANTY; for details type `show w'.")
+    print("This is free software, and you are welcome to redistribute it")
+    print("under certain conditions; type `show c' for details.")
+
+@builtin_command("show", 1, 1, "Usage: show <c|w>")
+def builtin_show(args):
+    subcommand = args[0]
+    if subcommand == "c":
+        print("PyOS is free software: you can redistribute it and/or modify")
+        print("it under the terms of the GNU General Public License as published by")
+        print("the Free Software Foundation, either version 3 of the License, or")
+        print("(at your option) any later version.")
+        print("")
+        print("You should have received a copy of the GNU General Public License")
+        print("along with this program. If not, see <https://www.gnu.org/licenses/>.")
+    elif subcommand == "w":
+        # Full warranty disclaimer as provided
+        print("IN NO EVENT UNLESS REQUIRED BY APPLICABLE LAW OR AGREED TO IN WRITING WILL ANY COPYRIGHT HOLDER, OR ANY OTHER PARTY WHO MODIFIES AND/OR CONVEYS THE PROGRAM AS PERMITTED ABOVE, BE LIABLE TO YOU FOR DAMAGES, INCLUDING ANY GENERAL, SPECIAL, INCIDENTAL OR CONSEQUENTIAL DAMAGES ARISING OUT OF THE USE OR INABILITY TO USE THE PROGRAM (INCLUDING BUT NOT LIMITED TO LOSS OF DATA OR DATA BEING RENDERED INACCURATE OR LOSSES SUSTAINED BY YOU OR THIRD PARTIES OR A FAILURE OF THE PROGRAM TO OPERATE WITH ANY OTHER PROGRAMS), EVEN IF SUCH HOLDER OR OTHER PARTY HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH DAMAGES.")
+    else:
+        print("Usage: show <c|w>")
+
+# --- File and Directory Commands ---
+READFILE_USAGE = "Usage: readfile [--head N | --tail N] [--offset N] [--length N] [--hex] <filepath>"
+
+def parse_readfile_args(args):
+    """
+    Returns the keyword arguments of read_file for readfile's arguments,
+    or None (after printing the usage) if they are invalid.
+    """
+    try:
+        options, positional = parse_options(args, ("--head", "--tail", "--offset", "--length"), ("--hex",))
+        numbers = {name: int(value) for name, value in options.items() if name != "--hex"}
+        if len(positional) != 1 or ("--head" in numbers and "--tail" in numbers) or any(n < 0 for n in numbers.values()):
+            raise ValueError
+    except ValueError:
+        print(READFILE_USAGE)
+        return None
+    return {"filepath": resolve_path(positional[0]), "head": numbers.get("--head"), "tail": numbers.get("--tail"),
+            "offset": numbers.get("--offset"), "length": numbers.get("--length"), "hexdump": options.get("--hex", False)}
+
+def stream_readfile(args, stdin):
+    readfile_args = parse_readfile_args(args)
+    if readfile_args is not None:
+        yield from iter_text_lines(iter_read_file(**readfile_args))
+
+@builtin_command("readfile", 1, None, READFILE_USAGE, stream=stream_readfile)
+def builtin_readfile(args):
+    readfile_args = parse_readfile_args(args)
+    if readfile_args is not None:
+        read_file(**readfile_args)
+
+MKFILE_USAGE = "Usage: mkfile <filepath> [content]   (several files: mkfile [--content TEXT] <filepath> <filepath> [...])"
+
+@builtin_command("mkfile", 1, None, MKFILE_USAGE)
+def builtin_mkfile(args):
+    try:
+        options, positional = parse_options(args, ("--content",))
+        if not positional:
+            raise ValueError
+    except ValueError:
+        print(MKFILE_USAGE)
+        return
+    content = options.get("--content", "")
+    if "--content" not in options and len(positional) == 2:
+        content = positional.pop() # 'mkfile <filepath> <content>'; two files need --content
+    paths = [resolve_path(arg) for arg in positional]
+    if all(check_writable(path) for path in paths):
+        run_file_batch(create_file, [(path, content) for path in paths], "create", "Created {done} of {total} files")
+
+@builtin_command("rmfile", 1, None, "Usage: rmfile <filepath|glob> [...]")
+def builtin_rmfile(args):
+    paths = expand_path_args(args)
+    if all(check_writable(path) for path in paths):
+        run_file_batch(delete_file, [(path,) for path in paths], "delete", "Deleted {done} of {total} files")
+
+@builtin_command("mkdir", 1, None, "Usage: mkdir <directory_path> [...]")
+def builtin_mkdir(args):
+    paths = [resolve_path(arg) for arg in args]
+    if all(check_writable(path) for path in paths):
+        run_file_batch(create_directory, [(path,) for path in paths], "create directory", "Created {done} of {total} directories")
+
+CP_USAGE = "Usage: cp [-r] <source|glob> [...] <destination>"
+
+@builtin_command("cp", 2, None, CP_USAGE)
+def builtin_cp(args):
+    recursive = args[0] in ("-r", "-R")
+    if recursive:
+        args = args[1:]
+    if len(args) < 2:
+        print(CP_USAGE)
+        return
+    sources, destination = expand_path_args(args[:-1]), resolve_path(args[-1])
+    if not sources or not check_writable(destination):
+        return
+    try:
+        items = copy_or_move_items(sources, destination)
+    except FileOperationError as e:
+        print(f"Error: {e}")
+        return
+    run_file_batch(lambda source, target: copy_path(source, target, recursive), items, "copy", "Copied {done} of {total} paths")
+
+@builtin_command("mv", 2, None, "Usage: mv <source|glob> [...] <destination>")
+def builtin_mv(args):
+    sources, destination = expand_path_args(args[:-1]), resolve_path(args[-1])
+    if not sources or not all(check_writable(path) for path in sources + [destination]):
+        return
+    try:
+        items = copy_or_move_items(sources, destination)
+    except FileOperationError as e:
+        print(f"Error: {e}")
+        return
+    run_file_batch(move_path, items, "move", "Moved {done} of {total} paths")
+
+@builtin_stream_command("echo")
+def stream_echo(args, stdin):
+    if args and args[0] == "-e": # Added 'args and' for robustness against empty 'args'
+        myargs = args[1:]
+        newargs = []
+        for arg in myargs:
+            arg = arg.replace("\\e", "\033")
+            arg = arg.replace("\\n", "\n")
+            arg = arg.replace("\\t", "\t") 
+            arg = arg.replace("\\r", "\r") 
+            arg = arg.replace("\\\\", "\\")
+            newargs.append(arg)
+        yield " ".join(newargs)
+    else:
+        yield " ".join(args)
+
+GREP_USAGE = "Usage: grep [-i] [-v] [-r] [-l] <pattern> <file|directory|glob> [...]   (or: <command> | grep [-i] [-v] <pattern>)"
+
+@builtin_stream_command("grep", 1, None, GREP_USAGE)
+def stream_grep(args, stdin):
+    # Searches files, or filters the lines of the previous pipeline stage, with a regular expression
+    try:
+        options, positional = parse_options(args, flag_options=("-i", "-v", "-r", "-l"))
+        if not positional:
+            raise ValueError
+        flags = re.IGNORECASE if options.get("-i") else 0
+        pattern = re.compile(positional[0], flags)
+    except (ValueError, re.error):
+        print(GREP_USAGE)
+        return
+    invert = options.get("-v", False)
+    if len(positional) > 1:
+        paths = expand_path_args(positional[1:])
+        recursive = options.get("-r", False)
+        files = list(iter_grep_targets(paths, recursive))
+        regex = re.compile(positional[0].encode(), flags) # mmap'ed files are searched as bytes
+        yield from iter_grep_files(files, regex, invert, options.get("-l", False), len(files) > 1 or recursive)
+        return
+    if stdin is None:
+        print(GREP_USAGE)
+        return
+    for line in stdin:
+        if (pattern.search(line) is None) == invert:
+            yield line
+
+@builtin_command("rmdir", 1, None, "Usage: rmdir <directory_path|glob> [...]")
+def builtin_rmdir(args):
+    paths = expand_path_args(args)
+    if all(check_writable(path) for path in paths):
+        run_file_batch(delete_directory, [(path,) for path in paths], "delete directory", "Deleted {done} of {total} directories")
+
+
+FIND_USAGE = "Usage: find [directory] [--name GLOB] [--type f|d] [--size [+-]N[kMG]] [--mtime [+-]DAYS]"
+
+@builtin_command("find", 0, None, FIND_USAGE)
+def builtin_find(args):
+    try:
+        options, positional = parse_options(args, ("--name", "--type", "--size", "--mtime"))
+        if len(positional) > 1 or options.get("--type", "f") not in ("f", "d"):
+            raise ValueError
+        size = parse_comparison(options["--size"], parse_size) if "--size" in options else None
+        mtime_days = parse_comparison(options["--mtime"]) if "--mtime" in options else None
+    except ValueError:
+        print(FIND_USAGE)
+        return
+    root = positional[0] if positional else "."
+    resolved_root = resolve_path(root)
+    if not is_directory(resolved_root):
+        print(f"Error: '{root}' is not a directory.")
+        return
+    for entry in find_files(resolved_root, options.get("--name"), options.get("--type"), size, mtime_days):
+        print(root + entry.path[len(resolved_root):]) # Paths as given, in every session
+
+DU_USAGE = "Usage: du [--depth N] [directory]"
+
+@builtin_command("du", 0, None, DU_USAGE)
+def builtin_du(args):
+    try:
+        options, positional = parse_options(args, ("--depth",))
+        depth = int(options.get("--depth", 1))
+        if len(positional) > 1 or depth < 0:
+            raise ValueError
+    except ValueError:
+        print(DU_USAGE)
+        return
+    root = positional[0] if positional else "."
+    resolved_root = resolve_path(root)
+    if not is_directory(resolved_root):
+        print(f"Error: '{root}' is not a directory.")
+        return
+    totals, grand_total = disk_usage(resolved_root, depth)
+    for path in sorted(totals):
+        print(f"{format_size(totals[path]):>8}  {root + path[len(resolved_root):]}")
+    print(f"{format_size(grand_total):>8}  {root} (total)")
+
+@builtin_command("index", 0, 1, "Usage: index [directory]")
+def builtin_index(args):
+    # Builds or updates the search index of a directory (by default all home directories)
+    root = resolve_path(args[0]) if args else str(curr_dir / "_home")
+    if not os.path.isdir(root):
+        print(f"Error: '{args[0] if args else root}' is not a directory.")
+        return
+    start = time.perf_counter()
+    counts = update_search_index(root)
+    print(f"Indexed '{root}': {counts['added']} added, {counts['updated']} updated, "
+          f"{counts['removed']} removed, {counts['unchanged']} unchanged ({time.perf_counter() - start:.3f}s).")
+
+SEARCH_USAGE = "Usage: search [--update] <term> [directory]"
+
+@builtin_stream_command("search", 1, None, SEARCH_USAGE)
+def stream_search(args, stdin):
+    # Case-insensitive search for a literal term, in the files of an indexed directory
+    try:
+        options, positional = parse_options(args, flag_options=("--update",))
+        if len(positional) not in (1, 2):
+            raise ValueError
+    except ValueError:
+        print(SEARCH_USAGE)
+        return
+    root = resolve_path(positional[1]) if len(positional) > 1 else str(curr_dir / "_home")
+    if not os.path.isdir(root):
+        print(f"Error: '{root}' is not a directory.")
+        return
+    if options.get("--update"):
+        update_search_index(root)
+    elif not os.path.exists(SEARCH_INDEX_PATH):
+        print("Error: No search index yet. Run 'index' first (or use --update).")
+        return
+    candidates = search_candidates(positional[0], root)
+    regex = re.compile(re.escape(positional[0].encode()), re.IGNORECASE)
+    yield from iter_grep_files(candidates, regex)
+
+MOUNT_USAGE = "Usage: mount [<archive> <directory>]"
+
+@builtin_command("mount", 0, 2, MOUNT_USAGE)
+def builtin_mount(args):
+    if not args:
+        if not _mounts:
+            print("Nothing is mounted.")
+        for mount_point, fs in list(_mounts.items()):
+            print(f"{fs.archive_path} on {mount_point} ({len(fs.entries) - 1} entries)")
+        return
+    if len(args) != 2:
+        print(MOUNT_USAGE)
+        return
+    archive_path, mount_point = resolve_path(args[0]), resolve_path(args[1])
+    try:
+        start = time.perf_counter()
+        fs = mount_archive(archive_path, mount_point)
+    except FileNotFoundError:
+        print(f"Error: Archive '{args[0]}' not found.")
+        return
+    except Exception as e: # Includes zipfile's and tarfile's errors for corrupt archives
+        print(f"Error: Cannot mount '{args[0]}': {e}")
+        return
+    print(f"Mounted '{args[0]}' on '{args[1]}' ({len(fs.entries) - 1} entries indexed in {time.perf_counter() - start:.3f}s).")
+
+@builtin_command("umount", 1, 1, "Usage: umount <directory>")
+def builtin_umount(args):
+    mount_point = resolve_path(args[0])
+    in_mount = find_mount(get_cwd())
+    if in_mount is not None and in_mount[0] is _mounts.get(os.path.realpath(mount_point)):
+        print(f"Error: Leave '{args[0]}' before unmounting it.")
+        return
+    if unmount(mount_point):
+        print(f"Unmounted '{args[0]}'.")
+    else:
+        print(f"Error: Nothing is mounted on '{args[0]}'.")
+# --- End File and Directory Commands ---
+
+GUM_USAGE = "Usage: gum <package_url> | gum install [--refresh] <package_url> [package_url ...]"
+
+@builtin_command("gum", 1, None, GUM_USAGE) # Command for gum package manager
+def builtin_gum(args):
+    if args[0] == "install":
+        try:
+            options, urls = parse_options(args[1:], flag_options=("--refresh",))
+        except ValueError:
+            urls = []
+        if not urls:
+            print(GUM_USAGE)
+            return
+    elif len(args) == 1:
+        options, urls = {}, args
+    else:
+        print(GUM_USAGE)
+        return
+    if checkforpackagemanager() == 1:
+        print("Gum not properly installed.")
+        return
+    if not check_writable(get_cwd()):
+        return
+    installed = gum.installpkgs(urls, refresh=options.get("--refresh", False), install_root=get_cwd())
+    if len(urls) > 1:
+        print(f"Installed {installed} of {len(urls)} packages.")
+
+BG_USAGE = "Usage: bg [--timeout SECONDS] [--process] <command> [args ...]   (or: <command> [args ...] &)"
+
+@builtin_command("bg", 1, None, BG_USAGE)
+def builtin_bg(args):
+    # Options are only read before the command, so the command keeps its own options
+    timeout = None
+    use_process = None
+    while args and args[0] in ("--timeout", "--process"):
+        if args[0] == "--process":
+            use_process = True
+            args = args[1:]
+            continue
+        try:
+            timeout = float(args[1])
+        except (IndexError, ValueError):
+            print(BG_USAGE)
+            return
+        args = args[2:]
+    if not args:
+        print(BG_USAGE)
+        return
+    if use_process and not fork_available():
+        print("Warning: Process jobs need fork(); running in a thread instead.", file=sys.stderr)
+        use_process = False
+    start_job(args, timeout, use_process)
+
+@builtin_command("jobs", 0, 0, "Usage: jobs")
+def builtin_jobs(args):
+    jobs = current_session().jobs
+    if not jobs:
+        print("No background jobs.")
+        return
+    for job in list(jobs.values()):
+        print(job.describe())
+        job.reported = job.reported or job.done.is_set()
+
+@builtin_command("wait", 0, None, "Usage: wait [job_id ...]")
+def builtin_wait(args):
+    jobs = find_jobs(args)
+    if jobs is None:
+        return
+    for job in jobs:
+        try:
+            job.done.wait()
+        except KeyboardInterrupt:
+            print(f"\nStopped waiting for job {job.id}.")
+            return
+        # Show what the job printed, then forget it
+        for line in list(job.output):
+            print(line)
+        print(job.describe())
+        job.reported = True
+        with _jobs_lock:
+            current_session().jobs.pop(job.id, None)
+
+@builtin_command("kill", 1, None, "Usage: kill <job_id> [job_id ...]")
+def builtin_kill(args):
+    jobs = find_jobs(args)
+    if jobs is None:
+        return
+    for job in jobs:
+        if stop_job(job):
+            print(f"[{job.id}] killed: {job.command_line}")
+        else:
+            print(f"Job {job.id} has already finished ({job.status}).")
+
+SANDBOX_USAGE = "Usage: sandbox [on|off|status]"
+
+@builtin_command("sandbox", 0, 1, SANDBOX_USAGE)
+def builtin_sandbox(args):
+    action = args[0] if args else "status"
+    if action == "on":
+        if start_sandbox():
+            print(f"Sandbox on: package commands run in {SANDBOX_WORKERS} worker processes.")
+    elif action == "off":
+        stop_sandbox()
+        print("Sandbox off: package commands run in the shell.")
+    elif action == "status":
+        pool = _sandbox_pool
+        if not _sandbox_enabled or pool is None:
+            print("Sandbox off: package commands run in the shell.")
+            return
+        print(f"Sandbox on: {len(pool.workers)} workers, {pool.recycled} replaced so far. Limits per command: "
+              f"{SANDBOX_TIMEOUT:g}s, {SANDBOX_CPU_LIMIT}s CPU, {format_size(SANDBOX_MEMORY_LIMIT)} memory.")
+        for worker in list(pool.workers):
+            resident = format_size(worker.resident) if worker.resident is not None else "-"
+            print(f"  pid {worker.pid:<8} {worker.commands:>6} commands  {resident:>8} resident")
+    else:
+        print(SANDBOX_USAGE)
+
+@builtin_command("pwd")
+def builtin_pwd(args):
+    print(get_cwd())
+
+@builtin_command("who", 0, 0, "Usage: who")
+def builtin_who(args):
+    # Lists the sessions of this process: the console and any server connections
+    now = time.time()
+    for session in list(_sessions.values()):
+        marker = "*" if session is current_session() else " "
+        cwd = session.cwd or (os.getcwd() if session is _console_session else "-")
+        print(f"{marker}{session.id:>5}  {session.user or '-':<16} {now - session.started:9.0f}s  {cwd}")
+
+# 'time' and 'profile' apply to the whole rest of the line, pipelines included
+# (see PREFIX_BUILTINS in run_tokens)
+@builtin_command("time", 1, None, "Usage: time <command> [args ...]")
+def builtin_time(args):
+    start_times = os.times()
+    start = time.perf_counter()
+    try:
+        run_tokens(args)
+    finally:
+        real = time.perf_counter() - start
+        end_times = os.times()
+        print(f"real {real:.4f}s  user {end_times.user - start_times.user:.4f}s  sys {end_times.system - start_times.system:.4f}s",
+              file=sys.stderr)
+
+STATS_USAGE = "Usage: stats [--json [file]] [--reset]"
+
+@builtin_command("stats", 0, 2, STATS_USAGE)
+def builtin_stats(args):
+    if args == ["--reset"]:
+        reset_stats()
+        print("Statistics cleared.")
+        return
+    if args and args[0] == "--json":
+        text = json.dumps(get_stats(), indent=2)
+        if len(args) == 1:
+            print(text)
+            return
+        try:
+            with open(resolve_path(args[1]), "w") as f:
+                f.write(text + "\n")
+        except OSError as e:
+            print(f"Error: Could not write '{args[1]}': {e}")
+            return
+        print(f"Statistics written to '{args[1]}'.")
+        return
+    if args:
+        print(STATS_USAGE)
+        return
+    stats = get_stats()
+    if not stats["commands"]:
+        print("No commands recorded yet.")
+        return
+    lines = list(format_stats_table(stats["commands"].items()))
+    lines.append("")
+    lines.extend(format_stats_table(stats["phases"].items(), "phase"))
+    write_lines(lines, sys.stdout)
+
+PROFILE_USAGE = "Usage: profile [--sort cumulative|tottime|calls] [--limit N] [--output file] <command> [args ...]"
+
+@builtin_command("profile", 1, None, PROFILE_USAGE)
+def builtin_profile(args):
+    # Like 'bg', options are only read before the command
+    sort, limit, output = "cumulative", PROFILE_LIMIT, None
+    while args and args[0] in ("--sort", "--limit", "--output"):
+        if len(args) < 2:
+            print(PROFILE_USAGE)
+            return
+        if args[0] == "--sort":
+            sort = args[1]
+        elif args[0] == "--limit":
+            if not args[1].isdigit():
+                print(PROFILE_USAGE)
+                return
+            limit = int(args[1])
+        else:
+            output = args[1]
+        args = args[2:]
+    if not args or sort not in ("cumulative", "tottime", "calls"):
+        print(PROFILE_USAGE)
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        run_tokens(args)
+    finally:
+        profiler.disable()
+    if output:
+        profiler.dump_stats(resolve_path(output)) # For snakeviz, pstats and friends
+        print(f"Profile written to '{output}'.")
+    pstats.Stats(profiler, stream=sys.stdout).sort_stats(sort).print_stats(limit)
+# --- End Builtin commands ---
+
+# Load package commands once the builtins are registered, so packages can override them
+load_package_commands()
+
+def emulate(promptline):
+    # --- Variable expansion and tokenizing, cached per line ---
+    start = time.perf_counter_ns()
+    tokens = tokenize(promptline)
+    record_phase("tokenize", time.perf_counter_ns() - start)
+    if not tokens:
+        return
+    if tokens[-1] == "&" and promptline.rstrip().endswith("&"): # Run in the background (a quoted "&" is an argument)
+        if len(tokens) == 1:
+            print("Error: syntax error near '&'")
+            return
+        start_job(tokens[:-1])
+        return
+    run_tokens(tokens)
+
+PREFIX_BUILTINS = ("time", "profile") # Builtins taking a whole command line as arguments
+
+def run_tokens(tokens):
+    """
+    Runs an already tokenized command line: a single command or a pipeline.
+    Records how long it took in the command statistics.
+    """
+    command = tokens[0]
+    handler = _package_commands.get(command)
+    if command in PREFIX_BUILTINS and getattr(handler, "builtin", False):
+        handler(tokens[1:]) # Times or profiles the rest of the line, pipeline and all
+        return
+    if "|" in tokens or ">" in tokens or ">>" in tokens:
+        start = time.perf_counter_ns()
+        try:
+            run_pipeline(tokens)
+        finally:
+            # Stages run interleaved, so a pipeline is timed as a whole, named by its commands
+            name = " | ".join(token for i, token in enumerate(tokens) if i == 0 or tokens[i - 1] == "|")
+            record_command(name, None, time.perf_counter_ns() - start, "pipeline")
+        return
+
+    # Builtins and package commands share one dispatch table
+    if handler is None:
+        print(f"Unknown command: {command}")
+        return
+    start = time.perf_counter_ns()
+    try:
+        sandboxed(command, handler)(tokens[1:]) # Call the registered handler
+    finally:
+        record_command(command, handler, time.perf_counter_ns() - start)
+
+# --- Batch mode: running scripts of commands ---
+def run_script(lines, script_name="<script>"):
+    """
+    Runs an iterable of command lines through emulate(), without prompting.
+    Blank lines and lines starting with '#' are skipped, and 'exit' stops the script.
+    An error on one line is reported and the script carries on with the next one.
+    Prints the throughput (lines/sec) to stderr and returns the number of lines run.
+    """
+    executed = 0
+    start = time.perf_counter()
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.lower() == "exit":
+            break
+        try:
+            emulate(line)
+        except Exception as e:
+            print(f"{script_name}:{line_number}: An unexpected error occurred: {e}", file=sys.stderr)
+        executed += 1
+    elapsed = time.perf_counter() - start
+    rate = executed / elapsed if elapsed > 0 else float("inf")
+    print(f"{script_name}: ran {executed} lines in {elapsed:.3f}s ({rate:.0f} lines/sec)", file=sys.stderr)
+    return executed
+
+def run_script_file(script_path):
+    """
+    Runs a PyOS script file, or standard input if script_path is '-'.
+    """
+    if script_path == "-":
+        return run_script(sys.stdin, "<stdin>")
+    try:
+        with open(script_path, 'r') as f:
+            return run_script(f, script_path)
+    except FileNotFoundError:
+        print(f"Error: Script '{script_path}' not found.", file=sys.stderr)
+    except PermissionError:
+        print(f"Error: Permission denied to read script '{script_path}'.", file=sys.stderr)
+    return 0
+
+# --- Server mode ---
+# 'python3 __init__.py --serve [socket_path]' hosts many shells in one process: each
+# connection to the Unix socket gets a Session of its own (working directory,
+# variables, user and jobs), while the loaded commands and the password cache are
+# shared. Connections are handled by asyncio; commands run on a pool of
+# SERVER_WORKERS threads, so a slow command only holds up its own session.
+# Protocol: the client sends command lines, one per line. After each one (and once
+# on connecting) the server sends the command's output, then SERVER_READY, the
+# prompt and SERVER_READY again. SERVER_READY in the output itself (a NUL byte, e.g.
+# from reading a binary file) is sent as U+FFFD instead, like other bytes that
+# can't be shown. client.py is a small client.
+# The socket is only accessible to the user running the server (mode 0600), and
+# where the system reports peer credentials, connections from other users are refused.
+# Stdout and stderr of a session's commands, including pipeline stages and jobs
+# running on other threads, go to its client.
+# The working directory of a session is its own (Session.cwd): builtins resolve
+# paths against it, but the process has only one os.getcwd(), shared by every
+# session. So package commands see the server's directory in os.getcwd() and in
+# relative paths, unless the sandbox is on, where a worker changes to the session's
+# directory before running each command.
+SERVER_SOCKET = os.environ.get("PYOS_SOCKET") or str(curr_dir / "_system" / "_pyos.sock")
+SERVER_WORKERS = int(os.environ.get("PYOS_SERVER_WORKERS", 0)) or 32
+SERVER_READY = "\0"
+SERVER_OUTPUT_BUFFER = 64 * 1024 # Bytes of output sent before waiting for the client
+
+_server_pool = None
+
+class SessionOutput:
+    """
+    File object for the prints of a server session's commands. Runs on a worker
+    thread and hands the text to the event loop, waiting for the client to catch up
+    whenever SERVER_OUTPUT_BUFFER bytes are queued.
+    """
+    def __init__(self, loop, writer):
+        self.loop = loop
+        self.writer = writer
+        self.queued = 0
+        self.closed = False
+
+    def write(self, text):
+        if self.closed:
+            raise BrokenPipeError("client disconnected")
+        data = text.replace(SERVER_READY, "\ufffd").encode() # SERVER_READY only marks prompts
+        self.loop.call_soon_threadsafe(self.writer.write, data)
+        self.queued += len(data)
+        if self.queued >= SERVER_OUTPUT_BUFFER:
+            self.flush()
+        return len(text)
+
+    def flush(self):
+        if not self.queued:
+            return
+        self.queued = 0
+        try:
+            asyncio.run_coroutine_threadsafe(self.writer.drain(), self.loop).result()
+        except ConnectionError as e:
+            self.closed = True
+            raise BrokenPipeError("client disconnected") from e
+
+def run_session_line(line, output):
+    """
+    Runs one command line in the current session (on a worker thread) with its
+    output going to the client. Returns the prompt to send afterwards.
+    """
+    with redirect_thread_stdout(output, stderr=True):
+        try:
+            emulate(line)
+            report_finished_jobs()
+        except BrokenPipeError:
+            pass
+        except Exception as e:
+            print(f"An unexpected error occurred: {e}")
+        return get_prompt()
+
+def peer_is_allowed(writer):
+    """
+    True if the process on the other end of the connection runs as the same user as
+    the server. Where the system can't tell (no SO_PEERCRED), the socket's 0600
+    permissions are all there is.
+    """
+    connection = writer.get_extra_info("socket")
+    if connection is None or not hasattr(socket, "SO_PEERCRED"):
+        return True
+    credentials = connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+    pid, uid, gid = struct.unpack("3i", credentials)
+    return uid == os.getuid()
+
+async def handle_session(reader, writer):
+    if not peer_is_allowed(writer):
+        writer.close()
+        return
+    loop = asyncio.get_running_loop()
+    session = Session(cwd=os.getcwd())
+    context = contextvars.Context() # Commands run in here, so they see this session
+    context.run(_current_session.set, session)
+    output = SessionOutput(loop, writer)
+    context.run(_context_stdout.set, output)
+    context.run(_context_stderr.set, output)
+    _sessions[session.id] = session
+    try:
+        prompt = await loop.run_in_executor(_server_pool, context.run, get_prompt)
+        while True:
+            writer.write(f"{SERVER_READY}{prompt}{SERVER_READY}".encode())
+            await writer.drain()
+            line = await reader.readline()
+            if not line:
+                break
+            line = line.decode(errors="replace").strip()
+            if line.lower() == "exit":
+                break
+            prompt = await loop.run_in_executor(_server_pool, context.run, run_session_line, line, output)
+    except (ConnectionError, ValueError): # ValueError: line too long
+        pass
+    finally:
+        output.closed = True
+        _sessions.pop(session.id, None)
+        for job in list(session.jobs.values()):
+            stop_job(job)
+        writer.close()
+
+async def serve(socket_path):
+    global _server_pool
+    _server_pool = concurrent.futures.ThreadPoolExecutor(SERVER_WORKERS, thread_name_prefix="pyos-session")
+    install_thread_local_stdout()
+    install_thread_local_stderr()
+    _sessions.pop(_console_session.id, None) # Nobody uses the console of a server
+    if os.path.exists(socket_path):
+        os.unlink(socket_path) # Left over from a server that didn't shut down cleanly
+    # Anyone who can connect gets a shell as this user: only this user may
+    previous_umask = os.umask(0o177)
+    try:
+        server = await asyncio.start_unix_server(handle_session, path=socket_path)
+    finally:
+        os.umask(previous_umask)
+    os.chmod(socket_path, 0o600)
+    print(f"PyOS server listening on {socket_path} (Ctrl+C to stop)")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        _server_pool.shutdown(wait=False, cancel_futures=True)
+
+def run_server(socket_path=SERVER_SOCKET):
+    if fork_available():
+        start_forker() # While this is the only thread
+    try:
+        asyncio.run(serve(socket_path))
+    except KeyboardInterrupt:
+        print("\nPyOS server stopped.")
+    except OSError as e:
+        print(f"Error: Could not serve on '{socket_path}': {e}", file=sys.stderr)
+        sys.exit(1)
+
+# --- Startup profile ---
+STARTUP_PROFILE_SNIPPET = """
+import importlib.util, sys, time
+print("begin", file=sys.stderr)
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location("pyos", sys.argv[1])
+pyos = importlib.util.module_from_spec(spec)
+sys.modules["pyos"] = pyos
+spec.loader.exec_module(pyos)
+print(f"total {time.perf_counter() - start}", file=sys.stderr)
+for lazy in pyos._lazy_modules:
+    print(f"deferred {lazy._module_name}", file=sys.stderr)
+    lazy.load()
+"""
+STARTUP_PROFILE_LIMIT = 15
+
+def parse_importtime(lines):
+    """
+    Reads the output of 'python -X importtime' running STARTUP_PROFILE_SNIPPET.
+    Returns [(module, cumulative_us)] for the top-level imports of PyOS,
+    {deferred_module: [(module, cumulative_us)]} for what loading each deferred module
+    imported, and the total time PyOS took to import, in seconds.
+    """
+    startup, deferred, current, total = None, {}, None, None
+    for line in lines:
+        if line == "begin":
+            startup = [] # What the interpreter imported before PyOS doesn't count
+        elif line.startswith("total "):
+            total = float(line.split()[1])
+        elif line.startswith("deferred "):
+            current = deferred.setdefault(line.split()[1], [])
+        elif line.startswith("import time:") and "|" in line:
+            fields = line[len("import time:"):].split("|")
+            name = fields[2].rstrip()[1:] # One space after the bar, more for nested imports
+            if startup is None or not fields[1].strip().isdigit() or name.startswith(" "):
+                continue # Header line, or a nested import counted in its parent
+            (startup if current is None else current).append((name.strip(), int(fields[1])))
+    return startup, deferred, total
+
+def print_startup_profile():
+    """
+    Imports PyOS in a fresh interpreter with -X importtime, then loads the deferred
+    modules one by one, and prints what each costs.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", STARTUP_PROFILE_SNIPPET, str(curr_dir / "__init__.py")],
+                            cwd=curr_dir, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    startup, deferred, total = parse_importtime(result.stderr.splitlines())
+    if startup is None or total is None:
+        print(f"Error: Could not profile startup:\n{result.stderr[-2000:]}", file=sys.stderr)
+        return
+    imports_us = sum(us for name, us in startup)
+    print(f"Importing PyOS: {total * 1000:.1f} ms ({imports_us / 1000:.1f} ms in imports)")
+    print("Slowest imports at startup:")
+    for name, us in sorted(startup, key=lambda item: item[1], reverse=True)[:STARTUP_PROFILE_LIMIT]:
+        print(f"  {name:<32} {us / 1000:8.2f} ms")
+    print("Deferred until first use:")
+    for name, imported in deferred.items():
+        print(f"  {name:<32} {sum(us for module, us in imported) / 1000:8.2f} ms")
+
+if __name__ == "__main__":
+    if "--startup-profile" in sys.argv[1:]:
+        print_startup_profile()
+        sys.exit(0)
+
+    if not checkforbuild():
+        print("PyOS is not built. Please run build.sh first.")
+        sys.exit(1)
+
+    if _sandbox_enabled and sandbox_available():
+        start_forker() # Before any other thread starts
+
+    if len(sys.argv) > 1 and sys.argv[1] == "--serve":
+        run_server(*sys.argv[2:3])
+        sys.exit(0)
+
+    # 'python3 __init__.py script.pyos [more.pyos ...]' runs scripts instead of prompting
+    # ('-' reads commands from standard input)
+    if len(sys.argv) > 1:
+        for script_path in sys.argv[1:]:
+            run_script_file(script_path)
+        sys.exit(0)
 
-    print("PyOS is built. You can now use internal commands like 'login', 'lc', 'cd', 'about', 'show', 'readfile', 'mkfile', 'rmfile', 'mkdir', 'rmdir', 'gum', 'let', 'vars'.") # Updated help message
+    builtin_names = ", ".join(f"'{name}'" for name, handler in _package_commands.items() if getattr(handler, "builtin", False) and handler.name == name)
+    print(f"PyOS is built. You can now use internal commands like {builtin_names}.") # Updated help message
     print("Commands from installed packages are also available.") # Optional message
+    setup_line_editing()
     while True:
         try:
-            # Updated prompt line to include current working directory
-            user_input = input(f"PyOS: {getpass.getuser()}@{socket.gethostname()} {os.getcwd()} $ ").strip()
+            # The prompt includes the current working directory
+            user_input = read_console_line(input(get_prompt()).strip())
+            if user_input is None:
+                continue
             if user_input.lower() == "exit":
                 break
             emulate(user_input)
+            report_finished_jobs()
         except EOFError: # Handle Ctrl+D
             break
         except KeyboardInterrupt: # Handle Ctrl+C
@@ -0,0 +1,581 @@
+#!/usr/bin/env python3
+#    PyOS, an "operating system" running on Python.
+#    Copyright (C) 2025 Muser
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# benchmark.py - Timing reports for PyOS hot paths.
+# Run it from a built PyOS directory:
+#   python3 benchmark.py [--packages N] [--only SECTION ...] [--save FILE] [--compare FILE]
+# --save writes the results as JSON; --compare reports the change against such a file
+# and exits with status 1 if anything got slower by more than --threshold percent.
+import sys
+import time
+import json
+import platform
+import argparse
+import asyncio
+import statistics
+import subprocess
+import tempfile
+import contextlib
+import io
+import os
+import tarfile
+import threading
+import http.server
+import importlib
+import importlib.util
+from pathlib import Path
+
+curr_dir = Path(__file__).resolve().parent
+
+def load_pyos():
+    """
+    Imports PyOS's __init__.py as the module 'pyos' (it cannot be imported as 'os',
+    since that name belongs to the standard library).
+    """
+    if "pyos" in sys.modules:
+        return sys.modules["pyos"]
+    spec = importlib.util.spec_from_file_location("pyos", curr_dir / "__init__.py")
+    pyos = importlib.util.module_from_spec(spec)
+    sys.modules["pyos"] = pyos
+    spec.loader.exec_module(pyos)
+    return pyos
+
+def best_time(func, repeat):
+    """
+    Runs func repeat times and returns the fastest run in seconds. The minimum is the
+    most stable number on a busy machine: noise only ever makes a run slower.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+# --- Synthetic fixtures ---
+# Every dummy package imports a handful of standard library modules and defines a
+# few commands, roughly what a small real package costs to import.
+DUMMY_PACKAGE_SOURCE = '''import json, decimal, fractions, statistics
+
+def _run(args):
+    print(" ".join(args))
+
+def register_shell_commands(register):
+    for i in range(3):
+        register(f"{name}_cmd{{i}}", _run)
+'''
+
+def make_dummy_packages(root, count, prefix="benchpkg"):
+    """
+    Creates count dummy packages in root. Returns the list of package names.
+    """
+    names = []
+    for i in range(count):
+        name = f"{prefix}_{i}"
+        package_dir = Path(root) / name
+        package_dir.mkdir(parents=True, exist_ok=True)
+        (package_dir / "__init__.py").write_text(DUMMY_PACKAGE_SOURCE.format(name=name))
+        names.append(name)
+    importlib.invalidate_caches()
+    return names
+
+def forget_modules(names):
+    """
+    Drops modules from sys.modules so the next import of them is cold again.
+    """
+    for name in names:
+        sys.modules.pop(name, None)
+
+# --- Startup: eager vs lazy package loading ---
+def bench_package_loading(pyos, count, repeat=5):
+    """
+    Times load_package_commands() over count dummy packages in three modes:
+    eager (import everything), lazy with no index yet, and lazy with a warm index.
+    Returns {mode: best_seconds}.
+    """
+    results = {}
+    saved_commands = dict(pyos._package_commands)
+    with tempfile.TemporaryDirectory() as tmp:
+        packages_root = Path(tmp) / "_packages"
+        index_file = Path(tmp) / "_packagecommands"
+        names = make_dummy_packages(packages_root, count)
+
+        def run(lazy, keep_index):
+            forget_modules(names)
+            pyos._package_commands.clear()
+            if not keep_index and index_file.exists():
+                index_file.unlink()
+            start = time.perf_counter()
+            pyos.load_package_commands(packages_root, lazy=lazy, index_file=index_file)
+            return time.perf_counter() - start
+
+        results["eager"] = min(run(False, False) for _ in range(repeat))
+        results["lazy (cold index)"] = min(run(True, False) for _ in range(repeat))
+        run(True, False) # Make sure the index exists
+        results["lazy (warm index)"] = min(run(True, True) for _ in range(repeat))
+
+        forget_modules(names)
+        pyos._package_commands.clear()
+        pyos._package_commands.update(saved_commands)
+        if str(packages_root) in sys.path:
+            sys.path.remove(str(packages_root))
+    return results
+
+# --- Startup: importing PyOS in a fresh interpreter ---
+STARTUP_SNIPPET = """
+import importlib.util, sys
+spec = importlib.util.spec_from_file_location("pyos", sys.argv[1])
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+"""
+
+def bench_startup(repeat=5):
+    """
+    Times a fresh interpreter importing PyOS (with the packages actually installed
+    here), and a whole non-interactive run of an empty script, against a bare
+    interpreter for reference. Returns {label: best_seconds}.
+    """
+    def run(command, stdin=subprocess.DEVNULL):
+        return best_time(lambda: subprocess.run(command, cwd=curr_dir, stdin=stdin, stdout=subprocess.DEVNULL,
+                                                stderr=subprocess.DEVNULL, check=True), repeat)
+
+    return {
+        "bare interpreter": run([sys.executable, "-c", "pass"]),
+        "import PyOS": run([sys.executable, "-c", STARTUP_SNIPPET, str(curr_dir / "__init__.py")]),
+        "run empty script": run([sys.executable, str(curr_dir / "__init__.py"), "-"]),
+    }
+
+# --- Command dispatch through emulate() ---
+def bench_dispatch(pyos, lines=20000, repeat=5):
+    """
+    Pushes lines through emulate() for a few representative commands, with output
+    discarded, repeat times each. Returns {command_line: best_lines_per_second}.
+    """
+    results = {}
+    for promptline in ("pwd", "echo hello world", "let x=1", "nonexistent"):
+        with contextlib.redirect_stdout(io.StringIO()) as sink:
+            def run():
+                for _ in range(lines):
+                    pyos.emulate(promptline)
+                    if sink.tell() > 1 << 20:
+                        sink.seek(0)
+                        sink.truncate()
+            results[promptline] = lines / best_time(run, repeat)
+    return results
+
+# --- Login: password lookups vs number of users ---
+def make_passwords_file(path, count, hashed_password):
+    """
+    Writes a _passwords file with count users (user0 .. user<count-1>), all sharing hashed_password.
+    """
+    with open(path, 'w') as f:
+        for i in range(count):
+            f.write(f"{{\nuser{i}:{hashed_password};\n}}\n")
+
+def bench_login(pyos, counts=(10, 1000, 100000), repeat=200):
+    """
+    Times a login for the last user of a store with N users, for each N in counts:
+    uncached text file (a full parse per login, like before the cache existed),
+    cached text file, and the SQLite store. A low-rounds hash keeps the passlib
+    work small, so the numbers show the cost of the lookup itself.
+    Returns {label: best_seconds}.
+    """
+    results = {}
+    hashed_password = pyos.sha512_crypt.using(rounds=1000).hash("pw")
+    saved_paths = (pyos.passwords_file_path, pyos.passwords_db_path, pyos._password_db)
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        for count in counts:
+            pyos.passwords_file_path = Path(tmp) / f"_passwords_{count}"
+            pyos.passwords_db_path = Path(tmp) / f"_passwords_{count}.sqlite"
+            pyos._password_db = None
+            make_passwords_file(pyos.passwords_file_path, count, hashed_password)
+            username = f"user{count - 1}"
+
+            def uncached():
+                pyos._password_cache.clear()
+                pyos.verify_password(username, "pw")
+
+            results[f"{count} users, uncached"] = best_time(uncached, 10) # A full parse per call; few runs are enough
+            results[f"{count} users, cached"] = best_time(lambda: pyos.verify_password(username, "pw"), repeat)
+            pyos.convert_passwords_to_db()
+            results[f"{count} users, sqlite"] = best_time(lambda: pyos.verify_password(username, "pw"), repeat)
+            pyos._password_db.close()
+    pyos.passwords_file_path, pyos.passwords_db_path, pyos._password_db = saved_paths
+    pyos._password_cache.clear()
+    return results
+
+# --- Directory listings ---
+def make_flat_directory(root, count):
+    """
+    Fills root with count entries: mostly files, every tenth a directory and every
+    tenth an executable, so all three colors are exercised.
+    """
+    for i in range(count):
+        path = os.path.join(root, f"entry{i:06d}")
+        if i % 10 == 0:
+            os.mkdir(path)
+            continue
+        with open(path, 'w'):
+            pass
+        if i % 10 == 5:
+            os.chmod(path, 0o755)
+
+def bench_listing(pyos, counts=(100, 10000), repeat=5):
+    """
+    Times list_content_colored() on directories of N entries, output discarded:
+    with the listing cache off, with a warm cache, and unsorted (streamed).
+    Returns {label: best_seconds}.
+    """
+    results = {}
+    saved_enabled = pyos.LISTING_CACHE_ENABLED
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in counts:
+            directory = os.path.join(tmp, str(count))
+            os.mkdir(directory)
+            make_flat_directory(directory, count)
+
+            def listing(**kwargs):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    pyos.list_content_colored(directory, **kwargs)
+
+            pyos.LISTING_CACHE_ENABLED = False
+            results[f"{count} entries, no cache"] = best_time(listing, repeat)
+            results[f"{count} entries, unsorted"] = best_time(lambda: listing(sort=False), repeat)
+            pyos.LISTING_CACHE_ENABLED = True
+            listing() # Warm the cache
+            results[f"{count} entries, cached"] = best_time(listing, repeat)
+    pyos.LISTING_CACHE_ENABLED = saved_enabled
+    pyos._listing_cache.clear()
+    return results
+
+# --- Tree walking: walk_tree vs a sequential os.walk ---
+def make_tree(root, depth, width, files):
+    """
+    Creates a synthetic tree: every directory down to depth levels has width
+    subdirectories and files small files. Returns the number of files created.
+    """
+    created = 0
+    for i in range(files):
+        with open(os.path.join(root, f"file{i}.txt"), 'w') as f:
+            f.write("x" * i)
+        created += 1
+    if depth > 0:
+        for i in range(width):
+            subdir = os.path.join(root, f"dir{i}")
+            os.mkdir(subdir)
+            created += make_tree(subdir, depth - 1, width, files)
+    return created
+
+def sequential_total_size(root):
+    total = 0
+    for dirpath, dirnames, filenames in os.walk(root):
+        for filename in filenames:
+            total += os.lstat(os.path.join(dirpath, filename)).st_size
+    return total
+
+def bench_walk(pyos, depth=4, width=6, files=10, repeat=3):
+    """
+    Adds up file sizes over a deep/wide synthetic tree with a sequential os.walk,
+    walk_tree_sorted and walk_tree at several worker counts. Returns {label: best_seconds}.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        created = make_tree(tmp, depth, width, files)
+        expected = sequential_total_size(tmp)
+
+        def timed(func):
+            def checked():
+                assert func() == expected, "walkers disagree"
+            return best_time(checked, repeat)
+
+        results[f"os.walk ({created} files)"] = timed(lambda: sequential_total_size(tmp))
+        results["walk_tree_sorted (find)"] = timed(
+            lambda: sum(entry.size for entry in pyos.walk_tree_sorted(tmp) if not entry.is_dir))
+        for workers in (1, 4, 8, 16):
+            results[f"walk_tree, {workers} workers"] = timed(
+                lambda: sum(entry.size for entry in pyos.walk_tree(tmp, workers) if not entry.is_dir))
+    return results
+
+# --- gum: parallel installs and the download cache, against a local server ---
+class RangeRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """
+    Static file handler that also answers "Range: bytes=N-" requests, like real
+    package hosts do, so resumed downloads can be exercised.
+    """
+    def send_head(self):
+        range_header = self.headers.get("Range")
+        path = self.translate_path(self.path)
+        if not range_header or not os.path.isfile(path):
+            return super().send_head()
+        start = int(range_header.split("=", 1)[1].rstrip("-"))
+        f = open(path, 'rb')
+        size = os.fstat(f.fileno()).st_size
+        if start >= size:
+            f.close()
+            self.send_error(416)
+            return None
+        f.seek(start)
+        self.send_response(206)
+        self.send_header("Content-Type", "application/gzip")
+        self.send_header("Content-Range", f"bytes {start}-{size - 1}/{size}")
+        self.send_header("Content-Length", str(size - start))
+        self.end_headers()
+        return f
+
+    def log_message(self, format, *args):
+        pass # Keep the report readable
+
+@contextlib.contextmanager
+def local_package_server(directory):
+    """
+    Serves directory over HTTP on a free localhost port. Yields the base URL.
+    """
+    handler = lambda *args, **kwargs: RangeRequestHandler(*args, directory=directory, **kwargs)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def make_package_archive(path, name, payload_size=256 * 1024):
+    """
+    Writes a gum package archive (desc.txt + pkg.py + some payload) to path.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        Path(tmp, "desc.txt").write_text(f"Name: {name}\n")
+        Path(tmp, "pkg.py").write_text("def register_shell_commands(register):\n    pass\n")
+        Path(tmp, "payload.bin").write_bytes(os.urandom(payload_size))
+        with tarfile.open(path, "w:gz") as tar:
+            for member in ("desc.txt", "pkg.py", "payload.bin"):
+                tar.add(os.path.join(tmp, member), arcname=member)
+
+def bench_gum(pyos, count=8):
+    """
+    Installs count packages from a local server: first with an empty cache, then
+    again from the cache, then resuming a half-finished download.
+    Returns {label: seconds}.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        served = Path(tmp) / "served"
+        served.mkdir()
+        for i in range(count):
+            make_package_archive(served / f"pkg{i}.tar.gz", f"pkg{i}")
+        with local_package_server(str(served)) as base_url:
+            urls = [f"{base_url}/pkg{i}.tar.gz" for i in range(count)]
+            options = {"install_root": str(Path(tmp) / "installed"), "cache_dir": str(Path(tmp) / "cache")}
+
+            start = time.perf_counter()
+            assert pyos.gum.installpkgs(urls, **options) == count
+            results[f"{count} packages, cold"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            assert pyos.gum.installpkgs(urls, **options) == count
+            results[f"{count} packages, cached"] = time.perf_counter() - start
+
+            # Leave half of the first archive as a partial download, then resume it
+            data = (served / "pkg0.tar.gz").read_bytes()
+            part_key = pyos.gum.hashlib.sha256(urls[0].encode()).hexdigest()
+            (Path(options["cache_dir"]) / "partial" / f"{part_key}.part").write_bytes(data[:len(data) // 2])
+            start = time.perf_counter()
+            assert pyos.gum.installpkgs(urls[:1], refresh=True, **options) == 1
+            results["resumed download"] = time.perf_counter() - start
+    return results
+
+# --- Server mode: many sessions over the Unix socket ---
+SERVER_SESSION_COMMANDS = ("pwd", "let x=1", "echo @(x)", "lc", "cd _system", "lc", "cd ..", "vars")
+
+@contextlib.contextmanager
+def pyos_server(socket_path, timeout=10):
+    """
+    Runs 'python3 __init__.py --serve socket_path' until the block ends.
+    """
+    server = subprocess.Popen([sys.executable, str(curr_dir / "__init__.py"), "--serve", socket_path],
+                              cwd=curr_dir, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + timeout
+        while not os.path.exists(socket_path):
+            if server.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError("PyOS server did not start")
+            time.sleep(0.01)
+        yield server
+    finally:
+        server.terminate()
+        server.wait()
+
+async def read_until_ready(reader):
+    await reader.readuntil(b"\0") # End of output
+    await reader.readuntil(b"\0") # End of prompt
+
+async def load_session(socket_path, commands, latencies):
+    reader, writer = await asyncio.open_unix_connection(socket_path, limit=1 << 20)
+    await read_until_ready(reader)
+    for command in commands:
+        start = time.perf_counter()
+        writer.write(command.encode() + b"\n")
+        await read_until_ready(reader)
+        latencies.append(time.perf_counter() - start)
+    writer.write(b"exit\n")
+    await writer.drain()
+    await reader.read() # Until the server closes the session
+    writer.close()
+    await writer.wait_closed()
+
+async def load_test(socket_path, sessions, concurrency, commands):
+    """
+    Runs sessions sessions, at most concurrency at a time, each running commands.
+    Returns (elapsed_seconds, [command latencies]).
+    """
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_session():
+        async with semaphore:
+            await load_session(socket_path, commands, latencies)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_session() for _ in range(sessions)))
+    return time.perf_counter() - start, latencies
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+def bench_server(concurrencies=(1, 16, 64), sessions=128):
+    """
+    Starts a PyOS server and runs sessions client sessions against it at each level of
+    concurrency, each session running SERVER_SESSION_COMMANDS.
+    Returns ({label: sessions_per_second}, {label: latency_seconds}).
+    """
+    rates, latencies = {}, {}
+    with tempfile.TemporaryDirectory() as tmp:
+        socket_path = os.path.join(tmp, "pyos.sock")
+        with pyos_server(socket_path):
+            asyncio.run(load_test(socket_path, 4, 4, SERVER_SESSION_COMMANDS)) # Warm up
+            for concurrency in concurrencies:
+                elapsed, command_latencies = asyncio.run(load_test(socket_path, sessions, concurrency, SERVER_SESSION_COMMANDS))
+                rates[f"{concurrency} concurrent"] = sessions / elapsed
+                for percent in (50, 95, 99):
+                    latencies[f"{concurrency} concurrent, p{percent}"] = percentile(command_latencies, percent)
+    return rates, latencies
+
+# --- Reporting and baselines ---
+# Each section maps labels to seconds, except those with a rate unit here.
+RATE_UNITS = {"dispatch": "lines/s", "sessions": "sessions/s"}
+HIGHER_IS_BETTER = tuple(RATE_UNITS)
+
+def print_report(title, results, unit="ms"):
+    print(title)
+    for name, value in results.items():
+        if unit == "ms":
+            print(f"  {name:<28} {value * 1000:10.3f} ms")
+        else:
+            print(f"  {name:<28} {value:10.0f} {unit}")
+
+def save_baseline(path, results):
+    data = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "saved": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "results": results,
+    }
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+        f.write("\n")
+    print(f"Baseline saved to '{path}'.")
+
+def compare_with_baseline(path, results, threshold):
+    """
+    Prints every number next to its baseline value. Returns the number of results
+    that got worse by more than threshold percent.
+    """
+    with open(path) as f:
+        baseline = json.load(f)
+    print(f"Compared with '{path}' (saved {baseline.get('saved', '?')}, Python {baseline.get('python', '?')}):")
+    regressions = 0
+    changes = []
+    for section, section_results in results.items():
+        old_results = baseline["results"].get(section, {})
+        for name, value in section_results.items():
+            old = old_results.get(name)
+            if not old:
+                continue
+            # Positive change means slower, whatever the unit
+            change = (old / value - 1) * 100 if section in HIGHER_IS_BETTER else (value / old - 1) * 100
+            changes.append(change)
+            flag = ""
+            if change > threshold:
+                flag = "  REGRESSION"
+                regressions += 1
+            elif change < -threshold:
+                flag = "  faster"
+            print(f"  {section + ': ' + name:<44} {change:+8.1f}%{flag}")
+    if changes:
+        print(f"  median change {statistics.median(changes):+.1f}%, {regressions} regression(s) over {threshold:g}%")
+    return regressions
+
+SECTIONS = ("packages", "startup", "dispatch", "login", "listing", "walk", "gum", "sessions", "server")
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Timing reports for PyOS hot paths.")
+    parser.add_argument("--packages", type=int, default=50, help="number of dummy packages (default 50)")
+    parser.add_argument("--only", nargs="+", choices=SECTIONS, metavar="SECTION",
+                        help=f"run only these sections ({', '.join(SECTIONS)})")
+    parser.add_argument("--save", metavar="FILE", help="save the results as a JSON baseline")
+    parser.add_argument("--compare", metavar="FILE", help="compare the results with a saved baseline")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="percent slowdown counted as a regression (default 10)")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    options = parse_args(sys.argv[1:])
+    sections = options.only or SECTIONS
+    count = options.packages
+
+    pyos = load_pyos()
+    runs = {
+        "packages": (f"Package loading ({count} packages):", lambda: bench_package_loading(pyos, count)),
+        "startup": ("Startup (fresh interpreter):", bench_startup),
+        "dispatch": ("emulate() dispatch:", lambda: bench_dispatch(pyos)),
+        "login": ("Login latency:", lambda: bench_login(pyos)),
+        "listing": ("Directory listings:", lambda: bench_listing(pyos)),
+        "walk": ("Tree walking:", lambda: bench_walk(pyos)),
+        "gum": ("gum installs (local server):", lambda: bench_gum(pyos)),
+        "sessions": ("Server sessions (128 per level):", lambda: server_results()[0]),
+        "server": ("Server command latency:", lambda: server_results()[1]),
+    }
+    server_cache = []
+    def server_results():
+        # One load test gives both the sessions and the server sections
+        if not server_cache:
+            server_cache.append(bench_server())
+        return server_cache[0]
+
+    results = {}
+    for section in sections:
+        title, run = runs[section]
+        results[section] = run()
+        print_report(title, results[section], RATE_UNITS.get(section, "ms"))
+
+    if options.save:
+        save_baseline(options.save, results)
+    if options.compare:
+        if compare_with_baseline(options.compare, results, options.threshold):
+            sys.exit(1)
@@ -175,71 +175,428 @@ touch "__init__.py" || error_exit "Failed to create __init__.py for gum."
 cat << 'PYTHON_INIT' > "__init__.py"
 import requests
 import tarfile
+import zipfile
+import io
 import os
-
-def installpkg(pkglink):
-    print(f"Downloading package from: {pkglink}")
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+import contextvars
+import concurrent.futures
+from requests.adapters import HTTPAdapter
+
+# Downloads run in parallel over one shared, pooled HTTP session.
+DOWNLOAD_WORKERS = 4
+CHUNK_SIZE = 8192
+
+# Downloaded archives are kept in a content-addressed cache in _system/_gumcache:
+#   objects/<sha256>     the archives, named by the SHA-256 of their content
+#   partial/<key>.part   unfinished downloads, resumed with an HTTP Range request
+#   urls.json            maps each URL to the SHA-256 of what it last served
+# A URL may pin its content with a "#sha256=<hex>" suffix; the archive is then taken
+# from the cache whatever URL served it, and verified after downloading.
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "_system", "_gumcache")
+
+_session = None
+_session_lock = threading.Lock()
+_index_lock = threading.Lock()
+
+def get_session():
+    """
+    Returns the shared requests session, with a connection pool sized for DOWNLOAD_WORKERS.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=DOWNLOAD_WORKERS, pool_maxsize=DOWNLOAD_WORKERS)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+def split_pinned_hash(pkglink):
+    """
+    Splits "url#sha256=<hex>" into (url, hex). Returns (pkglink, None) when no hash is pinned.
+    """
+    url, _, fragment = pkglink.partition("#")
+    if fragment.startswith("sha256="):
+        return url, fragment[len("sha256="):].lower()
+    return pkglink, None
+
+def read_url_index(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, "urls.json"), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def remember_url(cache_dir, url, digest):
+    with _index_lock:
+        index = read_url_index(cache_dir)
+        index[url] = digest
+        temp_path = os.path.join(cache_dir, "urls.json.tmp")
+        with open(temp_path, 'w') as f:
+            json.dump(index, f, indent=4, sort_keys=True)
+        os.replace(temp_path, os.path.join(cache_dir, "urls.json"))
+
+def cached_archive(cache_dir, url, pinned_hash):
+    """
+    Returns the path of the cached archive for url (or for the pinned hash), or None.
+    """
+    digest = pinned_hash or read_url_index(cache_dir).get(url)
+    if digest:
+        path = os.path.join(cache_dir, "objects", digest)
+        if os.path.isfile(path):
+            return path
+    return None
+
+def partial_path(cache_dir, url):
+    """
+    Returns the path of the partial download of url, creating the cache directories.
+    """
+    os.makedirs(os.path.join(cache_dir, "objects"), exist_ok=True)
+    os.makedirs(os.path.join(cache_dir, "partial"), exist_ok=True)
+    return os.path.join(cache_dir, "partial", hashlib.sha256(url.encode()).hexdigest() + ".part")
+
+def check_download(url, part_path, hexdigest, pinned_hash=None):
+    """
+    Raises ValueError (deleting the download) if a complete download doesn't have its
+    pinned hash.
+    """
+    if pinned_hash and hexdigest != pinned_hash:
+        os.remove(part_path)
+        raise ValueError(f"SHA-256 mismatch for {url}: expected {pinned_hash}, got {hexdigest}")
+
+def finish_download(cache_dir, url, part_path, hexdigest):
+    """
+    Moves a complete download, once it has been extracted, into the cache under its
+    SHA-256 and records its URL. Returns the path of the archive in the cache.
+    """
+    object_path = os.path.join(cache_dir, "objects", hexdigest)
+    os.replace(part_path, object_path)
+    remember_url(cache_dir, url, hexdigest)
+    return object_path
+
+def install_download(url, install_root, cache_dir, part_path, hexdigest):
+    """
+    Extracts a complete download, then moves it into the cache. A download that
+    doesn't extract (an error page, a corrupt archive) is deleted instead, so it is
+    neither resumed nor cached. Returns the package name.
+    """
     try:
-        response = requests.get(pkglink, stream=True)
+        pkg_name = extract_package(part_path, install_root)
+    except BaseException:
+        remove_download(part_path)
+        raise
+    finish_download(cache_dir, url, part_path, hexdigest)
+    return pkg_name
+
+def remove_download(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def download(url, part_path, session, pinned_hash=None):
+    """
+    Downloads url to part_path, resuming a previous partial download if there is one.
+    Returns the SHA-256 of the complete download.
+    """
+    digest = hashlib.sha256()
+    have = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = {"Range": f"bytes={have}-"} if have else {}
+    response = session.get(url, stream=True, headers=headers, timeout=30)
+    if response.status_code == 416:
+        have = 0 # Our partial file is no good for the server; start over
+        response.close()
+        response = session.get(url, stream=True, timeout=30)
+    with response:
         response.raise_for_status() # Raise an HTTPError for bad responses (4xx or 5xx)
-        
-        # Determine package name from URL or make a temp file
-        # For simplicity, let's assume pkglink ends with /package.tar.gz
-        temp_file_name = pkglink.split('/')[-1]
-        if not temp_file_name.endswith('.tar.gz'):
-            temp_file_name = "temp_package.tar.gz" # Fallback if URL doesn't suggest name
-
-        with open(temp_file_name, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-        
-        print(f"Downloaded '{temp_file_name}'. Extracting...")
 
-        with tarfile.open(temp_file_name, "r:gz") as tar:
-            # Assume description.txt is at the root of the tar file
-            pkg_name = "unknown_package"
+        if response.status_code == 206 and have:
+            print(f"Resuming download of {url} at {have} bytes")
+            with open(part_path, 'rb') as f: # Hash what we already have
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+            mode = 'ab'
+        else:
+            mode = 'wb'
+        with open(part_path, mode) as f:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                f.write(chunk)
+                digest.update(chunk)
+
+    check_download(url, part_path, digest.hexdigest(), pinned_hash)
+    return digest.hexdigest()
+
+# --- Extraction ---
+# Tar archives (.tar.gz, .tar.xz, ...) are extracted in tarfile's stream mode, member
+# by member, straight from the HTTP response while it downloads: the archive is never
+# read back from disk, and memory use is bounded by CHUNK_SIZE. Zip archives need
+# random access to their central directory, so they are downloaded into the cache
+# first and then extracted member by member.
+# desc.txt is parsed and pkg.py written out as __init__.py as they go past. The package
+# is extracted into a hidden staging directory and moved into place at the end, since
+# its name is only known once desc.txt has been read.
+ZIP_MAGIC = b"PK\x03\x04"
+MAX_DESC_SIZE = 64 * 1024
+
+class TeeReader(io.RawIOBase):
+    """
+    Readable file object over an iterator of byte chunks (an HTTP response body) that
+    also writes every chunk to sink and adds it to a SHA-256 digest.
+    """
+    def __init__(self, chunks, sink):
+        self.chunks = chunks
+        self.sink = sink
+        self.digest = hashlib.sha256()
+        self.pending = b""
+
+    def readable(self):
+        return True
+
+    def next_chunk(self):
+        for chunk in self.chunks:
+            if chunk:
+                self.sink.write(chunk)
+                self.digest.update(chunk)
+                return chunk
+        return b""
+
+    def peek(self, size):
+        while len(self.pending) < size:
+            chunk = self.next_chunk()
+            if not chunk:
+                break
+            self.pending += chunk
+        return self.pending[:size]
+
+    def readinto(self, buffer):
+        if not self.pending:
+            self.pending = self.next_chunk()
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+    def drain(self):
+        """
+        Reads (and so saves and hashes) whatever is left of the stream.
+        """
+        self.pending = b""
+        while self.next_chunk():
+            pass
+
+def parse_package_name(desc_content):
+    # Parse desc_content for package name (e.g., "Name: MyPackage")
+    for line in desc_content.splitlines():
+        if line.startswith("Name:"):
+            return line.split(":", 1)[1].strip()
+    return None
+
+def check_package_name(pkg_name):
+    """
+    Raises ValueError unless pkg_name is a single, plain directory name, so that
+    install_root/<pkg_name> can't point anywhere outside install_root.
+    """
+    separators = [sep for sep in (os.sep, os.altsep) if sep]
+    if (not pkg_name or pkg_name.startswith(".") or "\0" in pkg_name or os.path.isabs(pkg_name)
+            or any(sep in pkg_name for sep in separators)):
+        raise ValueError(f"invalid package name {pkg_name!r} in desc.txt")
+
+def write_member(source, destination_path):
+    with open(destination_path, 'wb') as f:
+        shutil.copyfileobj(source, f, CHUNK_SIZE)
+
+class PackageExtractor:
+    """
+    Collects the members of a package archive into a staging directory, picking up
+    the package name from desc.txt and promoting pkg.py to __init__.py on the way.
+    """
+    def __init__(self, install_root):
+        self.install_root = install_root
+        os.makedirs(install_root, exist_ok=True)
+        self.staging = tempfile.mkdtemp(prefix=".gum-", dir=install_root)
+        self.pkg_name = None
+        self.promoted = False
+
+    def special_member(self, name, source):
+        """
+        Handles desc.txt and pkg.py at the archive root. Returns True if name was one of them.
+        source is a function returning a file object for the member's data.
+        """
+        name = os.path.normpath(name)
+        if name == "desc.txt":
+            desc_content = source().read(MAX_DESC_SIZE)
+            self.pkg_name = parse_package_name(desc_content.decode('utf-8'))
+            if self.pkg_name is not None:
+                check_package_name(self.pkg_name) # Fail before extracting the rest
+            with open(os.path.join(self.staging, "desc.txt"), 'wb') as f:
+                f.write(desc_content)
+            return True
+        if name == "pkg.py":
+            write_member(source(), os.path.join(self.staging, "__init__.py"))
+            self.promoted = True
+            return True
+        # pkg.py takes precedence over an __init__.py shipped alongside it
+        return name == "__init__.py" and self.promoted
+
+    def extract_tar(self, tar):
+        extract_options = {"filter": "data"} if hasattr(tarfile, "data_filter") else {}
+        for member in tar: # Sequential: works in stream mode
+            if member.isfile() and self.special_member(member.name, lambda: tar.extractfile(member)):
+                continue
+            tar.extract(member, self.staging, **extract_options)
+
+    def extract_zip(self, zf):
+        for info in zf.infolist():
+            if not info.is_dir() and self.special_member(info.filename, lambda: zf.open(info)):
+                continue
+            zf.extract(info, self.staging)
+
+    def finish(self):
+        """
+        Moves the staged package into install_root/<package name>, replacing any
+        previous installation. Returns the package name.
+        """
+        if self.pkg_name is None:
+            print("Warning: desc.txt not found in package. Using default name.")
+            self.pkg_name = "unknown_package"
+        if self.promoted:
+            print(f"Promoted pkg.py to __init__.py in package '{self.pkg_name}'")
+        else:
+            print("Warning: pkg.py not found in extracted package.")
+
+        check_package_name(self.pkg_name)
+        pkg_install_path = os.path.join(self.install_root, self.pkg_name)
+        if os.path.exists(pkg_install_path):
+            old_path = tempfile.mkdtemp(prefix=".gum-old-", dir=self.install_root)
+            os.replace(pkg_install_path, os.path.join(old_path, self.pkg_name))
+            os.replace(self.staging, pkg_install_path)
+            shutil.rmtree(old_path, ignore_errors=True)
+        else:
+            os.replace(self.staging, pkg_install_path)
+        print(f"Package '{self.pkg_name}' extracted to '{pkg_install_path}'")
+        return self.pkg_name
+
+    def abort(self):
+        shutil.rmtree(self.staging, ignore_errors=True)
+
+def extract_package(archive_path, install_root):
+    """
+    Extracts a package archive file (.tar.gz, .tar.xz or .zip) into
+    install_root/<package name>. Returns the package name.
+    """
+    extractor = PackageExtractor(install_root)
+    try:
+        if zipfile.is_zipfile(archive_path):
+            with zipfile.ZipFile(archive_path) as zf:
+                extractor.extract_zip(zf)
+        else:
+            with open(archive_path, 'rb') as f, tarfile.open(fileobj=f, mode="r|*") as tar:
+                extractor.extract_tar(tar)
+        return extractor.finish()
+    except BaseException:
+        extractor.abort()
+        raise
+
+def stream_install(url, install_root, cache_dir, session, pinned_hash=None):
+    """
+    Downloads url and extracts it at the same time, saving the archive as it streams
+    past; it goes into the cache once the package is installed. If the connection
+    fails, the partial download is kept to be resumed; if extracting fails, it is
+    deleted. Returns the package name.
+    """
+    part_path = partial_path(cache_dir, url)
+    extractor = None
+    try:
+        with session.get(url, stream=True, timeout=30) as response:
+            response.raise_for_status() # Raise an HTTPError for bad responses (4xx or 5xx)
+            with open(part_path, 'wb') as part_file:
+                reader = TeeReader(response.iter_content(chunk_size=CHUNK_SIZE), part_file)
+                if reader.peek(len(ZIP_MAGIC)) != ZIP_MAGIC:
+                    extractor = PackageExtractor(install_root)
+                    with tarfile.open(fileobj=reader, mode="r|*") as tar:
+                        extractor.extract_tar(tar)
+                reader.drain()
+        hexdigest = reader.digest.hexdigest()
+        check_download(url, part_path, hexdigest, pinned_hash)
+        if extractor is None:
+            return install_download(url, install_root, cache_dir, part_path, hexdigest) # Zip: needs the whole file
+        pkg_name = extractor.finish()
+    except requests.exceptions.RequestException:
+        if extractor is not None:
+            extractor.abort()
+        raise
+    except BaseException:
+        if extractor is not None:
+            extractor.abort()
+        remove_download(part_path)
+        raise
+    finish_download(cache_dir, url, part_path, hexdigest)
+    return pkg_name
+
+def install_one(pkglink, install_root, cache_dir, session, refresh=False):
+    """
+    Installs one package: from the cache if possible, downloading it otherwise.
+    Returns True on success. Errors are printed, not raised.
+    """
+    url, pinned_hash = split_pinned_hash(pkglink)
+    try:
+        archive_path = None if refresh else cached_archive(cache_dir, url, pinned_hash)
+        part_path = partial_path(cache_dir, url)
+        if archive_path:
+            print(f"Using cached package for: {url}")
             try:
-                desc_file = tar.extractfile('desc.txt')
-                if desc_file:
-                    desc_content = desc_file.read().decode('utf-8')
-                    # Parse desc_content for package name (e.g., "Name: MyPackage")
-                    for line in desc_content.splitlines():
-                        if line.startswith("Name:"):
-                            pkg_name = line.split(":", 1)[1].strip()
-                            break
-            except KeyError:
-                print("Warning: desc.txt not found in package. Using default name.")
-
-            pkg_install_path = os.path.join(os.getcwd(), pkg_name) # Install in current dir for now
-            os.makedirs(pkg_install_path, exist_ok=True)
-            tar.extractall(path=pkg_install_path)
-            print(f"Package '{pkg_name}' extracted to '{pkg_install_path}'")
-
-            # Check for pkg.py and make it __init__.py
-            pkg_py_path_in_tar = os.path.join(pkg_name, 'pkg.py') # Assumes pkg.py is inside pkg_name folder
-            pkg_py_path_after_extract = os.path.join(pkg_install_path, 'pkg.py')
-            init_py_path = os.path.join(pkg_install_path, '__init__.py')
-
-            if os.path.exists(pkg_py_path_after_extract):
-                print(f"Renaming pkg.py to __init__.py in {pkg_install_path}")
-                os.rename(pkg_py_path_after_extract, init_py_path)
-            else:
-                print("Warning: pkg.py not found in extracted package.")
-
-        os.remove(temp_file_name) # Clean up the downloaded tar.gz
+                pkg_name = extract_package(archive_path, install_root)
+            except (tarfile.TarError, zipfile.BadZipFile):
+                remove_download(archive_path) # Cached by an older gum: download it again next time
+                raise
+        elif os.path.exists(part_path):
+            # Finish the interrupted download first; it can't be streamed from the middle
+            print(f"Downloading package from: {url}")
+            hexdigest = download(url, part_path, session, pinned_hash)
+            pkg_name = install_download(url, install_root, cache_dir, part_path, hexdigest)
+        else:
+            print(f"Downloading and extracting package from: {url}")
+            pkg_name = stream_install(url, install_root, cache_dir, session, pinned_hash)
         print(f"Installation of '{pkg_name}' complete.")
-
+        return True
     except requests.exceptions.RequestException as e:
-        print(f"Error downloading package: {e}")
-    except tarfile.ReadError as e:
-        print(f"Error extracting package: {e}")
+        print(f"Error downloading package {url}: {e}")
+    except (tarfile.TarError, zipfile.BadZipFile) as e:
+        print(f"Error extracting package {url}: {e}")
+    except ValueError as e: # Bad name in desc.txt, or a hash mismatch
+        print(f"Error: Package {url} rejected: {e}")
     except Exception as e:
-        print(f"An unexpected error occurred during installation: {e}")
+        print(f"An unexpected error occurred during installation of {url}: {e}")
+    return False
+
+def installpkgs(pkglinks, refresh=False, install_root=None, cache_dir=None, session=None):
+    """
+    Installs several packages in parallel. Packages are installed in the current
+    directory unless install_root is given. refresh=True ignores cached archives.
+    Returns the number of packages installed successfully.
+    """
+    install_root = install_root or os.getcwd() # Install in current dir for now
+    cache_dir = cache_dir or DEFAULT_CACHE_DIR
+    session = session or get_session()
+    pkglinks = list(dict.fromkeys(pkglinks)) # The same URL twice would share a partial download
+    with concurrent.futures.ThreadPoolExecutor(DOWNLOAD_WORKERS, thread_name_prefix="gum") as pool:
+        # Each install runs in a copy of the caller's context, so a PyOS server session gets its output
+        futures = [pool.submit(contextvars.copy_context().run, install_one, pkglink, install_root, cache_dir, session, refresh)
+                   for pkglink in pkglinks]
+        return sum(future.result() for future in futures)
+
+def installpkg(pkglink):
+    return installpkgs([pkglink])
 
 # Example usage (for testing, you'd call installpkg from your PyOS)
 # if __name__ == "__main__":
-#     # This would be a URL to a .tar.gz package
-#     # example_package_url = "http://example.com/some_package.tar.gz" 
+#     # This would be a URL to a .tar.gz, .tar.xz or .zip package
+#     # example_package_url = "http://example.com/some_package.tar.gz"
 #     # installpkg(example_package_url)
 PYTHON_INIT
 # Note the 'PYTHON_INIT' in quotes above to prevent shell variable expansion inside the Python code
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+#    PyOS, an "operating system" running on Python.
+#    Copyright (C) 2025 Muser
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# client.py - Connects to a PyOS server (python3 __init__.py --serve).
+#   python3 client.py [--socket PATH]                 interactive session
+#   python3 client.py [--socket PATH] -c COMMAND ...  run commands, print their output
+# Commands can also be piped in on standard input; prompts are only shown on a terminal.
+# It only uses the standard library and doesn't load PyOS itself, so it starts fast.
+import sys
+import os
+import socket
+import argparse
+from pathlib import Path
+
+DEFAULT_SOCKET = os.environ.get("PYOS_SOCKET") or str(Path(__file__).resolve().parent / "_system" / "_pyos.sock")
+READY = b"\0" # Same as SERVER_READY in __init__.py
+
+class Connection:
+    """
+    A session on a PyOS server.
+    """
+    def __init__(self, socket_path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(socket_path)
+        self.buffer = b""
+
+    def read_until_ready(self, out):
+        """
+        Copies the server's output to out until it is ready for the next command.
+        Returns the prompt, or None if the server closed the session.
+        """
+        while True:
+            output, marker, rest = self.buffer.partition(READY)
+            if output:
+                out.write(output.decode(errors="replace"))
+                out.flush()
+            if marker:
+                prompt, marker, rest = rest.partition(READY)
+                if marker:
+                    self.buffer = rest
+                    return prompt.decode(errors="replace")
+                self.buffer = READY + prompt # The prompt isn't complete yet
+            else:
+                self.buffer = b""
+            data = self.sock.recv(65536)
+            if not data:
+                return None
+            self.buffer += data
+
+    def send(self, line):
+        self.sock.sendall(line.encode() + b"\n")
+
+    def close(self):
+        self.sock.close()
+
+def run_commands(connection, commands):
+    """
+    Sends commands (an iterable of lines) one at a time, printing their output
+    but not the prompts.
+    """
+    prompt = connection.read_until_ready(sys.stdout)
+    for line in commands:
+        if prompt is None:
+            break
+        connection.send(line.rstrip("\n"))
+        prompt = connection.read_until_ready(sys.stdout)
+    if prompt is not None:
+        connection.send("exit")
+
+def run_interactive(connection):
+    prompt = connection.read_until_ready(sys.stdout)
+    while prompt is not None:
+        try:
+            line = input(prompt)
+        except EOFError:
+            print()
+            line = "exit"
+        connection.send(line)
+        if line.strip().lower() == "exit":
+            break
+        prompt = connection.read_until_ready(sys.stdout)
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Connects to a PyOS server.")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help=f"server socket (default {DEFAULT_SOCKET})")
+    parser.add_argument("-c", dest="commands", nargs="+", metavar="COMMAND", help="commands to run")
+    options = parser.parse_args(argv)
+    try:
+        connection = Connection(options.socket)
+    except OSError as e:
+        print(f"Error: Could not connect to '{options.socket}': {e}", file=sys.stderr)
+        return 1
+    try:
+        if options.commands or not sys.stdin.isatty():
+            run_commands(connection, options.commands or sys.stdin)
+        else:
+            run_interactive(connection)
+    except KeyboardInterrupt:
+        print()
+    finally:
+        connection.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,475 @@
+#!/usr/bin/env python3
+#    PyOS, an "operating system" running on Python.
+#    Copyright (C) 2025 Muser
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# test_pyos.py - Regression tests for PyOS builtins.
+#   python3 -m unittest test_pyos     (from this directory)
+#   python3 -m pytest                 (from the repository root or this directory)
+import sys
+import os
+import io
+import contextlib
+import tempfile
+import tarfile
+import shutil
+import subprocess
+import time
+import types
+import unittest
+import importlib.util
+from pathlib import Path
+
+curr_dir = Path(__file__).resolve().parent
+
+def load_pyos():
+    """
+    Imports PyOS's __init__.py as the module 'pyos', like benchmark.py does.
+    """
+    if "pyos" in sys.modules:
+        return sys.modules["pyos"]
+    spec = importlib.util.spec_from_file_location("pyos", curr_dir / "__init__.py")
+    pyos = importlib.util.module_from_spec(spec)
+    sys.modules["pyos"] = pyos
+    with contextlib.redirect_stderr(io.StringIO()): # No _packages in a source checkout
+        spec.loader.exec_module(pyos)
+    return pyos
+
+pyos = load_pyos()
+
+def load_script(name, module_name):
+    """
+    Imports the script name from this directory as module_name.
+    """
+    spec = importlib.util.spec_from_file_location(module_name, curr_dir / name)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+client = load_script("client.py", "pyos_client")
+benchmark = load_script("benchmark.py", "pyos_benchmark") # For its local package server
+
+def gum_source():
+    """
+    Returns the source of gum, as build.sh writes it to _packages/gum/__init__.py.
+    """
+    lines = (curr_dir / "build.sh").read_text().splitlines(keepends=True)
+    start = lines.index("cat << 'PYTHON_INIT' > \"__init__.py\"\n") + 1
+    return "".join(lines[start:lines.index("PYTHON_INIT\n", start)])
+
+def load_gum():
+    """
+    Imports gum, as build.sh writes it, as the module 'pyos_gum'.
+    """
+    gum = types.ModuleType("pyos_gum")
+    gum.__file__ = str(curr_dir / "_packages" / "gum" / "__init__.py") # Where build.sh puts it
+    exec(compile(gum_source(), "gum", "exec"), gum.__dict__)
+    return gum
+
+def make_pyos_tree(root):
+    """
+    Makes a built PyOS tree in root from this checkout, like build.sh does, with a
+    package 'probe' whose command prints the directory it runs in, and a user
+    'tester' whose password is 'secret'.
+    """
+    root = Path(root)
+    shutil.copy(curr_dir / "__init__.py", root / "__init__.py")
+    (root / "_isbuilded").write_text("True")
+    for directory in ("_system", "_home", "_packages/probe", "_packages/gum"):
+        (root / directory).mkdir(parents=True)
+    (root / "_packages" / "gum" / "__init__.py").write_text(gum_source())
+    (root / "_system" / "_passwords").write_text(f"{{\ntester:{pyos.sha512_crypt.hash('secret')};\n}}\n")
+    (root / "_packages" / "probe" / "__init__.py").write_text(
+        "import os\n"
+        "def where(args):\n"
+        "    print(os.getcwd())\n"
+        "def register_shell_commands(register):\n"
+        "    register('where', where)\n")
+    return root
+
+def run(line):
+    """
+    Runs a command line and returns what it printed.
+    """
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        pyos.emulate(line)
+    return output.getvalue()
+
+class TokenizeTests(unittest.TestCase):
+    def test_ampersand_inside_a_word(self):
+        self.assertEqual(pyos.tokenize("echo a&b"), ["echo", "a&b"])
+        self.assertEqual(pyos.tokenize("gum install http://x/y?a=1&b=2"), ["gum", "install", "http://x/y?a=1&b=2"])
+        self.assertEqual(pyos.tokenize("echo a&b | grep a"), ["echo", "a&b", "|", "grep", "a"])
+
+    def test_final_ampersand(self):
+        self.assertEqual(pyos.tokenize("echo hi &"), ["echo", "hi", "&"])
+        self.assertEqual(pyos.tokenize("echo hi&"), ["echo", "hi", "&"])
+        self.assertEqual(pyos.tokenize("lc | grep x &"), ["lc", "|", "grep", "x", "&"])
+        self.assertEqual(pyos.tokenize('echo "hi &"'), ["echo", "hi &"])
+
+    def test_echo_keeps_ampersands(self):
+        self.assertEqual(run("echo a&b"), "a&b\n")
+        self.assertEqual(run('echo "&"'), "&\n")
+
+class TempDirTestCase(unittest.TestCase):
+    def setUp(self):
+        self.previous_cwd = os.getcwd()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.temp_dir.name)
+
+    def tearDown(self):
+        os.chdir(self.previous_cwd)
+        self.temp_dir.cleanup()
+
+    def write(self, path, content):
+        with open(path, "w") as f:
+            f.write(content)
+
+    def read(self, path):
+        with open(path) as f:
+            return f.read()
+
+class CopyTests(TempDirTestCase):
+    def test_copy_onto_itself_keeps_the_file(self):
+        self.write("a.txt", "hello world")
+        output = run("cp a.txt a.txt")
+        self.assertIn("same file", output)
+        self.assertEqual(self.read("a.txt"), "hello world")
+
+    def test_copy_into_its_own_directory_keeps_the_file(self):
+        self.write("a.txt", "hello world")
+        output = run("cp a.txt .")
+        self.assertIn("same file", output)
+        self.assertEqual(self.read("a.txt"), "hello world")
+
+    def test_copy(self):
+        self.write("a.txt", "hello world")
+        run("cp a.txt b.txt")
+        self.assertEqual(self.read("b.txt"), "hello world")
+
+class FindTests(TempDirTestCase):
+    def test_output_is_sorted_depth_first(self):
+        for directory in ("b/y", "b/x", "a", "c"):
+            os.makedirs(directory)
+        for path in ("b/y/2.txt", "b/y/1.txt", "b/x/3.txt", "a/4.txt", "5.txt"):
+            self.write(path, path)
+        expected = ["./5.txt", "./a", "./a/4.txt", "./b", "./b/x", "./b/x/3.txt",
+                    "./b/y", "./b/y/1.txt", "./b/y/2.txt", "./c"]
+        self.assertEqual(run("find").splitlines(), expected)
+        self.assertEqual(run("find b --type f").splitlines(), ["b/x/3.txt", "b/y/1.txt", "b/y/2.txt"])
+
+class ListingCacheTests(TempDirTestCase):
+    def test_copy_over_a_file_updates_its_kind(self):
+        self.write("tool", "#!/bin/sh")
+        os.chmod("tool", 0o755)
+        self.write("data", "")
+        self.assertIn(("data", pyos.ENTRY_FILE), pyos.get_directory_listing("."))
+        run("cp tool data")
+        self.assertIn(("data", pyos.ENTRY_EXECUTABLE), pyos.get_directory_listing("."))
+
+    def test_new_file_is_listed(self):
+        self.assertEqual(pyos.get_directory_listing("."), [])
+        run("mkfile a.txt")
+        self.assertEqual(pyos.get_directory_listing("."), [("a.txt", pyos.ENTRY_FILE)])
+
+class MkfileTests(TempDirTestCase):
+    def test_content_as_second_argument(self):
+        run("mkfile a.txt hello")
+        self.assertEqual(self.read("a.txt"), "hello")
+        self.assertFalse(os.path.exists("hello"))
+
+    def test_quoted_content_as_second_argument(self):
+        run('mkfile a.txt "hello world.txt"')
+        self.assertEqual(self.read("a.txt"), "hello world.txt")
+
+    def test_several_paths(self):
+        run("mkfile --content x a.txt b.txt")
+        self.assertEqual(self.read("a.txt"), "x")
+        self.assertEqual(self.read("b.txt"), "x")
+
+    def test_content_that_looks_like_a_path(self):
+        run("mkfile f.txt 1.0")
+        self.assertEqual(self.read("f.txt"), "1.0")
+        self.assertFalse(os.path.exists("1.0"))
+        run("mkfile greeting.txt hi.")
+        self.assertEqual(self.read("greeting.txt"), "hi.")
+
+    def test_two_paths(self):
+        run("mkfile --content '' a.txt b.txt")
+        self.assertEqual(self.read("a.txt"), "")
+        self.assertEqual(self.read("b.txt"), "")
+
+    def test_three_paths(self):
+        run("mkfile a.txt b.txt c.txt")
+        self.assertEqual([self.read(name) for name in ("a.txt", "b.txt", "c.txt")], ["", "", ""])
+
+class PackageIndexTests(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.packages_dir = os.path.abspath("_packages")
+        self.index_file = os.path.abspath("_packagecommands")
+        os.makedirs("_packages/indexed/tools")
+        self.write("_packages/indexed/__init__.py", "from .tools.greet import register_shell_commands\n")
+        self.write("_packages/indexed/tools/__init__.py", "")
+        self.write_commands("hello")
+
+    def tearDown(self):
+        for name in ("hello", "goodbye"):
+            pyos._package_commands.pop(name, None)
+            pyos._command_names.discard(name)
+        for name in [name for name in sys.modules if name == "indexed" or name.startswith("indexed.")]:
+            del sys.modules[name]
+        sys.path.remove(self.packages_dir)
+        super().tearDown()
+
+    def write_commands(self, *names):
+        self.write("_packages/indexed/tools/greet.py", "def register_shell_commands(register):\n" +
+                   "".join(f"    register({name!r}, lambda args: print({name!r}))\n" for name in names))
+
+    def indexed_commands(self):
+        return pyos.read_package_index(self.index_file)["indexed"]["commands"]
+
+    def test_change_to_a_submodule_is_noticed(self):
+        signature = pyos.scan_packages(self.packages_dir)["indexed"]
+        self.write_commands("hello", "goodbye")
+        self.assertNotEqual(pyos.scan_packages(self.packages_dir)["indexed"], signature)
+        pyos.load_package_commands(self.packages_dir, index_file=self.index_file)
+        self.assertEqual(self.indexed_commands(), ["hello", "goodbye"])
+
+    def test_stale_stub_corrects_the_index(self):
+        packages = pyos.scan_packages(self.packages_dir)
+        pyos.write_package_index(self.index_file, {"indexed": {"signature": packages["indexed"], "commands": ["hello", "goodbye"]}})
+        pyos.load_package_commands(self.packages_dir, index_file=self.index_file)
+        self.assertIsInstance(pyos._package_commands["goodbye"], pyos.LazyPackageCommand)
+        with contextlib.redirect_stderr(io.StringIO()) as errors:
+            run("goodbye")
+        self.assertIn("no longer provides command 'goodbye'", errors.getvalue())
+        self.assertEqual(self.indexed_commands(), ["hello"])
+        self.assertEqual(run("hello"), "hello\n")
+
+class HistoryTests(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.history = pyos.CommandHistory(Path(self.temp_dir.name) / "history")
+        self.previous_history, pyos._history = pyos._history, self.history
+
+    def tearDown(self):
+        if self.history.file is not None:
+            self.history.file.close()
+        pyos._history = self.previous_history
+        super().tearDown()
+
+    def test_login_is_not_recorded(self):
+        pyos.read_console_line("pwd")
+        pyos.read_console_line("login gg secret")
+        pyos.read_console_line("time login gg secret")
+        self.assertNotIn("secret", self.read(self.history.path))
+        self.assertEqual([line for number, line in self.history.recent(10)], ["pwd"])
+
+class SearchIndexTests(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.previous_index_path = pyos.SEARCH_INDEX_PATH
+        pyos.SEARCH_INDEX_PATH = Path(self.temp_dir.name) / "index.sqlite"
+        os.mkdir("docs")
+        self.root = os.path.realpath("docs")
+
+    def tearDown(self):
+        pyos.SEARCH_INDEX_PATH = self.previous_index_path
+        super().tearDown()
+
+    def candidates(self, term):
+        return [os.path.basename(path) for path in pyos.search_candidates(term, self.root)]
+
+    def test_incremental_updates(self):
+        self.write("docs/a.txt", "the quick brown fox")
+        self.write("docs/b.txt", "lazy dogs")
+        self.assertEqual(pyos.update_search_index(self.root)["added"], 2)
+        self.assertEqual(self.candidates("QUICK"), ["a.txt"])
+
+        os.remove("docs/a.txt")
+        self.write("docs/b.txt", "quick dogs, longer now")
+        self.write("docs/c.txt", "quicksand")
+        counts = pyos.update_search_index(self.root)
+        self.assertEqual((counts["added"], counts["updated"], counts["removed"]), (1, 1, 1))
+        self.assertEqual(self.candidates("quick"), ["b.txt", "c.txt"])
+        self.assertEqual(self.candidates("lazy"), [])
+        self.assertEqual(self.candidates("brown"), [])
+
+    def test_ids_of_removed_files_are_reused(self):
+        for name in ("a", "b", "c"):
+            self.write(f"docs/{name}.txt", name * 5)
+        pyos.update_search_index(self.root)
+        os.remove("docs/a.txt")
+        pyos.update_search_index(self.root)
+        self.write("docs/d.txt", "ddddd")
+        pyos.update_search_index(self.root)
+        with contextlib.closing(pyos.open_search_index()) as db:
+            self.assertEqual(db.execute("SELECT MAX(id) FROM files").fetchone()[0], 3)
+        self.assertEqual(self.candidates("ddd"), ["d.txt"])
+
+class ArchiveTests(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.lines = [f"line {i}\n" for i in range(20000)]
+        self.write("big.txt", "".join(self.lines))
+        with tarfile.open("a.tar.gz", "w:gz") as tar:
+            tar.add("big.txt")
+        os.mkdir("mnt")
+        os.symlink("mnt", "link")
+        pyos.mount_archive("a.tar.gz", "mnt")
+
+    def tearDown(self):
+        pyos.unmount("mnt")
+        super().tearDown()
+
+    def test_tail_of_compressed_member(self):
+        self.assertEqual("".join(pyos.iter_read_file("mnt/big.txt", tail=3)), "".join(self.lines[-3:]))
+        self.assertEqual("".join(pyos.iter_read_file("mnt/big.txt", tail=0)), "")
+
+    def test_path_through_symlink(self):
+        self.assertEqual(pyos.find_mount("link/big.txt")[1], "big.txt")
+        self.assertEqual("".join(pyos.iter_read_file("link/big.txt", head=1)), self.lines[0])
+
+class GumTests(TempDirTestCase):
+    gum = load_gum()
+
+    def setUp(self):
+        super().setUp()
+        os.mkdir("served")
+        self.server = benchmark.local_package_server("served")
+        self.url = f"{self.server.__enter__()}/pkg.tar.gz"
+        self.cache_dir = os.path.abspath("cache")
+        self.part_path = self.gum.partial_path(self.cache_dir, self.url)
+
+    def tearDown(self):
+        self.server.__exit__(None, None, None)
+        super().tearDown()
+
+    def install(self, refresh=False):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return self.gum.installpkgs([self.url], refresh=refresh, install_root=os.path.abspath("installed"),
+                                        cache_dir=self.cache_dir)
+
+    def assertNothingCached(self):
+        self.assertFalse(os.path.exists(self.part_path))
+        self.assertEqual(os.listdir(os.path.join(self.cache_dir, "objects")), [])
+        self.assertNotIn(self.url, self.gum.read_url_index(self.cache_dir))
+
+    def test_install_is_cached(self):
+        benchmark.make_package_archive("served/pkg.tar.gz", "pkg", payload_size=16)
+        self.assertEqual(self.install(), 1)
+        self.assertFalse(os.path.exists(self.part_path))
+        self.assertIn(self.url, self.gum.read_url_index(self.cache_dir))
+        os.remove("served/pkg.tar.gz")
+        self.assertEqual(self.install(), 1)
+
+    def test_error_page_is_neither_resumed_nor_cached(self):
+        self.write("served/pkg.tar.gz", "<html><body>Rate limit exceeded</body></html>\n")
+        self.assertEqual(self.install(), 0)
+        self.assertNothingCached()
+        benchmark.make_package_archive("served/pkg.tar.gz", "pkg", payload_size=16)
+        self.assertEqual(self.install(), 1)
+
+    def test_resumed_download(self):
+        benchmark.make_package_archive("served/pkg.tar.gz", "pkg")
+        data = Path("served/pkg.tar.gz").read_bytes()
+        Path(self.part_path).write_bytes(data[:len(data) // 2])
+        self.assertEqual(self.install(), 1)
+        self.assertFalse(os.path.exists(self.part_path))
+        self.assertIn(self.url, self.gum.read_url_index(self.cache_dir))
+
+    def test_bad_resumed_download_is_deleted(self):
+        self.write("served/pkg.tar.gz", "<html><body>Not Found</body></html>\n")
+        Path(self.part_path).write_bytes(b"<html>")
+        self.assertEqual(self.install(), 0)
+        self.assertNothingCached()
+
+class ServerTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.TemporaryDirectory()
+        cls.root = make_pyos_tree(cls.temp_dir.name)
+        cls.socket_path = str(cls.root / "_system" / "test.sock")
+        cls.server = subprocess.Popen([sys.executable, str(cls.root / "__init__.py"), "--serve", cls.socket_path],
+                                      cwd=cls.root, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + 10
+        while not os.path.exists(cls.socket_path):
+            if cls.server.poll() is not None or time.monotonic() > deadline:
+                cls.tearDownClass()
+                raise RuntimeError("PyOS server did not start")
+            time.sleep(0.01)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.terminate()
+        cls.server.wait()
+        cls.temp_dir.cleanup()
+
+    def session(self, *commands):
+        """
+        Runs commands in a new session. Returns the output of each one.
+        """
+        connection = client.Connection(self.socket_path)
+        outputs = []
+        try:
+            self.assertIsNotNone(connection.read_until_ready(io.StringIO()))
+            for command in commands:
+                connection.send(command)
+                output = io.StringIO()
+                self.assertIsNotNone(connection.read_until_ready(output), f"session ended at {command!r}")
+                outputs.append(output.getvalue())
+            connection.send("exit")
+        finally:
+            connection.close()
+        return outputs
+
+    def test_output_and_prompt(self):
+        self.assertEqual(self.session("echo hello", "let x=2", "echo @(x)"), ["hello\n", "Variable 'x' set to '2'\n", "2\n"])
+
+    def test_files_go_to_the_session_directory(self):
+        self.session("cd _home", "stats --json stats.json", "profile --output run.prof pwd")
+        self.assertTrue((self.root / "_home" / "stats.json").exists())
+        self.assertTrue((self.root / "_home" / "run.prof").exists())
+
+    def test_gum_installs_in_the_session_directory(self):
+        with tempfile.TemporaryDirectory() as served, benchmark.local_package_server(served) as base_url:
+            benchmark.make_package_archive(Path(served, "greet.tar.gz"), "greet", payload_size=16)
+            output = self.session("cd _home", f"gum install {base_url}/greet.tar.gz")[1]
+        self.assertIn("Installation of 'greet' complete.", output)
+        self.assertTrue((self.root / "_home" / "greet" / "__init__.py").exists())
+        self.assertFalse((self.root / "greet").exists())
+
+    def test_package_commands_see_the_process_directory(self):
+        # Documented: only sandboxed package commands get the session's directory
+        self.assertEqual(self.session("cd _home", "where")[1], f"{self.root}\n")
+
+    def test_process_job_runs_in_the_session_directory(self):
+        output = self.session("cd _home", "bg --process where", "wait")[2]
+        self.assertIn(f"{self.root / '_home'}\n", output)
+        self.assertIn("done", output)
+
+    def test_login(self):
+        outputs = self.session("login tester wrong", "login tester secret")
+        self.assertIn("Login failed", outputs[0])
+        self.assertIn("Login successful for user: tester", outputs[1])
+
+    def test_nul_in_output_keeps_the_session_in_sync(self):
+        (self.root / "binary.dat").write_bytes(b"a\0b\0\0c\n")
+        self.assertEqual(self.session("readfile binary.dat", "echo after"), ["a\ufffdb\ufffd\ufffdc\n", "after\n"])
+
+if __name__ == "__main__":
+    unittest.main()